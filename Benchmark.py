@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from JackTokenizer import JackTokenizer
+from CompilationEngine import CompilationEngine, STANDARD_OPTIMIZATIONS
+from VMWriter import VMWriter
+from CorpusGenerator import CorpusGenerator, SHAPES
+PHASES = ("tokenize", "compile", "write")
+DEFAULT_SIZE = 200
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.15  # Allowed loss of throughput before a regression
+
+
+class Benchmark:
+    """
+    Times the phases of the compiler separately on a set of Jack sources:
+    tokenization (JackTokenizer), parsing, optimization and code generation
+    (CompilationEngine.compile_class) and output (VMWriter). Every phase is
+    run several times and the fastest run is kept, which is the least
+    disturbed by other activity on the machine.
+    """
+
+    def __init__(self, optimizations=(), repeat=DEFAULT_REPEAT):
+        """
+        :param optimizations: Names of the optimizations to compile with
+        :param repeat: How many times to run every phase
+        """
+        self.__optimizations = optimizations
+        self.__repeat = repeat
+
+    def measure(self, sources):
+        """
+        :param sources: A dictionary from class names to Jack source texts
+        :return: A dictionary with the numbers of files, lines and tokens,
+        and the best time in seconds of each phase
+        """
+        result = {"files": len(sources), "lines": 0, "tokens": 0}
+        for source in sources.values():
+            result["lines"] += source.count("\n")
+            result["tokens"] += JackTokenizer("<benchmark>",
+                                              source).count_tokens()
+        best = dict.fromkeys(PHASES, float("inf"))
+        with tempfile.TemporaryDirectory() as directory:
+            for i in range(self.__repeat):
+                times = self.__run(sources, directory)
+                for phase in PHASES:
+                    best[phase] = min(best[phase], times[phase])
+        result.update(best)
+        return result
+
+    def __run(self, sources, directory):
+        """
+        Compiles every source once, timing each phase.
+        :param sources: A dictionary from class names to Jack source texts
+        :param directory: A directory to write the outputs to
+        :return: A dictionary of the total time in seconds of each phase
+        """
+        times = dict.fromkeys(PHASES, 0.0)
+        for name, source in sources.items():
+            start = time.perf_counter()
+            engine = CompilationEngine(name, None, source,
+                                       self.__optimizations)
+            engine.compile_class()
+            compiled = time.perf_counter()
+            tokenized = start + engine.get_timings()["tokenize"]
+            writer = VMWriter(os.path.join(directory, name + ".vm"))
+            writer.write_commands(engine.get_commands())
+            writer.close()
+            written = time.perf_counter()
+            times["tokenize"] += tokenized - start
+            times["compile"] += compiled - tokenized
+            times["write"] += written - compiled
+        return times
+
+
+def throughput(result):
+    """
+    :param result: A result of Benchmark.measure
+    :return: A pair of the tokens and lines compiled per second, over all
+    the phases
+    """
+    total = sum(result[phase] for phase in PHASES)
+    return result["tokens"] / total, result["lines"] / total
+
+
+def format_report(results):
+    """
+    :param results: A dictionary from shape names to Benchmark results
+    :return: The results as a table
+    """
+    rows = ["%-20s %7s %9s %10s %10s %10s %12s %11s" %
+            ("shape", "lines", "tokens", "tokenize", "compile", "write",
+             "tokens/s", "lines/s")]
+    for shape, result in results.items():
+        tokens_per_second, lines_per_second = throughput(result)
+        rows.append("%-20s %7d %9d %8.1fms %8.1fms %8.1fms %12.0f %11.0f" %
+                    (shape, result["lines"], result["tokens"],
+                     result["tokenize"] * 1000, result["compile"] * 1000,
+                     result["write"] * 1000, tokens_per_second,
+                     lines_per_second))
+    return "\n".join(rows)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares the throughput of every phase to a stored baseline. Throughput
+    is per token, so baselines stay comparable across corpus sizes.
+    :param results: A dictionary from shape names to Benchmark results
+    :param baseline: A dictionary of results stored by a previous run
+    :param tolerance: The allowed relative loss of throughput
+    :return: A list of descriptions of the regressions found
+    """
+    regressions = []
+    for shape, result in results.items():
+        if shape not in baseline:
+            continue
+        for phase in PHASES:
+            old = baseline[shape]["tokens"] / baseline[shape][phase]
+            new = result["tokens"] / result[phase]
+            if new < old * (1 - tolerance):
+                regressions.append("%s %s: %.0f tokens/s, baseline %.0f "
+                                   "(%+.1f%%)" % (shape, phase, new, old,
+                                                  (new / old - 1) * 100))
+    return regressions
+
+
+def parse_args(argv):
+    """
+    :param argv: The command line arguments, without the program name
+    :return: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog="Benchmark",
+                                     description="Measures the speed of "
+                                                 "the Jack compiler on "
+                                                 "generated programs.")
+    parser.add_argument("--shape", action="append", choices=SHAPES,
+                        help="program shape to measure, may be repeated "
+                             "(default: all)")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE,
+                        help="size of every program, roughly in "
+                             "subroutines (default: %d)" % DEFAULT_SIZE)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="runs of every phase, the fastest is kept "
+                             "(default: %d)" % DEFAULT_REPEAT)
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the program generator")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="compile with the standard optimizations")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="compare with the results stored in FILE")
+    parser.add_argument("--save-baseline", metavar="FILE",
+                        help="store the results in FILE")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative loss of throughput before a "
+                             "regression is reported (default: %.2f)" %
+                             DEFAULT_TOLERANCE)
+    parser.add_argument("--write-corpus", metavar="DIR",
+                        help="also write the generated programs to DIR")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Runs the benchmarks from the command line.
+    :param argv: The command line arguments, without the program name
+    :return: The exit status, 1 if a regression was found
+    """
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    benchmark = Benchmark(STANDARD_OPTIMIZATIONS if args.optimize else (),
+                          args.repeat)
+    results = {}
+    for shape in args.shape or SHAPES:
+        sources = CorpusGenerator(args.seed).generate(shape, args.size)
+        if args.write_corpus:
+            directory = os.path.join(args.write_corpus, shape)
+            os.makedirs(directory, exist_ok=True)
+            for name, source in sources.items():
+                with open(os.path.join(directory, name + ".jack"), "w") as file:
+                    file.write(source)
+        results[shape] = benchmark.measure(sources)
+    print(format_report(results))
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print("Regression: " + regression)
+        status = 1 if regressions else 0
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
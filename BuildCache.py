@@ -0,0 +1,151 @@
+import os
+import json
+import hashlib
+MANIFEST_NAME = "manifest.json"
+
+
+class BuildCache:
+    """
+    An on-disk manifest of compiled files. Each entry maps a source file to
+    a key, a hash of the source's content together with the compiler
+    version and options, and to the size and modification time of the
+    output written for it. A source whose key is unchanged and whose
+    output is still on disk untouched does not need to be compiled again.
+    """
+
+    def __init__(self, directory, salt):
+        """
+        :param directory: The directory holding the cache's manifest
+        :param salt: A string identifying the compiler version and
+        options, mixed into every key
+        """
+        self.__directory = directory
+        self.__manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.__salt = salt.encode()
+        self.__keys = {}
+        self.__hits = 0
+        self.__misses = 0
+        self.__entries = {}
+        self.__stamp = None
+        self.__load()
+
+    def __manifest_stamp(self):
+        """
+        :return: The size and modification time of the manifest, or None
+        if there is none
+        """
+        try:
+            stat = os.stat(self.__manifest_path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def __load(self):
+        """
+        Reads the manifest from disk.
+        """
+        self.__stamp = self.__manifest_stamp()
+        try:
+            with open(self.__manifest_path, "r") as file:
+                self.__entries = json.load(file)
+        except (OSError, ValueError):
+            self.__entries = {}
+        if not isinstance(self.__entries, dict):
+            self.__entries = {}
+
+    def start_build(self):
+        """
+        Prepares a cache that is kept between builds for the next one:
+        the sources may have changed since, so their keys are computed
+        again, and the manifest is read again if another process wrote it.
+        The hit and miss counters start over.
+        """
+        self.__keys = {}
+        self.__hits = 0
+        self.__misses = 0
+        if self.__manifest_stamp() != self.__stamp:
+            self.__load()
+
+    def __key(self, source, context):
+        """
+        :param source: Path of a source file
+        :param context: A string identifying what else the source's output
+        depends on
+        :return: The cache key of the source's current content
+        """
+        if (source, context) not in self.__keys:
+            digest = hashlib.sha256(self.__salt)
+            digest.update(context.encode())
+            with open(source, "rb") as file:
+                digest.update(file.read())
+            self.__keys[source, context] = digest.hexdigest()
+        return self.__keys[source, context]
+
+    def is_fresh(self, source, output, context=""):
+        """
+        Checks whether the output compiled from the source is still valid,
+        and counts the check as a hit or a miss.
+        :param source: Path of a source file
+        :param output: Path of the file compiled from it
+        :param context: A string identifying what else the output depends
+        on besides the source and the salt, e.g. the signatures it uses
+        :return: True if the source does not need to be compiled again
+        """
+        entry = self.__entries.get(os.path.abspath(source))
+        fresh = False
+        if entry is not None and \
+                entry.get("key") == self.__key(source, context):
+            try:
+                stat = os.stat(output)
+                fresh = [stat.st_size, stat.st_mtime_ns] == entry.get("output")
+            except OSError:
+                fresh = False
+        if fresh:
+            self.__hits += 1
+        else:
+            self.__misses += 1
+        return fresh
+
+    def record(self, source, output, context=""):
+        """
+        Records that the output was just compiled from the source.
+        :param source: Path of a source file
+        :param output: Path of the file compiled from it
+        :param context: The context the output was compiled in, as given
+        to is_fresh
+        """
+        stat = os.stat(output)
+        self.__entries[os.path.abspath(source)] = {
+            "key": self.__key(source, context),
+            "output": [stat.st_size, stat.st_mtime_ns]}
+
+    def forget(self, source):
+        """
+        Drops the entry of a source, e.g. after it failed to compile.
+        :param source: Path of a source file
+        """
+        self.__entries.pop(os.path.abspath(source), None)
+
+    def clear(self):
+        """
+        Drops all the entries, forcing every source to be compiled again.
+        """
+        self.__entries = {}
+
+    def save(self):
+        """
+        Writes the manifest back to disk, atomically.
+        """
+        os.makedirs(self.__directory, exist_ok=True)
+        temp_path = self.__manifest_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.__entries, file, indent=0, sort_keys=True)
+        os.replace(temp_path, self.__manifest_path)
+        self.__stamp = self.__manifest_stamp()
+
+    def report(self):
+        """
+        :return: A one line summary of the cache hits and misses
+        """
+        return "Build cache: %d hits, %d misses" % (self.__hits,
+                                                    self.__misses)
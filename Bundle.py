@@ -0,0 +1,97 @@
+import zipfile
+from JackTokenizer import TOKEN_REGEX
+SYMBOL_GROUP = 5
+FRAME_PREFIX = "//@ "  # A VM comment, so a bundle is still valid VM code
+ARCHIVE_SUFFIX = ".zip"
+STREAM_NAME = "-"
+
+
+def split_classes(text):
+    """
+    Splits a bundle, the concatenated sources of any number of Jack
+    classes, into the sources of the classes. A class ends with the brace
+    that closes its body; comments before a class belong to it.
+    :param text: The bundle's text
+    :return: A list of pairs of the line of the bundle where each class's
+    text starts and the text
+    """
+    classes = []
+    start = 0
+    line = 1
+    depth = 0
+    for match in TOKEN_REGEX.finditer(text):
+        if match.lastindex != SYMBOL_GROUP:
+            continue
+        symbol = match.group(SYMBOL_GROUP)
+        if symbol == "{":
+            depth += 1
+        elif symbol == "}":
+            depth -= 1
+            if depth == 0:
+                classes.append((line, text[start:match.end()]))
+                line += text.count("\n", start, match.end())
+                start = match.end()
+    if text[start:].strip():
+        classes.append((line, text[start:]))
+    return classes
+
+
+def read_bundle(stream):
+    """
+    Reads the framed output written by a BundleWriter to a stream.
+    :param stream: A text stream
+    :return: A generator of pairs of file names and contents
+    """
+    while True:
+        header = stream.readline()
+        if not header:
+            return
+        name, size = header[len(FRAME_PREFIX):].rsplit(" ", 1)
+        yield name, stream.read(int(size))
+
+
+class BundleWriter:
+    """
+    Writes the outputs of many classes to a single destination: to a
+    stream or a file, each output framed by a header line with its file
+    name and length in characters, or to a zip archive, when the
+    destination's name ends with ARCHIVE_SUFFIX, with one member per file.
+    """
+
+    def __init__(self, output):
+        """
+        :param output: A path, or a text stream to write the frames to
+        """
+        self.__archive = None
+        self.__file = None
+        if not isinstance(output, str):
+            self.__stream = output
+        elif output.endswith(ARCHIVE_SUFFIX):
+            self.__archive = zipfile.ZipFile(output, "w",
+                                             zipfile.ZIP_DEFLATED)
+        else:
+            self.__file = open(output, "w")
+            self.__stream = self.__file
+
+    def write(self, name, text):
+        """
+        Writes the output of a class.
+        :param name: The output's file name, e.g. Main.vm
+        :param text: The output's content
+        """
+        if self.__archive is not None:
+            self.__archive.writestr(name, text)
+        else:
+            self.__stream.write("%s%s %d\n" % (FRAME_PREFIX, name, len(text)))
+            self.__stream.write(text)
+
+    def close(self):
+        """
+        Finishes the output, closing it unless it is a given stream.
+        """
+        if self.__archive is not None:
+            self.__archive.close()
+        elif self.__file is not None:
+            self.__file.close()
+        else:
+            self.__stream.flush()
@@ -0,0 +1,691 @@
+from SyntaxTree import *
+from ConstantFolder import constant_value, MAX_CONSTANT
+# The longest inline command sequence that replaces a Math.multiply call.
+# The call itself executes a few hundred VM commands.
+DEFAULT_STRENGTH_THRESHOLD = 24
+OPERATOR_COMMANDS = {"+": "add", "-": "sub", "&": "and", "|": "or",
+                     "<": "lt", ">": "gt", "=": "eq"}
+OPERATOR_CALLS = {"*": "Math.multiply", "/": "Math.divide"}
+UNARY_COMMANDS = {"-": "neg", "~": "not"}
+COMPARISON_OPERATORS = ("<", ">", "=")  # Always give true (-1) or false (0)
+LOGICAL_OPERATORS = ("&", "|")  # Give true or false for true or false
+TAIL_CALL_LABEL = "TAIL_CALL"
+
+
+class CodeGenerator:
+    """
+    Lowers the syntax tree of a class (see SyntaxTree) to VM commands,
+    written through a VMWriter.
+    """
+
+    def __init__(self, vmwriter, reducing=False,
+                 strength_threshold=DEFAULT_STRENGTH_THRESHOLD,
+                 tracking_arrays=False, laying_out=False,
+                 eliminating_tail_calls=False):
+        """
+        :param vmwriter: The VMWriter to write the commands to
+        :param reducing: Whether to replace multiplications and divisions
+        by constants with cheaper inline sequences
+        :param strength_threshold: The longest command sequence that may
+        replace a multiplication by a constant
+        :param tracking_arrays: Whether to reuse the array element address
+        held by pointer 1, and to store array elements without temp 0
+        :param laying_out: Whether to test loop conditions at the bottom
+        and to branch on conditions without negating them
+        :param eliminating_tail_calls: Whether to turn the self-recursive
+        calls of return statements into jumps
+        """
+        self.__vmwriter = vmwriter
+        self.__reducing = reducing
+        self.__strength_threshold = strength_threshold
+        self.__reduced = {"multiply": 0, "divide": 0}
+        self.__tracking_arrays = tracking_arrays
+        self.__arrays = {"reused": 0, "direct-stores": 0}
+        self.__laying_out = laying_out
+        self.__eliminating_tail_calls = eliminating_tail_calls
+        self.__tail_calls = 0
+        self.__subroutine_dec = None
+        # The key of the array element pointer 1 holds, and the variables
+        # the key depends on, or None if unknown
+        self.__that = None
+        self.__while_count = 0
+        self.__if_count = 0
+        self.__pool_count = 0
+        self.__field_count = 0
+        self.__statements = {LetStatement: self.__let,
+                             IfStatement: self.__if,
+                             WhileStatement: self.__while,
+                             DoStatement: self.__do,
+                             ReturnStatement: self.__return}
+        self.__expressions = {IntConstant: self.__int_constant,
+                              StringConstant: self.__string_constant,
+                              KeywordConstant: self.__keyword_constant,
+                              Variable: self.__variable,
+                              ArrayElement: self.__array_element,
+                              UnaryOp: self.__unary_op,
+                              BinaryOp: self.__binary_op,
+                              Call: self.__call}
+
+    def get_stats(self):
+        """
+        :return: The numbers of multiplications and divisions that were
+        reduced, if strength reduction is enabled
+        """
+        return dict(self.__reduced) if self.__reducing else {}
+
+    def get_array_stats(self):
+        """
+        :return: The numbers of array element addresses that were reused
+        and of array stores that did not go through temp 0, if array
+        tracking is enabled
+        """
+        return dict(self.__arrays) if self.__tracking_arrays else {}
+
+    def get_tail_call_stats(self):
+        """
+        :return: The number of tail calls turned into jumps, if tail call
+        elimination is enabled
+        """
+        if not self.__eliminating_tail_calls:
+            return {}
+        return {"eliminated": self.__tail_calls}
+
+    def generate(self, class_dec):
+        """
+        Writes the VM commands of a class.
+        :param class_dec: The ClassDec node of the class
+        """
+        self.__field_count = class_dec.field_count
+        for subroutine in class_dec.subroutines:
+            self.__subroutine(subroutine)
+
+    def __subroutine(self, subroutine):
+        """
+        Writes a subroutine: its declaration, the prologue of constructors
+        and methods, and its body.
+        :param subroutine: A SubroutineDec node
+        """
+        self.__vmwriter.write_function(subroutine.name,
+                                       len(subroutine.locals))
+        self.__that = None
+        self.__subroutine_dec = subroutine
+        if subroutine.kind == "constructor":
+            self.__vmwriter.write_push("constant", self.__field_count)
+            self.__write_call("Memory.alloc", 1)
+            self.__vmwriter.write_pop("pointer", 0)
+        elif subroutine.kind == "method":
+            self.__vmwriter.write_push("argument", 0)
+            self.__vmwriter.write_pop("pointer", 0)
+        if self.__eliminating_tail_calls and \
+                self.__has_tail_call(subroutine.body):
+            self.__write_label(TAIL_CALL_LABEL)
+        self.statements(subroutine.body)
+
+    def statements(self, statements):
+        """
+        Writes a list of statements.
+        :param statements: A list of statement nodes
+        """
+        for statement in statements:
+            self.__statements[type(statement)](statement)
+
+    def expression(self, node):
+        """
+        Writes the commands that push the value of an expression.
+        :param node: An expression node
+        """
+        self.__expressions[type(node)](node)
+
+    def __let(self, statement):
+        """
+        Writes a let statement.
+        """
+        target = statement.target
+        if isinstance(target, Variable):
+            self.expression(statement.value)
+            self.__vmwriter.write_pop(target.segment, target.index)
+            if self.__that is not None and \
+                    (target.segment, target.index) in self.__that[1]:
+                self.__that = None
+            return
+        element = self.__element_key(target) if self.__tracking_arrays \
+            else None
+        if self.__tracking_arrays and \
+                self.__keeps_pointer(statement.value, element):
+            if element is None or self.__that is None or \
+                    element[0] != self.__that[0]:
+                self.__element_address(target)
+                self.__vmwriter.write_pop("pointer", 1)
+                self.__that = element
+            self.expression(statement.value)
+            self.__vmwriter.write_pop("that", 0)
+            self.__arrays["direct-stores"] += 1
+            return
+        self.__element_address(target)
+        self.expression(statement.value)
+        self.__vmwriter.write_pop("temp", 0)
+        self.__vmwriter.write_pop("pointer", 1)
+        self.__vmwriter.write_push("temp", 0)
+        self.__vmwriter.write_pop("that", 0)
+        if self.__tracking_arrays:
+            # pointer 1 now holds the stored element's address, whatever
+            # the value read; a call in the value may have changed the
+            # variables the element's key depends on
+            self.__that = None if self.__has_call(statement.value) \
+                else element
+
+    def __if(self, statement):
+        """
+        Writes an if statement.
+        """
+        if self.__laying_out and (not statement.else_body or
+                                  self.__is_boolean(statement.condition)):
+            self.__laid_out_if(statement)
+            return
+        else_label = "ELSE_" + str(self.__if_count)
+        end_label = "END_IF_" + str(self.__if_count)
+        self.__if_count += 1
+        self.expression(statement.condition)
+        self.__vmwriter.write_arithmetic("not")
+        self.__vmwriter.write_if(else_label)
+        self.statements(statement.then_body)
+        self.__vmwriter.write_goto(end_label)
+        self.__write_label(else_label)
+        if statement.else_body is not None:
+            self.statements(statement.else_body)
+        self.__write_label(end_label)
+
+    def __laid_out_if(self, statement):
+        """
+        Writes an if statement that jumps to the then branch on a true
+        condition and falls through to the else branch, or that skips the
+        then branch on a false condition when there is no else branch.
+        With an else branch, the condition must be boolean (see
+        __is_boolean).
+        """
+        true_label = "IF_TRUE_" + str(self.__if_count)
+        end_label = "END_IF_" + str(self.__if_count)
+        self.__if_count += 1
+        if not statement.else_body:
+            self.__branch(statement.condition, end_label, False)
+            self.statements(statement.then_body)
+            self.__write_label(end_label)
+            return
+        self.__branch(statement.condition, true_label, True)
+        self.statements(statement.else_body)
+        self.__vmwriter.write_goto(end_label)
+        self.__write_label(true_label)
+        self.statements(statement.then_body)
+        self.__write_label(end_label)
+
+    def __while(self, statement):
+        """
+        Writes a while statement.
+        """
+        if self.__laying_out and self.__is_boolean(statement.condition):
+            self.__rotated_while(statement)
+            return
+        start_label = "WHILE_" + str(self.__while_count)
+        end_label = "WHILE_END_" + str(self.__while_count)
+        self.__while_count += 1
+        self.__write_label(start_label)
+        self.expression(statement.condition)
+        self.__vmwriter.write_arithmetic("not")
+        self.__vmwriter.write_if(end_label)
+        self.statements(statement.body)
+        self.__vmwriter.write_goto(start_label)
+        self.__write_label(end_label)
+
+    def __rotated_while(self, statement):
+        """
+        Writes a while statement with the test after the body, entered by
+        a jump to the test, so that an iteration takes a single
+        conditional jump. The condition must be boolean (see
+        __is_boolean).
+        """
+        body_label = "WHILE_" + str(self.__while_count)
+        test_label = "WHILE_TEST_" + str(self.__while_count)
+        self.__while_count += 1
+        value = constant_value(statement.condition)
+        if value == 0:
+            return
+        if value != -1:
+            self.__vmwriter.write_goto(test_label)
+        self.__write_label(body_label)
+        self.statements(statement.body)
+        self.__write_label(test_label)
+        self.__branch(statement.condition, body_label, True)
+
+    def __is_boolean(self, node):
+        """
+        :param node: An expression node
+        :return: True if the expression's value is always true (-1) or
+        false (0): a comparison, true or false, or ~, & or | of such
+        expressions. A condition holds only when it is -1, so if-goto,
+        which jumps on any value but 0, only tests a boolean condition.
+        """
+        if constant_value(node) in (0, -1):
+            return True
+        if type(node) is UnaryOp:
+            return node.op == "~" and self.__is_boolean(node.operand)
+        if type(node) is BinaryOp:
+            if node.op in COMPARISON_OPERATORS:
+                return True
+            return node.op in LOGICAL_OPERATORS and \
+                self.__is_boolean(node.left) and \
+                self.__is_boolean(node.right)
+        return False
+
+    def __branch(self, node, label, when):
+        """
+        Writes the commands that jump to a label when a condition has the
+        given truth value, and fall through otherwise. A condition holds
+        when it is -1, so jumping when it does not is always a not and an
+        if-goto, while jumping when it does is a bare if-goto, which needs
+        a boolean condition. A boolean negation is branched on with the
+        opposite truth value, and x = 0 does not hold exactly when x is
+        not 0.
+        :param node: The condition's expression node
+        :param label: The label to jump to
+        :param when: True to jump when the condition holds, which must
+        then be boolean (see __is_boolean), False to jump when it does not
+        """
+        value = constant_value(node)
+        if value in (0, -1):
+            if (value == -1) == when:
+                self.__vmwriter.write_goto(label)
+            return
+        if type(node) is UnaryOp and node.op == "~" and \
+                self.__is_boolean(node.operand):
+            self.__branch(node.operand, label, not when)
+            return
+        if not when and type(node) is BinaryOp and node.op == "=" and \
+                0 in (constant_value(node.left), constant_value(node.right)):
+            self.expression(node.right if constant_value(node.left) == 0
+                            else node.left)
+            self.__vmwriter.write_if(label)
+            return
+        self.expression(node)
+        if not when:
+            self.__vmwriter.write_arithmetic("not")
+        self.__vmwriter.write_if(label)
+
+    def __do(self, statement):
+        """
+        Writes a do statement, discarding the returned value.
+        """
+        self.expression(statement.call)
+        self.__vmwriter.write_pop("temp", 0)
+
+    def __return(self, statement):
+        """
+        Writes a return statement.
+        """
+        if self.__eliminating_tail_calls and self.__is_tail_call(statement):
+            self.__tail_call(statement.value)
+            return
+        if statement.value is None:
+            self.__vmwriter.write_push("constant", 0)
+        else:
+            self.expression(statement.value)
+        self.__vmwriter.write_return()
+
+    def __is_tail_call(self, statement):
+        """
+        :param statement: A statement node
+        :return: Whether the statement returns the value of a call to the
+        subroutine being written, as a function or as a method of this,
+        with all of its arguments
+        """
+        subroutine = self.__subroutine_dec
+        if type(statement) is not ReturnStatement or \
+                type(statement.value) is not Call or \
+                statement.value.function != subroutine.name:
+            return False
+        call = statement.value
+        if subroutine.kind == "method":
+            if type(call.receiver) is not KeywordConstant or \
+                    call.receiver.keyword != "this":
+                return False
+        elif subroutine.kind != "function" or call.receiver is not None:
+            return False
+        # The arguments of a method start with this
+        return len(call.arguments) + (call.receiver is not None) == \
+            len(subroutine.arguments)
+
+    def __has_tail_call(self, statements):
+        """
+        :param statements: A list of statement nodes
+        :return: Whether a tail call is among the statements or nested in
+        them
+        """
+        for statement in statements:
+            if self.__is_tail_call(statement):
+                return True
+            if type(statement) is IfStatement and (
+                    self.__has_tail_call(statement.then_body) or
+                    self.__has_tail_call(statement.else_body or [])):
+                return True
+            if type(statement) is WhileStatement and \
+                    self.__has_tail_call(statement.body):
+                return True
+        return False
+
+    def __tail_call(self, call):
+        """
+        Writes a self-recursive tail call as a jump to the start of the
+        subroutine: the new arguments are all computed before any of them
+        is stored, and the locals are set to 0 as on entry. Arguments
+        passed unchanged are not copied.
+        """
+        first = 1 if call.receiver is not None else 0
+        changed = [index for index, argument in enumerate(call.arguments)
+                   if not (type(argument) is Variable and
+                           argument.segment == "argument" and
+                           argument.index == first + index)]
+        for index in changed:
+            self.expression(call.arguments[index])
+        for index in reversed(changed):
+            self.__vmwriter.write_pop("argument", first + index)
+        for index in range(len(self.__subroutine_dec.locals)):
+            self.__vmwriter.write_push("constant", 0)
+            self.__vmwriter.write_pop("local", index)
+        self.__vmwriter.write_goto(TAIL_CALL_LABEL)
+        self.__tail_calls += 1
+
+    def __int_constant(self, node):
+        """
+        Writes the commands that push a 16-bit constant.
+        """
+        if node.value >= 0:
+            self.__vmwriter.write_push("constant", node.value)
+        elif node.value == -MAX_CONSTANT - 1:
+            self.__vmwriter.write_push("constant", MAX_CONSTANT)
+            self.__vmwriter.write_arithmetic("not")
+        else:
+            self.__vmwriter.write_push("constant", -node.value)
+            self.__vmwriter.write_arithmetic("neg")
+
+    def __string_constant(self, node):
+        """
+        Writes a string constant. A pooled string is kept in its static
+        variable, and only built the first time it is used.
+        """
+        if node.pool_index is None:
+            self.__build_string(node.literal)
+            return
+        ready_label = "POOL_" + str(self.__pool_count)
+        self.__pool_count += 1
+        self.__vmwriter.write_push("static", node.pool_index)
+        self.__vmwriter.write_if(ready_label)
+        self.__build_string(node.literal)
+        self.__vmwriter.write_pop("static", node.pool_index)
+        self.__write_label(ready_label)
+        self.__vmwriter.write_push("static", node.pool_index)
+
+    def __build_string(self, literal):
+        """
+        Writes the commands that build a new String.
+        :param literal: The string constant token, with its double quotes
+        """
+        self.__vmwriter.write_push("constant", len(literal))
+        self.__write_call("String.new", 1)
+        for c in literal:
+            if c == '"':
+                continue
+            self.__vmwriter.write_push("constant", ord(c))
+            self.__write_call("String.appendChar", 2)
+
+    def __keyword_constant(self, node):
+        """
+        Writes true, false, null or this.
+        """
+        if node.keyword == "true":
+            self.__vmwriter.write_push("constant", 1)
+            self.__vmwriter.write_arithmetic("neg")
+        elif node.keyword == "this":
+            self.__vmwriter.write_push("pointer", 0)
+        else:
+            self.__vmwriter.write_push("constant", 0)
+
+    def __variable(self, node):
+        """
+        Writes the value of a variable.
+        """
+        self.__vmwriter.write_push(node.segment, node.index)
+
+    def __element_address(self, node):
+        """
+        Writes the commands that push the address of an array element.
+        :param node: An ArrayElement node
+        """
+        self.__variable(node.array)
+        self.expression(node.index)
+        self.__vmwriter.write_arithmetic("add")
+
+    def __array_element(self, node):
+        """
+        Writes the value of an array element, reusing pointer 1 when it
+        already holds the element's address.
+        """
+        if self.__tracking_arrays:
+            element = self.__element_key(node)
+            if element is not None and self.__that is not None and \
+                    element[0] == self.__that[0]:
+                self.__vmwriter.write_push("that", 0)
+                self.__arrays["reused"] += 1
+                return
+            self.__element_address(node)
+            self.__that = element
+        else:
+            self.__element_address(node)
+        self.__vmwriter.write_pop("pointer", 1)
+        self.__vmwriter.write_push("that", 0)
+
+    def __unary_op(self, node):
+        """
+        Writes a unary operator and its operand.
+        """
+        self.expression(node.operand)
+        self.__vmwriter.write_arithmetic(UNARY_COMMANDS[node.op])
+
+    def __binary_op(self, node):
+        """
+        Writes a binary operator and its operands, left first.
+        """
+        if self.__reducing and self.__reduce(node):
+            return
+        self.expression(node.left)
+        self.expression(node.right)
+        if node.op in OPERATOR_CALLS:
+            self.__write_call(OPERATOR_CALLS[node.op], 2)
+        else:
+            self.__vmwriter.write_arithmetic(OPERATOR_COMMANDS[node.op])
+
+    def __call(self, node):
+        """
+        Writes a subroutine call, pushing the object of a method call
+        before the arguments.
+        """
+        n_args = len(node.arguments)
+        if node.receiver is not None:
+            self.expression(node.receiver)
+            n_args += 1
+        for argument in node.arguments:
+            self.expression(argument)
+        self.__write_call(node.function, n_args)
+
+    def __write_call(self, function, n_args):
+        """
+        Writes a call. The called function may be inlined into code that
+        sets pointer 1 (see ProgramOptimizer), so its value is forgotten.
+        """
+        self.__vmwriter.write_call(function, n_args)
+        self.__that = None
+
+    def __write_label(self, label):
+        """
+        Writes a label. Other paths join at a label, so the value of
+        pointer 1 is forgotten.
+        """
+        self.__vmwriter.write_label(label)
+        self.__that = None
+
+    def __pure_key(self, node, variables):
+        """
+        :param node: An expression node
+        :param variables: A set to add the (segment, index) of every
+        variable the expression reads to
+        :return: A key identifying the value of the expression, equal for
+        expressions that compute the same value while the variables are
+        unchanged, or None if the expression may have side effects or
+        reads an array
+        """
+        kind = type(node)
+        if kind is IntConstant:
+            return "int", node.value
+        if kind is KeywordConstant:
+            return "keyword", node.keyword
+        if kind is Variable:
+            variables.add((node.segment, node.index))
+            return "variable", node.segment, node.index
+        if kind is UnaryOp:
+            operand = self.__pure_key(node.operand, variables)
+            return None if operand is None else ("unary", node.op, operand)
+        if kind is BinaryOp:
+            left = self.__pure_key(node.left, variables)
+            right = self.__pure_key(node.right, variables)
+            if left is None or right is None:
+                return None
+            return "binary", node.op, left, right
+        return None
+
+    def __element_key(self, node):
+        """
+        :param node: An ArrayElement node
+        :return: A pair of a key identifying the element's address and the
+        set of the variables it depends on, or None if the address cannot
+        be tracked
+        """
+        variables = {(node.array.segment, node.array.index)}
+        index = self.__pure_key(node.index, variables)
+        if index is None:
+            return None
+        return ("element", node.array.segment, node.array.index,
+                index), variables
+
+    def __calls_function(self, node):
+        """
+        :param node: An expression node
+        :return: True if the node itself is compiled into a call
+        """
+        if type(node) in (Call, StringConstant):
+            return True
+        if type(node) is not BinaryOp or node.op not in OPERATOR_CALLS:
+            return False
+        if not self.__reducing:
+            return True
+        right = constant_value(node.right)
+        if node.op == "/":
+            return right not in (1, -1)
+        constant = right if right is not None else constant_value(node.left)
+        return constant is None or self.multiply_sequence(constant) is None
+
+    def __has_call(self, node):
+        """
+        :param node: An expression node
+        :return: True if the expression is compiled with a call
+        """
+        pending = [node]
+        while pending:
+            node = pending.pop()
+            if self.__calls_function(node):
+                return True
+            pending.extend(node.children())
+        return False
+
+    def __keeps_pointer(self, node, element):
+        """
+        :param node: An expression node
+        :param element: The key of the array element being stored to, as
+        given by __element_key, or None
+        :return: True if the expression can be computed after pointer 1 is
+        set to the element's address: it makes no calls and reads no
+        other array element
+        """
+        pending = [node]
+        while pending:
+            node = pending.pop()
+            if self.__calls_function(node):
+                return False
+            if type(node) is ArrayElement:
+                key = self.__element_key(node)
+                if element is None or key is None or key[0] != element[0]:
+                    return False
+                continue
+            pending.extend(node.children())
+        return True
+
+    def multiply_sequence(self, constant):
+        """
+        Builds the commands that multiply the value on top of the stack by
+        a constant with additions, doubling the running product for every
+        bit of the constant after its most significant one.
+        :param constant: The constant to multiply by
+        :return: A list of command records, or None if the sequence would
+        be longer than the strength reduction threshold
+        """
+        if constant == 0:
+            sequence = [("pop", "temp", 1), ("push", "constant", 0)]
+        elif constant == -MAX_CONSTANT - 1:
+            return None
+        elif constant < 0:
+            sequence = self.multiply_sequence(-constant)
+            if sequence is None:
+                return None
+            sequence = sequence + [("neg",)]
+        else:
+            bits = bin(constant)[3:]
+            doubling = ("pop", "temp", 2), ("push", "temp", 2), \
+                       ("push", "temp", 2), ("add",)
+            sequence = []
+            if "1" in bits:
+                sequence = [("pop", "temp", 1), ("push", "temp", 1)]
+            for bit in bits:
+                sequence.extend(doubling)
+                if bit == "1":
+                    sequence.extend((("push", "temp", 1), ("add",)))
+        if len(sequence) > self.__strength_threshold:
+            return None
+        return sequence
+
+    def __reduce(self, node):
+        """
+        Writes an inline replacement for a multiplication or a division by
+        a constant, when one is worth it. A constant has no side effects,
+        so c * e can be computed as e * c.
+        :param node: A BinaryOp node
+        :return: True if the replacement was written, False if the
+        operator must be compiled as usual
+        """
+        right = constant_value(node.right)
+        if node.op == "*":
+            operand, constant = node.left, right
+            if constant is None:
+                operand, constant = node.right, constant_value(node.left)
+            if constant is None:
+                return False
+            sequence = self.multiply_sequence(constant)
+            if sequence is None:
+                return False
+            self.expression(operand)
+            self.__vmwriter.write_commands(sequence)
+            self.__reduced["multiply"] += 1
+            return True
+        if node.op == "/" and right in (1, -1):
+            self.expression(node.left)
+            if right == -1:
+                self.__vmwriter.write_arithmetic("neg")
+            self.__reduced["divide"] += 1
+            return True
+        return False
@@ -1,32 +1,96 @@
+import time
 from JackTokenizer import *
 from VMWriter import *
 from SymbolTable import *
+from SyntaxTree import *
+from PassManager import PassManager
+from ConstantFolder import ConstantFolder
+from StringPooler import StringPooler
+from ExpressionHoister import ExpressionHoister
+from CodeGenerator import CodeGenerator, DEFAULT_STRENGTH_THRESHOLD
+from PeepholeOptimizer import PeepholeOptimizer
+OPT_PEEPHOLE = "peephole"
+OPT_CONSTANT_FOLDING = "fold-constants"
+OPT_STRENGTH_REDUCTION = "reduce-strength"
+OPT_ARRAYS = "track-arrays"
+OPT_LAYOUT = "layout-branches"
+OPT_TAIL_CALLS = "tail-calls"
+OPT_HOISTING = "hoist-expressions"
+STANDARD_OPTIMIZATIONS = (OPT_PEEPHOLE, OPT_CONSTANT_FOLDING,
+                          OPT_STRENGTH_REDUCTION, OPT_ARRAYS, OPT_LAYOUT,
+                          OPT_TAIL_CALLS, OPT_HOISTING)  # Enabled by -O
+OPT_POOL_STRINGS = "pool-strings"  # Opt-in: pooled strings are shared
 
 
 class CompilationEngine:
+    """
+    Parses a Jack class into a syntax tree (see SyntaxTree), runs the
+    enabled optimization passes over it and lowers it to VM commands with
+    a CodeGenerator.
+    """
 
-    def __init__(self, input_file, output):
+    def __init__(self, input_file, output, source=None, optimizations=(),
+                 strength_threshold=DEFAULT_STRENGTH_THRESHOLD,
+                 signatures=None, parse_cache=None):
+        """
+        :param input_file: Path of the .jack file to compile
+        :param output: Where to write the VM code: a path, a stream, or None
+        to keep it in memory (see get_commands)
+        :param source: Jack source text to compile instead of reading
+        input_file
+        :param optimizations: Names of the optimizations to apply (OPT_*)
+        :param strength_threshold: The longest command sequence that may
+        replace a multiplication by a constant
+        :param signatures: A SignatureIndex of the classes of the program,
+        including this one, to resolve and check calls with, or None
+        :param parse_cache: A ParseCache keeping the tokens and syntax
+        trees of unchanged sources, or None
+        """
         self.__input = input_file
+        self.__signatures = signatures
+        self.__parse_cache = parse_cache
         self.__output = output
-        self.__tokenizer = JackTokenizer(input_file)
+        if source is None:
+            with open(input_file, "r") as file:
+                source = file.read()
+        self.__source = source
+        self.__tokenizer = None
+        self.__timings = {"tokenize": 0.0}
         self.__vmwriter = None
         self.__class_symbols = SymbolTable()
         self.__subroutine_symbols = SymbolTable()
         self.__class_name = ""
-        self.__method_list = []
-        self.__while_count = 0
-        self.__if_count = 0
+        self.__method_names = set()
+        self.__unqualified_calls = []
+        self.__class_dec = None
+        self.__optimizations = frozenset(optimizations)
+        self.__passes = PassManager()
+        if OPT_CONSTANT_FOLDING in self.__optimizations:
+            self.__passes.register(OPT_CONSTANT_FOLDING, ConstantFolder())
+        if OPT_HOISTING in self.__optimizations:
+            self.__passes.register(OPT_HOISTING, ExpressionHoister())
+        if OPT_POOL_STRINGS in self.__optimizations:
+            self.__passes.register(OPT_POOL_STRINGS, StringPooler())
+        self.__reducing = OPT_STRENGTH_REDUCTION in self.__optimizations
+        self.__strength_threshold = strength_threshold
+        self.__generator = None
+        self.__optimizer = None
+        if OPT_PEEPHOLE in self.__optimizations:
+            self.__optimizer = PeepholeOptimizer()
 
-    def __find_methods(self):
-        """
-        Goes through all of the tokens and adds each method name to the class's method_list.
-        """
-        while self.__advance():
-            if self.__tokenizer.token_type() == TYPES_DIC["KEYWORD"] and \
-                    self.__tokenizer.identifier() == TYPES_DIC["METHOD"]:
-                self.__advance(n=2)
-                self.__method_list.append(self.__tokenizer.identifier())
-        self.__tokenizer.jump_to(-1)
+    def __tokenize(self):
+        """
+        Tokenizes the input, or loads its tokens from the parse cache, the
+        first time the tokens are needed; a class whose syntax tree is
+        cached is never tokenized.
+        :return: The JackTokenizer of the input
+        """
+        if self.__tokenizer is None:
+            start = time.perf_counter()
+            self.__tokenizer = JackTokenizer(self.__input, self.__source,
+                                             self.__parse_cache)
+            self.__timings["tokenize"] = time.perf_counter() - start
+        return self.__tokenizer
 
     def __advance(self, n=1):
         """
@@ -51,6 +115,19 @@ class CompilationEngine:
         else:
             return self.__tokenizer.keyword()
 
+    def __lookup(self, name):
+        """
+        :param name: The name of a variable
+        :return: A Variable node for the variable, resolved in the
+        subroutine's scope first and then in the class's scope
+        """
+        if self.__subroutine_symbols.contains(name):
+            symbols = self.__subroutine_symbols
+        else:
+            symbols = self.__class_symbols
+        return Variable(name, symbols.type_of(name), symbols.kind_of(name),
+                        symbols.index_of(name))
+
     def compile_class_var_dec(self):
         """
         compiles class variable declaration. This function does not omit any code.
@@ -70,12 +147,15 @@ class CompilationEngine:
     def compile_parameter_list(self):
         """
         compiles a subroutine's parameter list
+        :return: A list of (name, type) of the parameters
         """
+        parameters = []
         if self.__tokenizer.token_type() != TYPES_DIC["SYMBOL"]:
             type = self.__get_type()
             self.__advance()
             name = self.__tokenizer.identifier()
             self.__subroutine_symbols.define(name, type, "argument")
+            parameters.append((name, type))
             self.__advance()
             while self.__tokenizer.symbol() != ')':
                 self.__advance()
@@ -83,359 +163,412 @@ class CompilationEngine:
                 self.__advance()
                 name = self.__tokenizer.identifier()
                 self.__subroutine_symbols.define(name, type, "argument")
+                parameters.append((name, type))
                 self.__advance()
+        return parameters
 
     def compile_var_dec(self):
         """
         compiles a subroutine's variable declaration.
+        :return: A list of (name, type) of the declared variables
         """
+        variables = []
         self.__advance()
         type = self.__get_type()
         self.__advance()
         name = self.__tokenizer.identifier()
         self.__subroutine_symbols.define(name, type, "VAR")
+        variables.append((name, type))
         self.__advance()
         while self.__tokenizer.symbol() == ',':
             self.__advance()
             name = self.__tokenizer.identifier()
             self.__subroutine_symbols.define(name, type, "VAR")
+            variables.append((name, type))
             self.__advance()
         self.__advance()  # Advances the ';' token
-
-    def __compile_string(self):
-        """
-        Compiles a string
-        """
-        self.__vmwriter.write_push("constant", len(self.__tokenizer.identifier()))
-        self.__vmwriter.write_call("String.new", 1)
-        for c in self.__tokenizer.identifier():
-            if c == '"':
-                continue
-            self.__vmwriter.write_push("constant", ord(c))
-            self.__vmwriter.write_call("String.appendChar", 2)
+        return variables
 
     def compile_term(self):
         """
         Compiles a term.
+        :return: The term's expression node
         """
         if self.__tokenizer.token_type() == TYPES_DIC["KEYWORD"]:
-            if self.__tokenizer.keyword() == "true":
-                self.__vmwriter.write_push("constant", 1)
-                self.__vmwriter.write_arithmetic("neg")
-            elif self.__tokenizer.keyword() == "this":
-                self.__vmwriter.write_push("pointer", 0)
-            else:
-                self.__vmwriter.write_push("constant", 0)
+            node = KeywordConstant(self.__tokenizer.keyword())
             self.__advance()
+            return node
         elif self.__tokenizer.token_type() == TYPES_DIC["SYMBOL"]:
             if self.__tokenizer.symbol() == '(':
                 self.__advance()  # Advance after the '(' token
-                self.compile_expression()
+                node = self.compile_expression()
                 self.__advance()  # Advance after the ')' token
-            else:
-                op = self.__tokenizer.symbol()
-                self.__advance()
-                self.compile_term()
-                self.__compile_operator(op, "term")
+                return node
+            op = self.__tokenizer.symbol()
+            self.__advance()
+            return UnaryOp(op, self.compile_term())
+        if self.__tokenizer.peek() == '(' or self.__tokenizer.peek() == '.':
+            return self.__compile_subroutine_call()
+        if self.__tokenizer.token_type() == TYPES_DIC["INT_CONST"]:
+            node = IntConstant(self.__tokenizer.int_val())
+        elif self.__tokenizer.token_type() == TYPES_DIC["STRING_CONST"]:
+            node = StringConstant(self.__tokenizer.identifier())
         else:
-            if self.__tokenizer.peek() == '(' or self.__tokenizer.peek() == '.':
-                self.__compile_subroutine_call()
-            else:
-                if self.__tokenizer.identifier().isdigit():
-                    self.__vmwriter.write_push("constant", self.__tokenizer.identifier())
-                    self.__advance()
-                elif self.__tokenizer.identifier()[0] == '"':
-                    self.__compile_string()
-                    self.__advance()
-                else:
-                    self.__compile_var(True)
-
-    def __compile_operator(self, op, caller):
-        """
-        Compile an operator command
-        :param op: The operator to compile
-        :param caller: The function that called this compilation process
-        """
-        if op == "+":
-            self.__vmwriter.write_arithmetic("add")
-        elif op == "-" and caller == "expression":
-            self.__vmwriter.write_arithmetic("sub")
-        elif op == "*":
-            self.__vmwriter.write_call("Math.multiply", 2)
-        elif op == "/":
-            self.__vmwriter.write_call("Math.divide", 2)
-        elif op == "&":
-            self.__vmwriter.write_arithmetic("and")
-        elif op == "|":
-            self.__vmwriter.write_arithmetic("or")
-        elif op == "<":
-            self.__vmwriter.write_arithmetic("lt")
-        elif op == ">":
-            self.__vmwriter.write_arithmetic("gt")
-        elif op == "=":
-            self.__vmwriter.write_arithmetic("eq")
-        elif op == "-":
-            self.__vmwriter.write_arithmetic("neg")
-        elif op == "~":
-            self.__vmwriter.write_arithmetic("not")
+            return self.__compile_var()
+        self.__advance()
+        return node
 
     def compile_expression(self):
         """
-        Compiles an expression.
+        Compiles an expression. Jack has no operator precedence, so the
+        operators are nested left to right.
+        :return: The expression's node
         """
-        self.compile_term()
+        node = self.compile_term()
         while self.__tokenizer.symbol() != ')' and self.__tokenizer.symbol() != ']' and \
                 self.__tokenizer.symbol() != ';' and self.__tokenizer.symbol() != ',':
             op = self.__tokenizer.symbol()
             self.__advance()
-            self.compile_term()
-            self.__compile_operator(op, "expression")
+            node = BinaryOp(op, node, self.compile_term())
+        return node
 
-    def __compile_var(self, push):
+    def __compile_var(self):
         """
-        Compile a variable
-        :param push: Decide if it should be a push or pop command
+        Compile a variable or an array element
+        :return: A Variable or ArrayElement node
         """
-        name = self.__tokenizer.identifier()
-        if self.__subroutine_symbols.contains(name):
-            kind = self.__subroutine_symbols.kind_of(name)
-            index = self.__subroutine_symbols.index_of(name)
-        else:
-            kind = self.__class_symbols.kind_of(name)
-            index = self.__class_symbols.index_of(name)
-        if self.__tokenizer.peek() != "[":
-            if push:
-                self.__vmwriter.write_push(kind, index)
-        else:
-            self.__vmwriter.write_push(kind, index)
+        node = self.__lookup(self.__tokenizer.identifier())
+        if self.__tokenizer.peek() == "[":
             self.__advance(n=2)  # Advance after the '[' token
-            self.compile_expression()
-            self.__vmwriter.write_arithmetic("add")
-            if push:
-                self.__vmwriter.write_pop("pointer", 1)
-                self.__vmwriter.write_push("that", 0)
+            node = ArrayElement(node, self.compile_expression())
         self.__advance()  # Advance after the var
+        return node
 
     def compile_let(self):
         """
         Compiles a let statement.
+        :return: A LetStatement node
         """
         self.__advance()
-        if self.__tokenizer.peek() != "[":
-            name = self.__tokenizer.identifier()
-            if self.__subroutine_symbols.contains(name):
-                kind = self.__subroutine_symbols.kind_of(name)
-                index = self.__subroutine_symbols.index_of(name)
-            else:
-                kind = self.__class_symbols.kind_of(name)
-                index = self.__class_symbols.index_of(name)
-            self.__advance(n=2)  # Advance after the '=' token
-            self.compile_expression()
-            self.__vmwriter.write_pop(kind, index)
-        else:
-            self.__compile_var(False)
-            self.__advance()
-            self.compile_expression()
-            self.__vmwriter.write_pop("temp", 0)
-            self.__vmwriter.write_pop("pointer", 1)
-            self.__vmwriter.write_push("temp", 0)
-            self.__vmwriter.write_pop("that", 0)
+        target = self.__compile_var()
+        self.__advance()  # Advance after the '=' token
+        statement = LetStatement(target, self.compile_expression())
         self.__advance()
+        return statement
 
     def compile_if(self):
         """
         Compiles an if statement.
+        :return: An IfStatement node
         """
-        else_label = "ELSE_" + str(self.__if_count)
-        end_label = "END_IF_" + str(self.__if_count)
-        self.__if_count += 1
         self.__advance(n=2)
-        self.compile_expression()
-        self.__vmwriter.write_arithmetic("not")
-        self.__vmwriter.write_if(else_label)
+        condition = self.compile_expression()
         self.__advance(n=2)
-        self.compile_statements()
-        self.__vmwriter.write_goto(end_label)
-        self.__vmwriter.write_label(else_label)
+        then_body = self.compile_statements()
+        else_body = None
         self.__advance()
         if self.__tokenizer.keyword() == TYPES_DIC["ELSE"]:
             self.__advance(n=2)
-            self.compile_statements()
+            else_body = self.compile_statements()
             self.__advance()
-        self.__vmwriter.write_label(end_label)
+        return IfStatement(condition, then_body, else_body)
 
     def compile_while(self):
         """
         Compiles a while statement.
+        :return: A WhileStatement node
         """
-        start_label = "WHILE_" + str(self.__while_count)
-        end_label = "WHILE_END_" + str(self.__while_count)
-        self.__while_count += 1
         self.__advance(n=2)  # Advance after the '(' token
-        self.__vmwriter.write_label(start_label)
-        self.compile_expression()
+        condition = self.compile_expression()
         self.__advance(n=2)  # Advance after the '{' token
-        self.__vmwriter.write_arithmetic("not")
-        self.__vmwriter.write_if(end_label)
-        self.compile_statements()
+        body = self.compile_statements()
         self.__advance()  # Advance after the '}' token
-        self.__vmwriter.write_goto(start_label)
-        self.__vmwriter.write_label(end_label)
+        return WhileStatement(condition, body)
 
     def compile_expression_list(self):
         """
         Compiles an expression list
+        :return: A list of the expressions' nodes
         """
         if self.__tokenizer.token_type() == TYPES_DIC["SYMBOL"] and self.__tokenizer.symbol() == \
                 ")":
-            return 0
-        exp_count = 0
-        self.compile_expression()
-        exp_count += 1
+            return []
+        expressions = [self.compile_expression()]
         while self.__tokenizer.symbol() != ")":
             self.__advance()  # Skip the ',' token
-            self.compile_expression()
-            exp_count += 1
-        return exp_count
+            expressions.append(self.compile_expression())
+        return expressions
 
     def __compile_subroutine_call(self):
         """
-        Compile a subroutine call.
+        Compile a subroutine call. Whether an unqualified call is a method
+        call on this is only known once all of the class is parsed, so
+        those calls are resolved by compile_class.
+        :return: A Call node
         """
-        num_of_expressions = 0
-        if self.__tokenizer.peek() == "(":
-            if self.__tokenizer.identifier() in self.__method_list:  # if it's a method call
-                num_of_expressions += 1
-                self.__vmwriter.write_push("pointer", 0)  # push this as argument 0
-            name = self.__class_name + "." + self.__tokenizer.identifier()
+        receiver = None
+        unqualified = self.__tokenizer.peek() == "("
+        if unqualified:
+            class_name = self.__class_name
         else:
-            in_method = False
-            if self.__subroutine_symbols.contains(self.__tokenizer.identifier()):
-                name = self.__subroutine_symbols.type_of(self.__tokenizer.identifier())
-                kind = self.__subroutine_symbols.kind_of(self.__tokenizer.identifier())
-                index = self.__subroutine_symbols.index_of(self.__tokenizer.identifier())
-                in_method = True
-            elif self.__class_symbols.contains(self.__tokenizer.identifier()):
-                name = self.__class_symbols.type_of(self.__tokenizer.identifier())
-                kind = self.__class_symbols.kind_of(self.__tokenizer.identifier())
-                index = self.__class_symbols.index_of(self.__tokenizer.identifier())
-                in_method = True
+            identifier = self.__tokenizer.identifier()
+            if self.__subroutine_symbols.contains(identifier) or \
+                    self.__class_symbols.contains(identifier):
+                receiver = self.__lookup(identifier)  # a method call
+                class_name = receiver.type
             else:
-                name = self.__tokenizer.identifier()
-                kind = None  # we'll never use this
-                index = 0  # we'll never use this
+                class_name = identifier
             self.__advance(n=2)
-            if in_method:  # if it's a method call
-                num_of_expressions += 1
-                self.__vmwriter.write_push(kind, index)
-            name += "." + self.__tokenizer.identifier()
+        subroutine = self.__tokenizer.identifier()
+        line = self.__tokenizer.line_number()
         self.__advance(n=2)
-        num_of_expressions += self.compile_expression_list()
-        self.__vmwriter.write_call(name, num_of_expressions)
+        node = Call(class_name + "." + subroutine, receiver,
+                    self.compile_expression_list())
+        signature = None
+        if self.__signatures is not None:
+            signature = self.__signatures.lookup(class_name, subroutine)
+        if signature is not None:
+            self.__check_call(node, signature, unqualified, line)
+        elif unqualified:
+            self.__unqualified_calls.append(node)
+        elif self.__signatures is not None and \
+                self.__signatures.has_class(class_name):
+            raise SyntaxError("%s has no subroutine %s" %
+                              (class_name, subroutine),
+                              (self.__input, line, None, None))
         self.__advance()
+        return node
+
+    def __check_call(self, node, signature, unqualified, line):
+        """
+        Checks a call against the signature of the called subroutine, and
+        makes an unqualified call to a method a call on this.
+        :param node: The Call node
+        :param signature: The subroutine's signature in the SignatureIndex
+        :param unqualified: Whether the call names no class or object
+        :param line: The line of the call, for error messages
+        """
+        kind, n_args, return_type = signature
+        if unqualified and kind == TYPES_DIC["METHOD"]:
+            node.receiver = KeywordConstant("this")
+        if node.receiver is not None and kind != TYPES_DIC["METHOD"]:
+            message = "%s is a %s, not a method" % (node.function, kind)
+        elif node.receiver is None and kind == TYPES_DIC["METHOD"]:
+            message = "method %s is called without an object" % \
+                      node.function
+        elif len(node.arguments) != n_args:
+            message = "%s expects %d argument%s, got %d" % \
+                      (node.function, n_args, "" if n_args == 1 else "s",
+                       len(node.arguments))
+        else:
+            return
+        raise SyntaxError(message, (self.__input, line, None, None))
 
     def compile_do(self):
         """
         Compiles a do statement.
+        :return: A DoStatement node
         """
         self.__advance()
-        self.__compile_subroutine_call()
-        self.__vmwriter.write_pop("temp", 0)
+        statement = DoStatement(self.__compile_subroutine_call())
         self.__advance()
+        return statement
 
     def compile_return(self):
         """
         Compiles a return statement.
+        :return: A ReturnStatement node
         """
         self.__advance()
         if self.__tokenizer.token_type() == TYPES_DIC["SYMBOL"] and self.__tokenizer.symbol() == \
                 ";":
-            self.__vmwriter.write_push("constant", 0)
+            value = None
         else:
-            self.compile_expression()
-        self.__vmwriter.write_return()
+            value = self.compile_expression()
         self.__advance()
+        return ReturnStatement(value)
 
     def compile_statements(self):
         """
         Compiles a sequence of statements , not including the
         enclosing "{}".
+        :return: A list of the statements' nodes
         """
+        statements = []
         while self.__tokenizer.token_type() == TYPES_DIC["KEYWORD"]:
             if self.__tokenizer.keyword() == TYPES_DIC["LET"]:
-                self.compile_let()
+                statements.append(self.compile_let())
             elif self.__tokenizer.keyword() == TYPES_DIC["DO"]:
-                self.compile_do()
+                statements.append(self.compile_do())
             elif self.__tokenizer.keyword() == TYPES_DIC["WHILE"]:
-                self.compile_while()
+                statements.append(self.compile_while())
             elif self.__tokenizer.keyword() == TYPES_DIC["RETURN"]:
-                self.compile_return()
+                statements.append(self.compile_return())
             elif self.__tokenizer.keyword() == TYPES_DIC["IF"]:
-                self.compile_if()
+                statements.append(self.compile_if())
+        return statements
 
     def __compile_subroutine_parameters(self):
         """
         Compiles the subroutine's parameters.
+        :return: A list of (name, type) of the subroutine's local variables
         """
+        variables = []
         while self.__tokenizer.keyword() == TYPES_DIC["VAR"]:
-            self.compile_var_dec()
-
-    def __compile_subroutine_body(self):
-        """
-        Compiles the subroutine's body.
-        """
-        self.compile_statements()
+            variables.extend(self.compile_var_dec())
+        return variables
 
     def compile_subroutine_dec(self):
         """
         Compiles a subroutine declaration.
+        :return: A SubroutineDec node
         """
-        in_constructor = False
-        in_method = False
-        if self.__tokenizer.keyword() == TYPES_DIC["CONSTRUCTOR"]:
-            in_constructor = True
-        if self.__tokenizer.keyword() == TYPES_DIC["METHOD"]:
-            in_method = True
+        kind = self.__tokenizer.keyword()
         self.__advance()
+        return_type = self.__get_type()
         self.__subroutine_symbols.start_subroutine()
         name = self.__class_name
         self.__advance()
         name += "." + self.__tokenizer.identifier()
+        if kind == TYPES_DIC["METHOD"]:
+            self.__method_names.add(self.__tokenizer.identifier())
         self.__advance(n=2)
-        if in_method:
+        arguments = []
+        if kind == TYPES_DIC["METHOD"]:
             self.__subroutine_symbols.define("this", self.__class_name, "argument")
-        self.compile_parameter_list()
+            arguments.append(("this", self.__class_name))
+        arguments.extend(self.compile_parameter_list())
         self.__advance(n=2)
-        self.__compile_subroutine_parameters()
-        self.__vmwriter.write_function(name,
-                                       self.__subroutine_symbols.var_count("VAR"))
-
-        if in_constructor:
-            self.__vmwriter.write_push("constant", self.__class_symbols.var_count("FIELD"))
-            self.__vmwriter.write_call("Memory.alloc", 1)
-            self.__vmwriter.write_pop("pointer", 0)
-        if in_method:
-            self.__vmwriter.write_push("argument", 0)
-            self.__vmwriter.write_pop("pointer", 0)
-        self.__compile_subroutine_body()
+        variables = self.__compile_subroutine_parameters()
+        body = self.compile_statements()
         self.__advance()  # Advance the '}' token
+        return SubroutineDec(kind, name, return_type, arguments, variables,
+                             body)
 
-    def compile_class(self):
+    def __signature_context(self):
         """
-        Compiles a class.
+        :return: A string identifying the signatures the class's calls are
+        resolved and checked against
         """
-        self.__find_methods()
+        if self.__signatures is None:
+            return ""
+        return self.__signatures.context(self.__input)
+
+    def parse_class(self):
+        """
+        Parses the class into a syntax tree, without optimizing it, or
+        loads the tree from the parse cache.
+        :return: The ClassDec node of the class, or None if the input has
+        no tokens
+        """
+        if self.__parse_cache is not None:
+            self.__class_dec = self.__parse_cache.load_tree(
+                self.__input, self.__source, self.__signature_context())
+            if self.__class_dec is not None:
+                return self.__class_dec
+        self.__tokenize()
         if not self.__advance():
-            return
+            return None
         self.__advance()
         self.__class_name = self.__tokenizer.identifier()
         self.__advance(n=2)
-        self.__vmwriter = VMWriter(self.__output)
+        subroutines = []
         while self.__tokenizer.has_more_tokens() and self.__tokenizer.token_type() == TYPES_DIC[
                                                                                         "KEYWORD"]:
             if self.__tokenizer.keyword() == TYPES_DIC["STATIC"] or self.__tokenizer.keyword() ==\
                     TYPES_DIC["FIELD"]:
                 self.compile_class_var_dec()
             else:
-                self.compile_subroutine_dec()
+                subroutines.append(self.compile_subroutine_dec())
+        for call in self.__unqualified_calls:
+            if call.function.split(".", 1)[1] in self.__method_names:
+                call.receiver = KeywordConstant("this")
+        self.__class_dec = ClassDec(self.__class_name, subroutines,
+                                    self.__class_symbols.var_count("STATIC"),
+                                    self.__class_symbols.var_count("FIELD"))
+        if self.__parse_cache is not None:
+            self.__parse_cache.store_tree(self.__input, self.__source,
+                                          self.__class_dec,
+                                          self.__signature_context())
+        return self.__class_dec
+
+    def compile_class(self):
+        """
+        Compiles a class: parses it, runs the optimization passes over its
+        syntax tree, and writes its VM code.
+        """
+        start = time.perf_counter()
+        tokenize = self.__timings["tokenize"]
+        if self.parse_class() is None:
+            return
+        parsed = time.perf_counter()
+        start += self.__timings["tokenize"] - tokenize  # timed apart
+        self.__passes.run(self.__class_dec)
+        optimized = time.perf_counter()
+        self.__vmwriter = VMWriter(self.__output, self.__optimizer)
+        self.__generator = CodeGenerator(
+            self.__vmwriter, self.__reducing, self.__strength_threshold,
+            OPT_ARRAYS in self.__optimizations,
+            OPT_LAYOUT in self.__optimizations,
+            OPT_TAIL_CALLS in self.__optimizations)
+        self.__generator.generate(self.__class_dec)
+        generated = time.perf_counter()
         self.__vmwriter.close()
+        self.__timings.update(parse=parsed - start,
+                              passes=optimized - parsed,
+                              generate=generated - optimized,
+                              write=time.perf_counter() - generated)
+
+    def get_timings(self):
+        """
+        :return: A dictionary of the time in seconds spent in each phase of
+        the compilation: tokenize, parse, passes, generate (including the
+        strength reduction) and write (including the peephole optimizer)
+        """
+        return self.__timings
+
+    def count_tokens(self):
+        """
+        :return: The number of tokens of the input
+        """
+        return self.__tokenize().count_tokens()
+
+    def get_class_dec(self):
+        """
+        :return: The ClassDec node of the parsed class
+        """
+        return self.__class_dec
+
+    def get_stats(self):
+        """
+        :return: A dictionary of counters describing what the enabled
+        optimizations did, e.g. {"peephole.jump-to-next": 3}
+        """
+        stats = self.__passes.get_stats()
+        if self.__generator is not None:
+            for op, count in self.__generator.get_stats().items():
+                stats[OPT_STRENGTH_REDUCTION + "." + op] = count
+            for name, count in self.__generator.get_array_stats().items():
+                stats[OPT_ARRAYS + "." + name] = count
+            for name, count in self.__generator.get_tail_call_stats().items():
+                stats[OPT_TAIL_CALLS + "." + name] = count
+        if self.__optimizer is not None:
+            for rule, hits in self.__optimizer.get_hits().items():
+                stats[OPT_PEEPHOLE + "." + rule] = hits
+        return stats
+
+    def get_commands(self):
+        """
+        :return: The VM command records of the compiled class
+        """
+        if self.__vmwriter is None:
+            return []
+        return self.__vmwriter.get_commands()
+
+    def get_text(self):
+        """
+        :return: The VM code of the compiled class
+        """
+        if self.__vmwriter is None:
+            return ""
+        return self.__vmwriter.get_text()
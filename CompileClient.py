@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import socket
+import tempfile
+# Only the standard library is imported here, so that a build served by
+# a running CompileServer does not pay for loading the compiler.
+SOCKET_NAME = "jackcompiler-%d.sock"
+SOCKET_VARIABLE = "JACK_COMPILER_SOCKET"
+NO_DAEMON_VARIABLE = "JACK_COMPILER_NO_DAEMON"
+ENCODING = "utf-8"
+WATCH_FLAG = "--watch"  # Watching is left to a process of its own
+STDIN_PATH = "-"  # The server cannot read the client's standard input
+
+
+def socket_path():
+    """
+    :return: The path of the CompileServer's socket: $JACK_COMPILER_SOCKET,
+    or a socket of the current user in the temporary directory
+    """
+    return os.environ.get(SOCKET_VARIABLE) or os.path.join(
+        tempfile.gettempdir(), SOCKET_NAME % os.getuid())
+
+
+def send_request(path, request):
+    """
+    Sends a request to a CompileServer and reads its replies as they come.
+    :param path: The path of the server's socket
+    :param request: A JSON serializable dictionary
+    :return: A generator of the server's replies, dictionaries
+    :raise OSError: If no server is listening on the socket
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except OSError:
+        connection.close()
+        raise
+    return read_replies(connection, request)
+
+
+def read_replies(connection, request):
+    """
+    :param connection: A socket connected to a CompileServer
+    :param request: A JSON serializable dictionary
+    :return: A generator of the server's replies to the request
+    """
+    with connection, connection.makefile("rwb") as stream:
+        stream.write(json.dumps(request).encode(ENCODING) + b"\n")
+        stream.flush()
+        for line in stream:
+            yield json.loads(line.decode(ENCODING))
+
+
+def request_compile(path, argv):
+    """
+    Asks a CompileServer to run the compiler, printing what it prints.
+    :param path: The path of the server's socket
+    :param argv: The compiler's command line arguments
+    :return: The compiler's exit status, or None if no up to date server
+    is running and the compiler must be run in this process
+    """
+    try:
+        replies = send_request(path, {"argv": argv, "cwd": os.getcwd()})
+        for reply in replies:
+            if "stdout" in reply:
+                sys.stdout.write(reply["stdout"])
+                sys.stdout.flush()
+            elif "stderr" in reply:
+                sys.stderr.write(reply["stderr"])
+                sys.stderr.flush()
+            elif "status" in reply:
+                return reply["status"]
+            elif reply.get("stale"):
+                return None
+    except OSError:
+        return None
+    print("CompileClient: the compile server stopped during the build",
+          file=sys.stderr)
+    return 1
+
+
+def main(argv=None):
+    """
+    Runs the compiler on a CompileServer if one is running, and otherwise
+    in this process. $JACK_COMPILER_NO_DAEMON disables the server, and
+    --watch and builds reading the standard input always run in this
+    process.
+    :param argv: The compiler's command line arguments, without the
+    program name
+    :return: The exit status
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not os.environ.get(NO_DAEMON_VARIABLE) and WATCH_FLAG not in argv \
+            and STDIN_PATH not in argv:
+        status = request_compile(socket_path(), argv)
+        if status is not None:
+            return status
+    import JackCompiler
+    return JackCompiler.main(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import io
+import os
+import sys
+import json
+import socket
+import argparse
+import traceback
+import contextlib
+import JackCompiler
+from CompileClient import socket_path, send_request, ENCODING
+SOURCE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SOURCE_SUFFIX = ".py"
+BACKLOG = 16
+
+
+class ReplyStream(io.TextIOBase):
+    """
+    A text stream that sends everything written to it to a client of the
+    CompileServer, as replies {"stdout": text} or {"stderr": text}.
+    """
+
+    def __init__(self, stream, name):
+        """
+        :param stream: The binary stream of the client's connection
+        :param name: stdout or stderr
+        """
+        self.__stream = stream
+        self.__name = name
+        self.__connected = True
+
+    def write(self, text):
+        """
+        Sends text to the client, unless it has gone away; the build then
+        goes on without it.
+        :param text: The text to send
+        :return: The length of the text
+        """
+        if text and self.__connected:
+            try:
+                send_reply(self.__stream, {self.__name: text})
+            except OSError:
+                self.__connected = False
+        return len(text)
+
+
+def send_reply(stream, reply):
+    """
+    Sends a reply to a client as a line of JSON.
+    :param stream: The binary stream of the client's connection
+    :param reply: A JSON serializable dictionary
+    """
+    stream.write(json.dumps(reply).encode(ENCODING) + b"\n")
+    stream.flush()
+
+
+def source_stamp():
+    """
+    :return: The modification times of the compiler's modules
+    """
+    return {file_name: os.stat(os.path.join(SOURCE_DIRECTORY,
+                                            file_name)).st_mtime_ns
+            for file_name in os.listdir(SOURCE_DIRECTORY)
+            if file_name.endswith(SOURCE_SUFFIX)}
+
+
+class CompileServer:
+    """
+    A resident compiler. It listens on a Unix domain socket for requests,
+    each a line of JSON: {"argv": [...], "cwd": directory} runs the
+    compiler's command line (see JackCompiler.main) in that directory and
+    streams what it prints back as {"stdout": text} and {"stderr": text}
+    replies, ending with {"status": exit status}; {"command": "ping"} and
+    {"command": "shutdown"} reply with {"status": 0}.
+    Between requests it keeps the compiler's modules loaded and the build
+    caches in memory. When the compiler's own source files change it
+    replies {"stale": true} and exits, so clients compile by themselves
+    rather than with outdated code.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The path of the socket to listen on
+        """
+        self.__path = path
+        self.__caches = {}
+        self.__stamp = source_stamp()
+        self.__running = False
+
+    def serve(self):
+        """
+        Serves requests, one at a time, until asked to shut down.
+        """
+        if os.path.exists(self.__path):
+            try:
+                for reply in send_request(self.__path, {"command": "ping"}):
+                    raise RuntimeError("a server is already listening on "
+                                       + self.__path)
+            except OSError:
+                os.unlink(self.__path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        mask = os.umask(0o177)
+        try:
+            listener.bind(self.__path)
+        finally:
+            os.umask(mask)
+        self.__running = True
+        try:
+            listener.listen(BACKLOG)
+            while self.__running:
+                connection, address = listener.accept()
+                with connection, connection.makefile("rwb") as stream:
+                    try:
+                        self.__handle(stream)
+                    except (OSError, ValueError):
+                        pass
+        finally:
+            listener.close()
+            os.unlink(self.__path)
+
+    def __handle(self, stream):
+        """
+        Reads a request from a client and replies to it.
+        :param stream: The binary stream of the client's connection
+        """
+        request = json.loads(stream.readline().decode(ENCODING))
+        if request.get("command") == "shutdown":
+            self.__running = False
+        elif request.get("command") != "ping":
+            if source_stamp() != self.__stamp:
+                self.__running = False
+                send_reply(stream, {"stale": True})
+                return
+            send_reply(stream, {"status": self.__compile(request, stream)})
+            return
+        send_reply(stream, {"status": 0})
+
+    def __compile(self, request, stream):
+        """
+        Runs the compiler for a request.
+        :param request: A compile request
+        :param stream: The binary stream of the client's connection
+        :return: The compiler's exit status
+        """
+        directory = os.getcwd()
+        stdout = ReplyStream(stream, "stdout")
+        stderr = ReplyStream(stream, "stderr")
+        try:
+            os.chdir(request["cwd"])
+            with contextlib.redirect_stdout(stdout), \
+                    contextlib.redirect_stderr(stderr):
+                return JackCompiler.main(request["argv"], self.__caches)
+        except SystemExit as exit:
+            return exit.code if isinstance(exit.code, int) else 1
+        except Exception:
+            stderr.write(traceback.format_exc())
+            return 1
+        finally:
+            os.chdir(directory)
+
+
+def parse_args(argv):
+    """
+    :param argv: The command line arguments, without the program name
+    :return: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog="CompileServer",
+                                     description="Keeps the Jack compiler "
+                                                 "resident, serving "
+                                                 "CompileClient.")
+    parser.add_argument("--socket", default=socket_path(),
+                        help="socket to listen on (default: %(default)s)")
+    parser.add_argument("--stop", action="store_true",
+                        help="stop the server listening on the socket")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Runs the server, or stops it, from the command line.
+    :param argv: The command line arguments, without the program name
+    :return: The exit status
+    """
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.stop:
+        try:
+            for reply in send_request(args.socket, {"command": "shutdown"}):
+                pass
+        except OSError:
+            print("No server is listening on " + args.socket,
+                  file=sys.stderr)
+            return 1
+        return 0
+    CompileServer(args.socket).serve()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
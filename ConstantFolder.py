@@ -0,0 +1,103 @@
+from SyntaxTree import *
+WORD_SIZE = 1 << 16
+MAX_CONSTANT = 32767  # The largest value a push constant command can hold
+KEYWORD_VALUES = {"true": -1, "false": 0, "null": 0}
+
+
+def fold_operator(op, left, right):
+    """
+    Computes a binary operator at compile time, with Jack's 16-bit two's
+    complement semantics.
+    :param op: The operator
+    :param left: The value of the left operand
+    :param right: The value of the right operand
+    :return: The result, or None if it must be computed at run time
+    """
+    if op == "+":
+        result = left + right
+    elif op == "-":
+        result = left - right
+    elif op == "*":
+        result = left * right
+    elif op == "/":
+        if right == 0:
+            return None  # Leave the error to Math.divide
+        result = abs(left) // abs(right)
+        if (left < 0) != (right < 0):
+            result = -result
+    elif op == "&":
+        result = left & right
+    elif op == "|":
+        result = left | right
+    elif op == "<":
+        result = -1 if left < right else 0
+    elif op == ">":
+        result = -1 if left > right else 0
+    elif op == "=":
+        result = -1 if left == right else 0
+    else:
+        return None
+    result %= WORD_SIZE
+    return result - WORD_SIZE if result > MAX_CONSTANT else result
+
+
+def constant_value(node):
+    """
+    :param node: An expression node
+    :return: The node's value if it is an integer or a true, false or null
+    constant, None otherwise
+    """
+    if isinstance(node, IntConstant):
+        return node.value
+    if isinstance(node, KeywordConstant):
+        return KEYWORD_VALUES.get(node.keyword)
+    return None
+
+
+class ConstantFolder:
+    """
+    Replaces operators whose operands are all constants with the constant
+    they compute. The tree of an expression is left associative, as Jack
+    evaluates operators strictly left to right, so in 1 + 2 + x the
+    constant prefix 1 + 2 is folded while x + 2 + 3 is left alone.
+    """
+
+    def __init__(self):
+        self.__folded = 0
+
+    def run(self, class_dec):
+        """
+        Folds the constant expressions of a class.
+        :param class_dec: The ClassDec node of the class
+        """
+        self.__fold(class_dec)
+
+    def get_stats(self):
+        """
+        :return: The number of operators that were folded
+        """
+        return {"folded": self.__folded}
+
+    def __fold(self, node):
+        """
+        Folds the constant expressions of a node's subtree.
+        :param node: A node
+        :return: The node, or the IntConstant replacing it
+        """
+        node.replace_children(self.__fold)
+        if isinstance(node, BinaryOp):
+            left = constant_value(node.left)
+            right = constant_value(node.right)
+            if left is not None and right is not None:
+                value = fold_operator(node.op, left, right)
+                if value is not None:
+                    self.__folded += 1
+                    return IntConstant(value)
+        elif isinstance(node, UnaryOp):
+            value = constant_value(node.operand)
+            if value is not None:
+                self.__folded += 1
+                if node.op == "-":
+                    return IntConstant(fold_operator("-", 0, value))
+                return IntConstant(-value - 1)
+        return node
@@ -0,0 +1,113 @@
+import random
+SHAPES = ("many-classes", "huge-class", "nested-expressions",
+          "long-strings", "comments")
+OPERATORS = ("+", "-", "*", "/", "&", "|")
+COMPARISONS = ("<", ">", "=")
+
+
+class CorpusGenerator:
+    """
+    Generates valid Jack programs of a configurable size and shape, to
+    measure the compiler on. The same seed always gives the same programs.
+    """
+
+    def __init__(self, seed=0):
+        """
+        :param seed: Seed of the random choices
+        """
+        self.__random = random.Random(seed)
+
+    def generate(self, shape, size):
+        """
+        :param shape: One of SHAPES
+        :param size: How big the program should be, roughly in subroutines
+        :return: A dictionary from class names to Jack source texts
+        """
+        if shape == "many-classes":
+            return {"Class%d" % i: self.__class("Class%d" % i, 4)
+                    for i in range(size)}
+        if shape == "huge-class":
+            return {"Huge": self.__class("Huge", size)}
+        if shape == "nested-expressions":
+            return {"Nested": self.__class("Nested", size, depth=12)}
+        if shape == "long-strings":
+            return {"Strings": self.__class("Strings", size,
+                                            string_length=200)}
+        if shape == "comments":
+            return {"Comments": self.__class("Comments", size,
+                                             comment_lines=40)}
+        raise ValueError("unknown shape " + repr(shape))
+
+    def __class(self, name, subroutines, depth=3, string_length=0,
+                comment_lines=0):
+        """
+        :param name: The class's name
+        :param subroutines: The number of subroutines of the class
+        :param depth: The nesting depth of the generated expressions
+        :param string_length: The length of a string literal used in every
+        subroutine, or 0 for none
+        :param comment_lines: The number of lines of the comment block
+        before every subroutine
+        :return: The class's source text
+        """
+        lines = ["/** Generated class %s. */" % name,
+                 "class %s {" % name,
+                 "    field int x, y;",
+                 "    static Array table;", ""]
+        for i in range(subroutines):
+            if comment_lines:
+                lines.append("    /*")
+                lines.extend("     * Comment line %d of subroutine %d." %
+                             (j, i) for j in range(comment_lines))
+                lines.append("     */")
+            lines.extend(self.__subroutine(i, depth, string_length))
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def __subroutine(self, index, depth, string_length):
+        """
+        :param index: The subroutine's number in its class
+        :param depth: The nesting depth of the generated expressions
+        :param string_length: The length of a string literal to use, or 0
+        :return: The lines of a method using most kinds of statements
+        """
+        lines = ["    method int run%d(int a, int b) {" % index,
+                 "        var int i, sum;",
+                 "        var String s;",
+                 "        let i = 0;",
+                 "        let sum = %s;" % self.__expression(depth),
+                 "        while (i < %d) {" % self.__random.randint(2, 50),
+                 "            if ((sum %s a) | (b = i)) {" %
+                 self.__random.choice(COMPARISONS),
+                 "                let sum = sum + %s;" %
+                 self.__expression(depth),
+                 "            } else {",
+                 "                let table[i] = table[i] - x;",
+                 "            }",
+                 "            let i = i + 1;",
+                 "        }"]
+        if string_length:
+            text = "".join(self.__random.choice("abcdefghij klmnop")
+                           for i in range(string_length))
+            lines.extend(['        let s = "%s";' % text,
+                          "        do s.dispose();"])
+        lines.extend(["        do Output.printInt(sum);",
+                      "        let x = y + sum;",
+                      "        return sum;",
+                      "    }", ""])
+        return lines
+
+    def __expression(self, depth):
+        """
+        :param depth: The nesting depth of the expression
+        :return: The text of a random expression over a, b, i, x, y and
+        integer constants
+        """
+        if depth <= 0:
+            return self.__random.choice(("a", "b", "i", "x", "y",
+                                         str(self.__random.randint(0, 99))))
+        return "(%s %s %s)" % (self.__expression(depth - 1),
+                               self.__random.choice(OPERATORS),
+                               self.__expression(depth - 1)
+                               if self.__random.random() < 0.3 else
+                               self.__expression(0))
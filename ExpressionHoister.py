@@ -0,0 +1,266 @@
+from SyntaxTree import *
+from ConstantFolder import constant_value
+VARIABLE_SEGMENTS = ("local", "argument")  # Only changed by let statements
+HOISTED_TYPE = "int"
+# The estimated commands of a multiplication or a division, whether it
+# calls the OS or is reduced to an inline sequence
+OPERATOR_CALL_COST = 20
+# A hoisted expression costs a pop once and a push at every use
+MIN_HOISTED_COST = 3
+
+
+class ExpressionHoister:
+    """
+    Computes pure expressions fewer times, in new local variables of the
+    subroutine. An expression is pure if it is made of operators,
+    constants, this, and locals and arguments, which only let statements
+    of the subroutine change. The largest pure expressions of a while loop
+    whose variables the loop does not assign are computed once before the
+    loop, and a pure expression appearing more than once in a statement is
+    computed once before the statement. Operators are always evaluated in
+    Jack, so moving them changes nothing but their cost, except for a
+    division, which fails when its divisor is 0: a division is only moved
+    when it divides by a non-zero constant.
+    """
+
+    def __init__(self):
+        self.__hoisted = 0
+        self.__reused = 0
+        self.__subroutine = None
+        self.__temps = {}
+
+    def run(self, class_dec):
+        """
+        Hoists the pure expressions of every subroutine of a class.
+        :param class_dec: The ClassDec node of the class
+        """
+        for subroutine in class_dec.subroutines:
+            self.__subroutine = subroutine
+            subroutine.body = self.__statements(subroutine.body)
+
+    def get_stats(self):
+        """
+        :return: The numbers of expressions computed before a loop instead
+        of in it, and of repeated expressions computed only once
+        """
+        return {"hoisted": self.__hoisted, "reused": self.__reused}
+
+    def __statements(self, statements):
+        """
+        Hoists the pure expressions of a list of statements and of the
+        statements nested in them.
+        :param statements: A list of statement nodes
+        :return: The new list of statement nodes
+        """
+        result = []
+        for statement in statements:
+            result.extend(self.__reuse(statement))
+            if type(statement) is WhileStatement:
+                result.extend(self.__hoist(statement))
+                statement.body = self.__statements(statement.body)
+            elif type(statement) is IfStatement:
+                statement.then_body = self.__statements(statement.then_body)
+                if statement.else_body is not None:
+                    statement.else_body = self.__statements(
+                        statement.else_body)
+            result.append(statement)
+        return result
+
+    def __key(self, node, assigned):
+        """
+        :param node: An expression node
+        :param assigned: A set of the (segment, index) of the variables
+        that may change where the expression is evaluated
+        :return: A hashable key, equal for equal expressions, if the
+        expression is pure and reads none of the assigned variables,
+        otherwise None
+        """
+        node_type = type(node)
+        if node_type is IntConstant:
+            return node.value
+        if node_type is KeywordConstant:
+            value = constant_value(node)
+            return ("this",) if value is None else value
+        if node_type is Variable:
+            variable = (node.segment, node.index)
+            if node.segment not in VARIABLE_SEGMENTS or variable in assigned:
+                return None
+            return variable
+        if node_type is UnaryOp:
+            operand = self.__key(node.operand, assigned)
+            return None if operand is None else (node.op, operand)
+        if node_type is BinaryOp:
+            if node.op == "/" and constant_value(node.right) in (None, 0):
+                return None
+            left = self.__key(node.left, assigned)
+            right = self.__key(node.right, assigned)
+            if left is None or right is None:
+                return None
+            return node.op, left, right
+        return None
+
+    def __cost(self, node):
+        """
+        :param node: A pure expression node
+        :return: The estimated number of VM commands evaluating it
+        """
+        if type(node) is UnaryOp:
+            return self.__cost(node.operand) + 1
+        if type(node) is BinaryOp:
+            cost = self.__cost(node.left) + self.__cost(node.right)
+            return cost + (OPERATOR_CALL_COST if node.op in ("*", "/")
+                           else 1)
+        return 1
+
+    def __find(self, node, assigned, found, nested):
+        """
+        Counts the pure operator expressions of a subtree that read none
+        of the assigned variables and are not constant.
+        :param node: A node
+        :param assigned: A set of the (segment, index) of the variables
+        that may change
+        :param found: A dictionary to count the expressions in, from their
+        keys to lists of [node, count], in order of first evaluation
+        :param nested: Whether to count the expressions inside the counted
+        ones too, rather than only the largest ones
+        """
+        if type(node) in (UnaryOp, BinaryOp) and \
+                constant_value(node) is None:
+            key = self.__key(node, assigned)
+            if key is not None:
+                if key in found:
+                    found[key][1] += 1
+                else:
+                    found[key] = [node, 1]
+                if not nested:
+                    return
+        for child in node.children():
+            self.__find(child, assigned, found, nested)
+
+    def __repeated(self, node, counts, found):
+        """
+        Finds the largest expressions of a subtree that appear more than
+        once, without looking inside them.
+        :param node: A node
+        :param counts: The counts of all the pure expressions of the
+        statement, as given by __find
+        :param found: A dictionary to add the repeated expressions to, as
+        in __find
+        """
+        if type(node) in (UnaryOp, BinaryOp):
+            key = self.__key(node, ())
+            if key in counts and counts[key][1] > 1:
+                found[key] = counts[key]
+                return
+        for child in node.children():
+            self.__repeated(child, counts, found)
+
+    def __replace(self, node):
+        """
+        Replaces the expressions that have a temporary variable by the
+        variable, in a subtree.
+        :param node: A node
+        :return: The node, or the Variable replacing it
+        """
+        if type(node) in (UnaryOp, BinaryOp):
+            key = self.__key(node, ())
+            if key in self.__temps:
+                return self.__temps[key]
+        node.replace_children(self.__replace)
+        return node
+
+    def __temporaries(self, found, reusing):
+        """
+        Creates a local variable for every found expression that is worth
+        computing only once.
+        :param found: Found expressions, as given by __find
+        :param reusing: Whether the expressions are repeated in a single
+        statement, rather than evaluated at every iteration of a loop
+        :return: A list of LetStatement nodes setting the variables
+        """
+        lets = []
+        self.__temps = {}
+        for key, (node, count) in found.items():
+            cost = self.__cost(node)
+            if cost < MIN_HOISTED_COST:
+                continue
+            # Computed once, the expression costs a pop and a push per use
+            if reusing and count * cost <= cost + 1 + count:
+                continue
+            locals = self.__subroutine.locals
+            temp = Variable("$%d" % len(locals), HOISTED_TYPE, "local",
+                            len(locals))
+            locals.append((temp.name, HOISTED_TYPE))
+            self.__temps[key] = temp
+            lets.append(LetStatement(temp, node))
+        return lets
+
+    def __reuse(self, statement):
+        """
+        Computes the pure expressions that a statement evaluates more than
+        once before it. The condition of a while loop is evaluated again
+        after its body, so it is left to __hoist.
+        :param statement: A statement node
+        :return: A list of LetStatement nodes to put before the statement
+        """
+        if type(statement) is LetStatement:
+            roots = [statement.target, statement.value]
+        elif type(statement) is IfStatement:
+            roots = [statement.condition]
+        elif type(statement) in (DoStatement, ReturnStatement):
+            roots = statement.children()
+        else:
+            return []
+        counts = {}
+        for root in roots:
+            self.__find(root, (), counts, True)
+        found = {}
+        for root in roots:
+            self.__repeated(root, counts, found)
+        lets = self.__temporaries(found, True)
+        if not lets:
+            return []
+        self.__reused += sum(found[key][1] - 1 for key in self.__temps)
+        if type(statement) is LetStatement:
+            statement.target.replace_children(self.__replace)
+            statement.value = self.__replace(statement.value)
+        elif type(statement) is IfStatement:
+            statement.condition = self.__replace(statement.condition)
+        else:
+            statement.replace_children(self.__replace)
+        return self.__with_reuse(lets)
+
+    def __with_reuse(self, lets):
+        """
+        :param lets: LetStatement nodes setting new variables
+        :return: The statements, each preceded by the statements computing
+        its own repeated expressions
+        """
+        result = []
+        for let in lets:
+            result.extend(self.__reuse(let))
+            result.append(let)
+        return result
+
+    def __hoist(self, loop):
+        """
+        Computes the pure expressions of a while loop whose variables the
+        loop does not assign before it.
+        :param loop: A WhileStatement node
+        :return: A list of LetStatement nodes to put before the loop
+        """
+        assigned = set()
+        pending = [loop]
+        while pending:
+            node = pending.pop()
+            if type(node) is LetStatement and type(node.target) is Variable:
+                assigned.add((node.target.segment, node.target.index))
+            pending.extend(node.children())
+        found = {}
+        self.__find(loop, assigned, found, False)
+        lets = self.__temporaries(found, False)
+        if not lets:
+            return []
+        self.__hoisted += len(lets)
+        loop.replace_children(self.__replace)
+        return self.__with_reuse(lets)
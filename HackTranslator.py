@@ -0,0 +1,331 @@
+from ProgramOptimizer import ENTRY_POINTS
+STACK_BASE = 256
+TEMP_BASE = 5
+SEGMENT_REGISTERS = {"local": "LCL", "argument": "ARG", "this": "THIS",
+                     "that": "THAT"}
+BINARY_OPERATIONS = {"add": "M=M+D", "sub": "M=M-D", "and": "M=D&M",
+                     "or": "M=D|M"}
+UNARY_OPERATIONS = {"neg": "M=-M", "not": "M=!M"}
+# The jump taken when x - y satisfies a comparison, and when it does not
+COMPARISON_JUMPS = {"eq": ("JEQ", "JNE"), "lt": ("JLT", "JGE"),
+                    "gt": ("JGT", "JLE")}
+MAX_UNROLLED_OFFSET = 4  # Largest segment index addressed with A=A+1
+CALL_ROUTINE = "$CALL"
+RETURN_ROUTINE = "$RETURN"
+HALT_LABEL = "$HALT"
+BOOTSTRAP = "the bootstrap"  # The caller of the entry function
+# Pushes the return address in R13 and the caller's frame, points ARG at
+# the R15 arguments below the frame and LCL above it, and jumps to R14.
+CALL_CODE = ["(" + CALL_ROUTINE + ")", "@R15", "M=D",
+             "@R13", "D=M", "@SP", "A=M", "M=D",
+             "@LCL", "D=M", "@SP", "AM=M+1", "M=D",
+             "@ARG", "D=M", "@SP", "AM=M+1", "M=D",
+             "@THIS", "D=M", "@SP", "AM=M+1", "M=D",
+             "@THAT", "D=M", "@SP", "AM=M+1", "M=D",
+             "@SP", "MD=M+1", "@LCL", "M=D",
+             "@5", "D=D-A", "@R15", "D=D-M", "@ARG", "M=D",
+             "@R14", "A=M", "0;JMP"]
+# Returns the value in D: stores it in place of the arguments, restores
+# the caller's frame and jumps to the return address.
+RETURN_CODE = ["(" + RETURN_ROUTINE + ")", "@R15", "M=D",
+               "@LCL", "D=M", "@R14", "M=D",
+               "@5", "A=D-A", "D=M", "@R13", "M=D",
+               "@R15", "D=M", "@ARG", "A=M", "M=D",
+               "@ARG", "D=M+1", "@SP", "M=D",
+               "@R14", "AM=M-1", "D=M", "@THAT", "M=D",
+               "@R14", "AM=M-1", "D=M", "@THIS", "M=D",
+               "@R14", "AM=M-1", "D=M", "@ARG", "M=D",
+               "@R14", "AM=M-1", "D=M", "@LCL", "M=D",
+               "@R13", "A=M", "0;JMP"]
+
+
+class HackTranslator:
+    """
+    Translates the VM code of a whole program straight to Hack assembly.
+    Calls and returns share a single copy of the frame handling code, and
+    common command sequences are translated together: a push followed by
+    a pop, an operator, a branch or a return keeps the value in the D
+    register instead of the stack, and a comparison followed by a branch
+    jumps on the difference instead of building a boolean. Comparisons
+    use the sign of x - y, as the standard VM translator does.
+    """
+
+    def __init__(self, program):
+        """
+        :param program: A dictionary from file keys to command records, as
+        given to ProgramOptimizer
+        """
+        self.__program = program
+        self.__lines = []
+        self.__function = ""
+        self.__label_count = 0
+
+    def __functions(self):
+        """
+        :return: The set of the names of the program's functions
+        """
+        return {command[1] for commands in self.__program.values()
+                for command in commands if command[0] == "function"}
+
+    def __entry(self, entry, functions):
+        """
+        :param entry: The function to start from, or None
+        :param functions: The set of the names of the program's functions
+        :return: The function the bootstrap calls: entry if given, else
+        Sys.init if the program has it and otherwise Main.main
+        """
+        if entry is not None:
+            return entry
+        return next((name for name in ENTRY_POINTS if name in functions),
+                    ENTRY_POINTS[0])
+
+    def get_unresolved_calls(self, entry=None):
+        """
+        Finds the calls to functions the program does not define. The
+        assembler would take their labels for variables, so the calls
+        would jump to arbitrary addresses.
+        :param entry: The function the bootstrap calls, as for translate
+        :return: A dictionary from the undefined functions to the sorted
+        lists of the functions calling them, BOOTSTRAP for the entry
+        """
+        functions = self.__functions()
+        unresolved = {}
+        entry = self.__entry(entry, functions)
+        if entry not in functions:
+            unresolved[entry] = {BOOTSTRAP}
+        for commands in self.__program.values():
+            caller = None
+            for command in commands:
+                if command[0] == "function":
+                    caller = command[1]
+                elif command[0] == "call" and command[1] not in functions:
+                    unresolved.setdefault(command[1], set()).add(caller)
+        return {function: sorted(callers)
+                for function, callers in unresolved.items()}
+
+    def translate(self, entry=None):
+        """
+        :param entry: The function the bootstrap calls, by default Sys.init
+        if the program has it and otherwise Main.main
+        :return: The Hack assembly of the program, as a list of lines
+        """
+        entry = self.__entry(entry, self.__functions())
+        self.__lines = ["@%d" % STACK_BASE, "D=A", "@SP", "M=D"]
+        self.__call(entry, 0)
+        self.__lines.extend(["(" + HALT_LABEL + ")", "@" + HALT_LABEL,
+                             "0;JMP"])
+        self.__lines.extend(CALL_CODE)
+        self.__lines.extend(RETURN_CODE)
+        for commands in self.__program.values():
+            i = 0
+            while i < len(commands):
+                i += self.__translate(commands, i)
+        return self.__lines
+
+    def __translate(self, commands, i):
+        """
+        Translates the command at index i, together with the commands
+        following it when they can be translated better as a sequence.
+        :param commands: The command records of a file
+        :param i: The index of the command to translate
+        :return: The number of commands translated
+        """
+        command = commands[i]
+        following = commands[i + 1:i + 4]
+        names = [other[0] for other in following]
+        op = command[0]
+        if op == "push" and following:
+            if names[0] in COMPARISON_JUMPS:
+                return 1 + self.__compare(names[0], following[1:],
+                                          command[1:])
+            if names[0] == "pop":
+                self.__load(*command[1:])
+                self.__store(*following[0][1:])
+                return 2
+            if names[0] in BINARY_OPERATIONS:
+                self.__load(*command[1:])
+                self.__emit("@SP", "A=M-1", BINARY_OPERATIONS[names[0]])
+                return 2
+            if names[0] == "if-goto":
+                self.__load(*command[1:])
+                self.__emit("@" + self.__label(following[0][1]), "D;JNE")
+                return 2
+            if names[0] == "return":
+                self.__load(*command[1:])
+                self.__emit("@" + RETURN_ROUTINE, "0;JMP")
+                return 2
+        if op == "push":
+            self.__load(*command[1:])
+            self.__push_d()
+        elif op == "pop":
+            self.__emit("@SP", "AM=M-1", "D=M")
+            self.__store(*command[1:])
+        elif op in BINARY_OPERATIONS:
+            self.__emit("@SP", "AM=M-1", "D=M", "A=A-1",
+                        BINARY_OPERATIONS[op])
+        elif op in UNARY_OPERATIONS:
+            self.__emit("@SP", "A=M-1", UNARY_OPERATIONS[op])
+        elif op in COMPARISON_JUMPS:
+            return self.__compare(op, following, None)
+        elif op == "label":
+            self.__emit("(" + self.__label(command[1]) + ")")
+        elif op == "goto":
+            self.__emit("@" + self.__label(command[1]), "0;JMP")
+        elif op == "if-goto":
+            self.__emit("@SP", "AM=M-1", "D=M",
+                        "@" + self.__label(command[1]), "D;JNE")
+        elif op == "call":
+            self.__call(command[1], command[2])
+        elif op == "function":
+            self.__function_entry(command[1], command[2])
+        elif op == "return":
+            self.__emit("@SP", "AM=M-1", "D=M", "@" + RETURN_ROUTINE,
+                        "0;JMP")
+        else:
+            raise ValueError("unknown VM command " + op)
+        return 1
+
+    def __emit(self, *lines):
+        """
+        Adds lines to the output.
+        """
+        self.__lines.extend(lines)
+
+    def __label(self, label):
+        """
+        :param label: A VM label of the current function
+        :return: The assembly label of the VM label
+        """
+        return self.__function + "$" + label
+
+    def __new_label(self, kind):
+        """
+        :param kind: A word describing the label
+        :return: A new assembly label, unique in the program
+        """
+        self.__label_count += 1
+        return "%s$%s.%d" % (self.__function, kind, self.__label_count)
+
+    def __address(self, segment, index):
+        """
+        :param segment: static, temp or pointer
+        :param index: The index in the segment
+        :return: The symbol or address of the variable
+        """
+        if segment == "static":
+            return "%s.%d" % (self.__function.split(".")[0], index)
+        if segment == "temp":
+            return str(TEMP_BASE + index)
+        return "THAT" if index else "THIS"
+
+    def __point(self, segment, index):
+        """
+        Emits the lines that set A to the address of a variable of a
+        segment based on a register, without changing D.
+        :param segment: local, argument, this or that
+        :param index: The index in the segment, at most
+        MAX_UNROLLED_OFFSET
+        """
+        self.__emit("@" + SEGMENT_REGISTERS[segment],
+                    "A=M+1" if index else "A=M")
+        self.__emit(*["A=A+1"] * (index - 1))
+
+    def __load(self, segment, index):
+        """
+        Emits the lines that set D to the value of a variable or constant.
+        :param segment: The VM segment
+        :param index: The index in the segment
+        """
+        if segment == "constant":
+            if index in (0, 1):
+                self.__emit("D=%d" % index)
+            else:
+                self.__emit("@%d" % index, "D=A")
+        elif segment in SEGMENT_REGISTERS:
+            if index <= MAX_UNROLLED_OFFSET:
+                self.__point(segment, index)
+                self.__emit("D=M")
+            else:
+                self.__emit("@%d" % index, "D=A",
+                            "@" + SEGMENT_REGISTERS[segment], "A=D+M",
+                            "D=M")
+        else:
+            self.__emit("@" + self.__address(segment, index), "D=M")
+
+    def __store(self, segment, index):
+        """
+        Emits the lines that store D in a variable.
+        :param segment: The VM segment
+        :param index: The index in the segment
+        """
+        if segment not in SEGMENT_REGISTERS:
+            self.__emit("@" + self.__address(segment, index), "M=D")
+        elif index <= MAX_UNROLLED_OFFSET:
+            self.__point(segment, index)
+            self.__emit("M=D")
+        else:
+            self.__emit("@R13", "M=D", "@%d" % index, "D=A",
+                        "@" + SEGMENT_REGISTERS[segment], "D=D+M", "@R14",
+                        "M=D", "@R13", "D=M", "@R14", "A=M", "M=D")
+
+    def __push_d(self):
+        """
+        Emits the lines that push D.
+        """
+        self.__emit("@SP", "AM=M+1", "A=A-1", "M=D")
+
+    def __compare(self, op, following, operand):
+        """
+        Emits a comparison. Followed by a branch, possibly on the negated
+        result, it jumps on x - y directly.
+        :param op: eq, lt or gt
+        :param following: The commands after the comparison
+        :param operand: The segment and index of a pushed y, if the push
+        before the comparison is translated with it, otherwise None
+        :return: The number of commands translated after the push of y
+        """
+        if operand is None:
+            self.__emit("@SP", "AM=M-1", "D=M")
+        else:
+            self.__load(*operand)
+        taken, not_taken = COMPARISON_JUMPS[op]
+        names = [command[0] for command in following]
+        if names[:1] == ["if-goto"]:
+            self.__emit("@SP", "AM=M-1", "D=M-D",
+                        "@" + self.__label(following[0][1]), "D;" + taken)
+            return 2
+        if names[:2] == ["not", "if-goto"]:
+            self.__emit("@SP", "AM=M-1", "D=M-D",
+                        "@" + self.__label(following[1][1]),
+                        "D;" + not_taken)
+            return 3
+        done = self.__new_label("CMP")
+        self.__emit("@SP", "A=M-1", "D=M-D", "M=-1", "@" + done,
+                    "D;" + taken, "@SP", "A=M-1", "M=0", "(" + done + ")")
+        return 1
+
+    def __call(self, function, n_args):
+        """
+        Emits a call through the shared call routine.
+        :param function: The name of the called function
+        :param n_args: The number of arguments pushed for it
+        """
+        back = self.__new_label("ret")
+        self.__emit("@" + back, "D=A", "@R13", "M=D", "@" + function, "D=A",
+                    "@R14", "M=D")
+        self.__load("constant", n_args)
+        self.__emit("@" + CALL_ROUTINE, "0;JMP", "(" + back + ")")
+
+    def __function_entry(self, function, n_locals):
+        """
+        Emits the entry of a function, setting its locals to 0.
+        :param function: The function's name
+        :param n_locals: The number of its local variables
+        """
+        self.__function = function
+        self.__emit("(" + function + ")")
+        if n_locals == 0:
+            return
+        self.__emit("@SP", "A=M", "M=0")
+        self.__emit(*["A=A+1", "M=0"] * (n_locals - 1))
+        self.__emit("D=A+1", "@SP", "M=D")
@@ -1,41 +1,984 @@
 import os
 import sys
-import platform
-from CompilationEngine import CompilationEngine
-WIN_PATH_DEL = "\\"  # Delimiter in Windows based directory path
-OTHER_PATH_DEL = "/"  # Delimiter in other OS's directory path
+import json
+import time
+import cProfile
+import argparse
+import contextlib
+import tracemalloc
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from CompilationEngine import CompilationEngine, STANDARD_OPTIMIZATIONS, \
+    DEFAULT_STRENGTH_THRESHOLD, OPT_POOL_STRINGS, OPT_PEEPHOLE
+from BuildCache import BuildCache
+from VMWriter import VMWriter
+from SyntaxTree import Call
+from ProgramOptimizer import ProgramOptimizer, DEFAULT_INLINE_BUDGET
+from PeepholeOptimizer import PeepholeOptimizer
+from HackTranslator import HackTranslator
+from SignatureIndex import SignatureIndex, scan_file
+from ParseCache import ParseCache
+from Bundle import BundleWriter, split_classes, STREAM_NAME
+from SizeReport import SizeReport
+from VMEmulator import HACK_COSTS, parse_commands
+COMPILER_VERSION = "1.4"
+CACHE_DIR_NAME = ".jackcache"
 VM_SUFFIX = ".vm"
+ASM_SUFFIX = ".asm"
 JACK_SUFFIX = ".jack"
 SUFFIX_DELIMITER = "."
+PROFILE_FILE_NAME = "profile.json"
+PROFILE_SUFFIX = ".prof"
+PROFILE_PHASES = ("tokenize", "parse", "passes", "generate", "write")
+SIZE_REPORT_FILE_NAME = "size.json"
+INDEX_PARALLEL_THRESHOLD = 64  # Fewer files are scanned in this process
+INDEX_CHUNK_SIZE = 16
+CHUNKS_PER_WORKER = 4  # Sources are handed to the workers in this many
+# chunks each, few enough to keep messages rare and enough to balance them
+WORKER_STATE = {}  # What every compilation of a worker process shares
+WATCH_INTERVAL = 0.5  # Seconds between checks of the sources in --watch
+DEBOUNCE_INTERVAL = 0.2  # Seconds the sources must stay unchanged
 
-if __name__ == '__main__':
-    if os.path.isdir(sys.argv[1]):
-        for file_name in os.listdir(sys.argv[1]):
-            if file_name.endswith(JACK_SUFFIX):
-                if platform.system() == "Windows":
-                    name = sys.argv[1] + WIN_PATH_DEL + file_name
-                    name = name.rsplit(SUFFIX_DELIMITER, 1)[0]
-                    output = name + VM_SUFFIX
-                    engine = CompilationEngine(sys.argv[1] +
-                                               WIN_PATH_DEL + file_name,
-                                               output)
-                    engine.compile_class()
-                else:
-                    name = sys.argv[1] + OTHER_PATH_DEL + file_name
-                    name = name.rsplit(SUFFIX_DELIMITER, 1)[0]
-                    output = name + VM_SUFFIX
-                    engine = CompilationEngine(sys.argv[1] +
-                                               OTHER_PATH_DEL +
-                                               file_name, output)
-                    engine.compile_class()
+
+def output_path(source):
+    """
+    :param source: Path of a .jack file
+    :return: Path of the .vm file compiled from it
+    """
+    return source.rsplit(SUFFIX_DELIMITER, 1)[0] + VM_SUFFIX
+
+
+def asm_path(path):
+    """
+    :param path: A .jack file or a directory of .jack files
+    :return: Path of the .asm file of the program, inside the directory
+    and named after it, or next to the file
+    """
+    if os.path.isdir(path):
+        name = os.path.basename(os.path.normpath(os.path.abspath(path)))
+        return os.path.join(path, name + ASM_SUFFIX)
+    return path.rsplit(SUFFIX_DELIMITER, 1)[0] + ASM_SUFFIX
+
+
+def find_sources(path):
+    """
+    :param path: A .jack file or a directory of .jack files
+    :return: A sorted list of the .jack files to compile
+    """
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, file_name) for file_name in
+                      os.listdir(path) if file_name.endswith(JACK_SUFFIX))
+    return [path]
+
+
+def library_files(path):
+    """
+    :param path: A .jack file or a directory of .jack files
+    :return: A sorted list of the .vm files of the directory that are not
+    compiled from its .jack files, e.g. the OS classes' VM code
+    """
+    if not os.path.isdir(path):
+        return []
+    outputs = {output_path(source) for source in find_sources(path)}
+    return sorted(vm_path for vm_path in
+                  (os.path.join(path, file_name)
+                   for file_name in os.listdir(path)
+                   if file_name.endswith(VM_SUFFIX))
+                  if vm_path not in outputs)
+
+
+def format_error(source, error):
+    """
+    :param source: The file that failed to compile
+    :param error: The exception raised while compiling it
+    :return: A one line description of the error
+    """
+    if isinstance(error, SyntaxError) and error.lineno:
+        return "%s:%d: %s" % (source, error.lineno, error.msg)
+    return "%s: %s: %s" % (source, type(error).__name__, error)
+
+
+def run_engine(source, output, settings, profile=False, dump_dir=None):
+    """
+    Compiles a single .jack file, optionally measuring the compilation.
+    :param source: Path of the .jack file
+    :param output: The output of the CompilationEngine
+    :param settings: Keyword arguments for the CompilationEngine
+    :param profile: Whether to measure the compilation
+    :param dump_dir: A directory to write the cProfile statistics of the
+    compilation to, as <class>.prof, or None
+    :return: A pair of the engine, and the profile record of the file if
+    profiling, otherwise None
+    """
+    if not profile:
+        engine = CompilationEngine(source, output, **(settings or {}))
+        engine.compile_class()
+        return engine, None
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile() if dump_dir else None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    engine = CompilationEngine(source, output, **(settings or {}))
+    engine.compile_class()
+    if profiler is not None:
+        profiler.disable()
+        name = os.path.basename(source).rsplit(SUFFIX_DELIMITER, 1)[0]
+        profiler.dump_stats(os.path.join(dump_dir, name + PROFILE_SUFFIX))
+    total = time.perf_counter() - start
+    timings = dict(engine.get_timings())  # counting may load the tokens
+    record = {"file": source, "tokens": engine.count_tokens(),
+              "commands": len(engine.get_commands()), "total": total,
+              "peak_memory": tracemalloc.get_traced_memory()[1]}
+    for phase in PROFILE_PHASES:
+        record[phase] = timings.get(phase, 0.0)
+    return engine, record
+
+
+def compile_file(source, settings=None, profile=False, dump_dir=None):
+    """
+    Compiles a single .jack file into the .vm file next to it.
+    :param source: Path of the .jack file
+    :param settings: Keyword arguments for the CompilationEngine
+    :param profile: Whether to measure the compilation
+    :param dump_dir: A directory for cProfile statistics, or None
+    :return: A triplet of None on success, otherwise a description of the
+    error, the engine's optimization statistics, and the profile record of
+    the file, or None
+    """
+    try:
+        engine, record = run_engine(source, output_path(source), settings,
+                                    profile, dump_dir)
+    except Exception as error:
+        return format_error(source, error), {}, None
+    return None, engine.get_stats(), record
+
+
+def compile_to_commands(source, settings=None, profile=False, dump_dir=None):
+    """
+    Compiles a single .jack file in memory.
+    :param source: Path of the .jack file
+    :param settings: Keyword arguments for the CompilationEngine
+    :param profile: Whether to measure the compilation
+    :param dump_dir: A directory for cProfile statistics, or None
+    :return: A quadruplet of None on success, otherwise a description of
+    the error, the engine's optimization statistics, the VM command
+    records, and the profile record of the file, or None
+    """
+    try:
+        engine, record = run_engine(source, None, settings, profile,
+                                    dump_dir)
+    except Exception as error:
+        return format_error(source, error), {}, [], None
+    return None, engine.get_stats(), engine.get_commands(), record
+
+
+def compile_bundle_class(item, settings=None, profile=False, dump_dir=None):
+    """
+    Compiles a class of a bundle in memory.
+    :param item: A quadruplet of the bundle's name, the class's name, the
+    line of the bundle where the class starts, and the class's text
+    :param settings: Keyword arguments for the CompilationEngine
+    :param profile: Whether to measure the compilation
+    :param dump_dir: A directory for cProfile statistics, or None
+    :return: The same as compile_to_commands, with the errors located in
+    the bundle
+    """
+    bundle, class_name, line, text = item
+    try:
+        engine, record = run_engine(class_name + JACK_SUFFIX, None,
+                                    dict(settings or {}, source=text),
+                                    profile, dump_dir)
+    except Exception as error:
+        if isinstance(error, SyntaxError) and error.lineno:
+            error.lineno += line - 1
+        return format_error(bundle, error), {}, [], None
+    return None, engine.get_stats(), engine.get_commands(), record
+
+
+def compile_source(source, name="<string>", **settings):
+    """
+    Compiles the source text of a Jack class completely in memory.
+    :param source: The Jack source text
+    :param name: A name for the source, used in error messages
+    :param settings: Keyword arguments for the CompilationEngine
+    :return: The VM code of the class
+    """
+    engine = CompilationEngine(name, None, source, **settings)
+    engine.compile_class()
+    return engine.get_text()
+
+
+def compile_source_commands(source, name="<string>", **settings):
+    """
+    Compiles the source text of a Jack class completely in memory.
+    :param source: The Jack source text
+    :param name: A name for the source, used in error messages
+    :param settings: Keyword arguments for the CompilationEngine
+    :return: The VM commands of the class, as records (see VMWriter)
+    """
+    engine = CompilationEngine(name, None, source, **settings)
+    engine.compile_class()
+    return engine.get_commands()
+
+
+def compile_all(sources, jobs, settings=None, compiler=compile_file,
+                profile=False, dump_dir=None):
+    """
+    Compiles every source, fanning them out over a process pool when more
+    than one job is allowed. Classes compile independently, so the order
+    of completion does not matter; results are reported in input order.
+    :param sources: The .jack files to compile
+    :param jobs: Maximal number of worker processes
+    :param settings: Keyword arguments for the CompilationEngine
+    :param compiler: The function that compiles each source,
+    compile_file or compile_to_commands
+    :param profile: Whether to measure every compilation
+    :param dump_dir: A directory for cProfile statistics, or None
+    :return: For every source, in input order, the compiler's result
+    """
+    if jobs <= 1 or len(sources) <= 1:
+        return [compiler(source, settings, profile, dump_dir)
+                for source in sources]
+    workers = min(jobs, len(sources))
+    with ProcessPoolExecutor(max_workers=workers, initializer=start_worker,
+                             initargs=(compiler, settings, profile,
+                                       dump_dir)) as pool:
+        return list(pool.map(compile_in_worker, sources, chunksize=max(
+            1, len(sources) // (workers * CHUNKS_PER_WORKER))))
+
+
+def start_worker(compiler, settings, profile, dump_dir):
+    """
+    Initializes a worker process of compile_all with the arguments shared
+    by all its compilations, so that they are sent to it once rather than
+    with every source.
+    :param compiler: The function that compiles each source
+    :param settings: Keyword arguments for the CompilationEngine
+    :param profile: Whether to measure every compilation
+    :param dump_dir: A directory for cProfile statistics, or None
+    """
+    WORKER_STATE.update(compiler=compiler, settings=settings,
+                        profile=profile, dump_dir=dump_dir)
+
+
+def compile_in_worker(source):
+    """
+    Compiles a source in a worker process started by start_worker.
+    :param source: The source to compile
+    :return: The compiler's result
+    """
+    return WORKER_STATE["compiler"](source, WORKER_STATE["settings"],
+                                    WORKER_STATE["profile"],
+                                    WORKER_STATE["dump_dir"])
+
+
+def engine_settings(args):
+    """
+    :param args: The parsed command line arguments
+    :return: The keyword arguments for the CompilationEngine selected by
+    the arguments
+    """
+    optimizations = set()
+    if args.optimize:
+        optimizations.update(STANDARD_OPTIMIZATIONS)
+    if args.pool_strings:
+        optimizations.add(OPT_POOL_STRINGS)
+    return {"optimizations": sorted(optimizations),
+            "strength_threshold": args.strength_threshold}
+
+
+def index_sources(sources, jobs, library=None, cache=None, scans=None):
+    """
+    Builds the signature index of the program in a first pass, which
+    reads only the declarations of the classes.
+    :param sources: All the .jack files of the program
+    :param jobs: Maximal number of worker processes
+    :param library: A path to a saved SignatureIndex of other classes,
+    e.g. of the OS, or None
+    :param cache: A ParseCache keeping the declarations of unchanged
+    sources, or None
+    :param scans: A dictionary from every source scanned by a previous
+    build to its file_stamp and declarations, which is updated; only the
+    sources whose stamp changed are scanned again. None scans them all
+    :return: A SignatureIndex of the library and the sources
+    """
+    index = SignatureIndex() if library is None else \
+        SignatureIndex.load(library)
+    scans = {} if scans is None else scans
+    stamps = {source: file_stamp(source) for source in sources}
+    stale = [source for source in sources if source not in scans
+             or scans[source][0] != stamps[source]]
+    if jobs <= 1 or len(stale) < INDEX_PARALLEL_THRESHOLD:
+        results = map(scan_file, stale, repeat(None), repeat(cache))
     else:
-        if platform.system() == "Windows":
-            name = sys.argv[1].rsplit(SUFFIX_DELIMITER, 1)[0]
-            output = name + VM_SUFFIX
-            engine = CompilationEngine(sys.argv[1], output)
-            engine.compile_class()
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(scan_file, stale, repeat(None),
+                                    repeat(cache),
+                                    chunksize=INDEX_CHUNK_SIZE))
+    for source, result in zip(stale, results):
+        scans[source] = (stamps[source], result)
+    for source in set(scans) - set(sources):
+        del scans[source]
+    for source in sources:
+        result = scans[source][1]
+        if result is not None:
+            class_name, subroutines, references = result
+            index.add_class(class_name, subroutines)
+            index.add_references(source, references)
+    return index
+
+
+def merge_stats(total, stats):
+    """
+    Adds the counters of stats into total.
+    :param total: A dictionary of counters to update
+    :param stats: A dictionary of counters
+    """
+    for name, count in stats.items():
+        total[name] = total.get(name, 0) + count
+
+
+def cache_salt(args):
+    """
+    :param args: The parsed command line arguments
+    :return: The part of the build cache keys that identifies the compiler
+    version and the options that affect its output
+    """
+    settings = engine_settings(args)
+    return "JackCompiler %s %s" % (COMPILER_VERSION, ",".join(
+        "%s=%s" % (name, settings[name]) for name in sorted(settings)))
+
+
+def default_cache_dir(path):
+    """
+    :param path: The file or directory being compiled
+    :return: The directory of the build cache used for it
+    """
+    if os.path.isdir(path):
+        return os.path.join(path, CACHE_DIR_NAME)
+    return os.path.join(os.path.dirname(path) or os.curdir, CACHE_DIR_NAME)
+
+
+def cache_directory(args):
+    """
+    :param args: The parsed command line arguments
+    :return: The absolute path of the build cache directory
+    """
+    return os.path.abspath(args.cache_dir or default_cache_dir(args.path))
+
+
+def open_parse_cache(args):
+    """
+    :param args: The parsed command line arguments
+    :return: The ParseCache of the build, or None if --no-cache is given
+    """
+    if args.no_cache:
+        return None
+    return ParseCache(cache_directory(args), COMPILER_VERSION)
+
+
+def build_settings(args, signatures):
+    """
+    :param args: The parsed command line arguments
+    :param signatures: The SignatureIndex of the program
+    :return: The keyword arguments for the CompilationEngine of every file
+    of the build: engine_settings, the signatures, and the parse cache
+    unless --no-cache is given
+    """
+    settings = dict(engine_settings(args), signatures=signatures)
+    if not args.no_cache:
+        settings["parse_cache"] = open_parse_cache(args)
+    return settings
+
+
+def build_program(sources, args, stats, records, signatures, outputs=None):
+    """
+    Compiles all the sources as a single program, applying whole-program
+    optimizations (with -W) before any output is written, and writes
+    either the .vm files or, with --asm, one Hack assembly file, which
+    also holds the library_files of the directory, e.g. the OS, and fails
+    if any call is left undefined. The build cache is not used, since
+    every output may depend on every source.
+    :param sources: The .jack files of the program
+    :param args: The parsed command line arguments
+    :param stats: A dictionary to add the optimization statistics into
+    :param records: A list to add the profile records of the files into
+    :param signatures: The SignatureIndex of the program
+    :param outputs: A dictionary to add the final command records of
+    every source into, or None
+    :return: A list of error descriptions
+    """
+    settings = build_settings(args, signatures)
+    results = compile_all(sources, args.jobs, settings, compile_to_commands,
+                          args.profile is not None, args.profile_dump)
+    errors = [error for error, file_stats, commands, record in results
+              if error is not None]
+    if errors:
+        return errors
+    program = {}
+    for source, (error, file_stats, commands, record) in zip(sources,
+                                                             results):
+        merge_stats(stats, file_stats)
+        program[source] = commands
+        if record is not None:
+            records.append(record)
+    if args.asm:
+        for library in library_files(args.path):
+            with open(library, "r") as file:
+                program[library] = parse_commands(file.read())
+    optimizer = ProgramOptimizer(program)
+    if args.whole_program:
+        optimize_program(optimizer, args, stats)
+    if outputs is not None:
+        for source in sources:
+            outputs[source] = optimizer.get_commands(source)
+    if args.asm:
+        translator = HackTranslator({key: optimizer.get_commands(key)
+                                     for key in program})
+        unresolved = translator.get_unresolved_calls()
+        if unresolved:
+            return ["%s: %s is not defined, called by %s" %
+                    (args.asm, function, ", ".join(callers))
+                    for function, callers in sorted(unresolved.items())]
+        lines = translator.translate()
+        with open(args.asm, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        print("Wrote %s (%d instructions)" %
+              (args.asm, sum(not line.startswith("(") for line in lines)))
+        return []
+    for source in sources:
+        writer = VMWriter(output_path(source))
+        writer.write_commands(optimizer.get_commands(source))
+        writer.close()
+    return []
+
+
+def optimize_program(optimizer, args, stats):
+    """
+    Applies the whole-program optimizations, inlining and dead function
+    elimination.
+    :param optimizer: The ProgramOptimizer of the program
+    :param args: The parsed command line arguments
+    :param stats: A dictionary to add the optimization statistics into
+    """
+    if args.inline_budget > 0:
+        peephole = None
+        if OPT_PEEPHOLE in engine_settings(args)["optimizations"]:
+            peephole = PeepholeOptimizer()
+        inlined = optimizer.inline_functions(args.inline_budget, peephole)
+        stats["inline.functions"] = len(inlined)
+        stats["inline.calls"] = sum(inlined.values())
+        if peephole is not None:
+            merge_stats(stats, {OPT_PEEPHOLE + "." + rule: hits for rule, hits
+                                in peephole.get_hits().items()})
+    removed = optimizer.eliminate_dead_functions()
+    stats["dead-functions.removed"] = len(removed)
+    stats["dead-functions.bytes"] = sum(size for name, size in removed)
+    if args.stats:
+        for name, size in removed:
+            print("Removed %s (%d bytes)" % (name, size))
+    print("Dead code: removed %d functions, %d bytes" %
+          (len(removed), stats["dead-functions.bytes"]))
+
+
+def open_cache(args, caches=None):
+    """
+    :param args: The parsed command line arguments
+    :param caches: A dictionary of the build caches kept between builds
+    by a long running process, or None
+    :return: The build cache selected by the arguments, ready for a build
+    """
+    directory = cache_directory(args)
+    if caches is None:
+        return BuildCache(directory, cache_salt(args))
+    key = (directory, cache_salt(args))
+    if key in caches:
+        caches[key].start_build()
+    else:
+        caches[key] = BuildCache(*key)
+    return caches[key]
+
+
+def build(sources, args, stats, records, signatures, caches=None):
+    """
+    Compiles the sources whose outputs are missing or stale, keeping the
+    build cache up to date.
+    :param sources: The .jack files to build
+    :param args: The parsed command line arguments
+    :param stats: A dictionary to add the optimization statistics into
+    :param records: A list to add the profile records of the compiled
+    files into
+    :param signatures: The SignatureIndex of the program
+    :param caches: A dictionary of the build caches kept between builds
+    by a long running process, or None
+    :return: A list of error descriptions
+    """
+    settings = build_settings(args, signatures)
+    profile = args.profile is not None
+    if args.no_cache:
+        results = compile_all(sources, args.jobs, settings, compile_file,
+                              profile, args.profile_dump)
+        for error, file_stats, record in results:
+            merge_stats(stats, file_stats)
+            if record is not None:
+                records.append(record)
+        return [error for error, file_stats, record in results
+                if error is not None]
+    cache = open_cache(args, caches)
+    if args.force:
+        cache.clear()
+    stale = [source for source in sources
+             if not cache.is_fresh(source, output_path(source),
+                                   signatures.context(source))]
+    errors = []
+    results = compile_all(stale, args.jobs, settings, compile_file, profile,
+                          args.profile_dump)
+    for source, (error, file_stats, record) in zip(stale, results):
+        merge_stats(stats, file_stats)
+        if record is not None:
+            records.append(record)
+        if error is None:
+            cache.record(source, output_path(source),
+                         signatures.context(source))
+        else:
+            cache.forget(source)
+            errors.append(error)
+    cache.save()
+    print(cache.report())
+    return errors
+
+
+def profile_totals(records):
+    """
+    :param records: Profile records of compiled files
+    :return: A record of the sums of their counts and times, with the
+    largest peak memory of a single file
+    """
+    total = {"file": "total", "peak_memory": 0}
+    for record in records:
+        for name in ("tokens", "commands", "total") + PROFILE_PHASES:
+            total[name] = total.get(name, 0) + record[name]
+        total["peak_memory"] = max(total["peak_memory"],
+                                   record["peak_memory"])
+    return total
+
+
+def format_profile(records):
+    """
+    :param records: Profile records of compiled files
+    :return: The records as a table, slowest file first, followed by
+    their totals
+    """
+    rows = ["%-24s %8s %8s" % ("file", "tokens", "commands") +
+            "".join(" %9s" % phase for phase in PROFILE_PHASES + ("total",)) +
+            " %10s" % "peak"]
+    for record in sorted(records, key=lambda record: -record["total"]) + \
+            [profile_totals(records)]:
+        rows.append("%-24s %8d %8d" % (os.path.basename(record["file"]),
+                                       record.get("tokens", 0),
+                                       record.get("commands", 0)) +
+                    "".join(" %7.1fms" % (record.get(phase, 0) * 1000)
+                            for phase in PROFILE_PHASES + ("total",)) +
+                    " %8.0fKB" % (record["peak_memory"] / 1024))
+    return "\n".join(rows)
+
+
+def write_profile(records, path):
+    """
+    Writes profile records as JSON.
+    :param records: Profile records of compiled files
+    :param path: The file to write
+    """
+    with open(path, "w") as file:
+        json.dump({"files": records, "total": profile_totals(records)},
+                  file, indent=2, sort_keys=True)
+
+
+def report_sizes(outputs, args):
+    """
+    Prints the size report of a program, with the differences from the
+    baseline report or else from the report file's previous content, and
+    writes the new report to the report file.
+    :param outputs: A dictionary from the files of the program to their
+    final VM command records
+    :param args: The parsed command line arguments
+    """
+    costs = dict(HACK_COSTS)
+    if args.size_costs:
+        with open(args.size_costs, "r") as file:
+            costs.update(json.load(file))
+    report = SizeReport(costs)
+    for commands in outputs.values():
+        report.add_commands(commands)
+    previous = None
+    try:
+        previous = SizeReport.load(args.size_baseline or args.size_report)
+    except (OSError, ValueError, KeyError, TypeError):
+        if args.size_baseline:
+            print("Cannot read the size baseline %s" % args.size_baseline)
+    print(report.format(previous))
+    report.save(args.size_report)
+
+
+def parse_args(argv):
+    """
+    :param argv: The command line arguments, without the program name
+    :return: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog="JackCompiler",
+                                     description="Compiles Jack source "
+                                                 "files into VM code.")
+    parser.add_argument("path", help="a .jack file or a directory of "
+                                     ".jack files, or %s to read a bundle "
+                                     "from the standard input" % STREAM_NAME)
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="number of files to compile in parallel "
+                             "(default: the number of CPUs, or 1 when "
+                             "served by CompileServer)")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="apply the standard optimizations: %s" %
+                             ", ".join(STANDARD_OPTIMIZATIONS))
+    parser.add_argument("--stats", action="store_true",
+                        help="print what the optimizations did")
+    parser.add_argument("-W", "--whole-program", action="store_true",
+                        help="optimize all the classes together as one "
+                             "program: inline small functions and remove "
+                             "the functions that cannot be reached from "
+                             "Main.main or Sys.init")
+    parser.add_argument("-S", "--asm", nargs="?", const="", metavar="FILE",
+                        help="translate the whole program to a single Hack "
+                             "assembly file instead of .vm files (default "
+                             "FILE: <directory>/<directory>%s)" % ASM_SUFFIX)
+    parser.add_argument("--inline-budget", type=int,
+                        default=DEFAULT_INLINE_BUDGET, metavar="N",
+                        help="with -W, inline functions of at most N "
+                             "commands; 0 disables inlining (default: %d)"
+                        % DEFAULT_INLINE_BUDGET)
+    parser.add_argument("--pool-strings", action="store_true",
+                        help="build each distinct string literal of a class "
+                             "once and reuse it (literals are then shared, "
+                             "so they must not be modified)")
+    parser.add_argument("--strength-threshold", type=int,
+                        default=DEFAULT_STRENGTH_THRESHOLD, metavar="N",
+                        help="longest inline command sequence that may "
+                             "replace a multiplication by a constant "
+                             "(default: %d)" % DEFAULT_STRENGTH_THRESHOLD)
+    parser.add_argument("--index", metavar="FILE",
+                        help="also check calls against the signatures "
+                             "saved in FILE, e.g. of the OS classes")
+    parser.add_argument("--write-index", metavar="FILE",
+                        help="save the signatures of the program's "
+                             "classes to FILE")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="recompile every file, ignoring the build "
+                             "cache")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="neither read nor update the build cache")
+    parser.add_argument("--cache-dir",
+                        help="directory of the build cache (default: %s "
+                             "next to the sources)" % CACHE_DIR_NAME)
+    parser.add_argument("--bundle", action="store_true",
+                        help="the path is a bundle: the sources of any "
+                             "number of classes, one after the other")
+    parser.add_argument("-o", "--output", default=STREAM_NAME,
+                        metavar="FILE",
+                        help="where a bundle's VM code is written, framed "
+                             "per class, or as a zip archive if FILE ends "
+                             "with .zip (default: the standard output)")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running, and rebuild whenever the "
+                             "sources change")
+    parser.add_argument("--profile", nargs="?", const=PROFILE_FILE_NAME,
+                        metavar="FILE",
+                        help="measure the phases, tokens, commands and peak "
+                             "memory of every compiled file, print them and "
+                             "write them as JSON to FILE (default: %s)"
+                             % PROFILE_FILE_NAME)
+    parser.add_argument("--profile-dump", metavar="DIR",
+                        help="with --profile, also write the cProfile "
+                             "statistics of every file to DIR/<class>%s"
+                             % PROFILE_SUFFIX)
+    parser.add_argument("--size-report", nargs="?",
+                        const=SIZE_REPORT_FILE_NAME, metavar="FILE",
+                        help="print the VM commands and the estimated Hack "
+                             "instructions of every class and function, "
+                             "with the changes since the last report, and "
+                             "write them as JSON to FILE (default: %s)"
+                             % SIZE_REPORT_FILE_NAME)
+    parser.add_argument("--size-costs", metavar="FILE",
+                        help="a JSON object of the Hack instructions of VM "
+                             "commands, replacing the default estimates, "
+                             "e.g. {\"call\": 9, \"return\": 2}")
+    parser.add_argument("--size-baseline", metavar="FILE",
+                        help="compare the size report with the one in FILE "
+                             "instead of the previous one")
+    args = parser.parse_args(argv)
+    args.bundle = args.bundle or args.path == STREAM_NAME
+    if args.bundle and args.watch:
+        parser.error("--watch cannot be used with a bundle")
+    if args.asm == "":
+        args.asm = args.output if args.bundle else asm_path(args.path)
+    if args.profile_dump and args.profile is None:
+        args.profile = PROFILE_FILE_NAME
+    return args
+
+
+def run_bundle(args, output):
+    """
+    Compiles a bundle, the concatenated sources of many classes read from
+    the standard input or a file, in memory, and writes the outputs of all
+    the classes to a single stream, file or archive (see BundleWriter).
+    :param args: The parsed command line arguments
+    :param output: The stream standing for the standard output
+    :return: A list of error descriptions
+    """
+    if args.path == STREAM_NAME:
+        text = sys.stdin.read()
+    else:
+        with open(args.path, "r") as file:
+            text = file.read()
+    signatures = SignatureIndex() if args.index is None else \
+        SignatureIndex.load(args.index)
+    items = []
+    for line, class_text in split_classes(text):
+        declarations = scan_file(args.path, class_text)
+        if declarations is None:
+            class_name = "<line %d>" % line
         else:
-            name = sys.argv[1].rsplit(SUFFIX_DELIMITER, 1)[0]
-            output = name + VM_SUFFIX
-            engine = CompilationEngine(sys.argv[1], output)
-            engine.compile_class()
+            class_name, subroutines, references = declarations
+            signatures.add_class(class_name, subroutines)
+        items.append((args.path, class_name, line, class_text))
+    if args.write_index:
+        signatures.save(args.write_index)
+    settings = dict(engine_settings(args), signatures=signatures)
+    results = compile_all(items, args.jobs, settings, compile_bundle_class,
+                          args.profile is not None, args.profile_dump)
+    errors = [error for error, file_stats, commands, record in results
+              if error is not None]
+    if errors and (args.whole_program or args.asm):
+        return errors
+    stats = {}
+    records = []
+    program = {}
+    for item, (error, file_stats, commands, record) in zip(items, results):
+        merge_stats(stats, file_stats)
+        if record is not None:
+            records.append(record)
+        if error is None and item[1] in program:
+            errors.append("%s:%d: class %s is defined twice" %
+                          (args.path, item[2], item[1]))
+        elif error is None and commands:
+            program[item[1]] = commands
+    optimizer = ProgramOptimizer(program)
+    if args.whole_program:
+        optimize_program(optimizer, args, stats)
+    if args.asm:
+        lines = HackTranslator({name: optimizer.get_commands(name)
+                                for name in program}).translate()
+        if args.asm == STREAM_NAME:
+            output.write("\n".join(lines) + "\n")
+        else:
+            with open(args.asm, "w") as file:
+                file.write("\n".join(lines) + "\n")
+    else:
+        writer = BundleWriter(output if args.output == STREAM_NAME
+                              else args.output)
+        for name in program:
+            vm_writer = VMWriter()
+            vm_writer.write_commands(optimizer.get_commands(name))
+            writer.write(name + VM_SUFFIX, vm_writer.get_text())
+        writer.close()
+    if args.stats:
+        for name in sorted(stats):
+            print("%s: %d" % (name, stats[name]))
+    if args.profile is not None:
+        print(format_profile(records))
+        write_profile(records, args.profile)
+    if args.size_report is not None and not errors:
+        report_sizes({name: optimizer.get_commands(name)
+                      for name in program}, args)
+    return errors
+
+
+def file_stamp(source):
+    """
+    :param source: Path of a file
+    :return: Its size and modification time, or None if it is missing
+    """
+    try:
+        stat = os.stat(source)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def source_stamps(path):
+    """
+    :param path: A .jack file or a directory of .jack files
+    :return: A dictionary from every .jack file to its size and
+    modification time
+    """
+    stamps = {}
+    for source in find_sources(path):
+        stamp = file_stamp(source)
+        if stamp is not None:
+            stamps[source] = stamp
+    return stamps
+
+
+def class_interface(source):
+    """
+    Parses a class to find what other classes may depend on, and what it
+    depends on.
+    :param source: Path of a .jack file
+    :return: A triplet of the class's name, its signature, a set of the
+    kind, name and number of arguments of every subroutine, and the set of
+    the other classes it calls; or None if the class does not parse
+    """
+    try:
+        class_dec = CompilationEngine(source, None).parse_class()
+    except Exception:
+        return None
+    if class_dec is None:
+        return None
+    signature = frozenset((subroutine.kind, subroutine.name,
+                           len(subroutine.arguments))
+                          for subroutine in class_dec.subroutines)
+    references = set()
+    pending = [class_dec]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, Call):
+            references.add(node.function.split(SUFFIX_DELIMITER)[0])
+        pending.extend(node.children())
+    references.discard(class_dec.name)
+    return class_dec.name, signature, references
+
+
+def run(sources, args, caches=None):
+    """
+    Builds the sources as the arguments say and prints the results.
+    :param sources: The .jack files to compile
+    :param args: The parsed command line arguments
+    :param caches: A dictionary of the build caches kept between builds
+    by a long running process, or None
+    :return: The exit status
+    """
+    stats = {}
+    records = []
+    if args.profile_dump:
+        os.makedirs(args.profile_dump, exist_ok=True)
+    scans = None
+    if caches is not None:
+        scans = caches.setdefault(("scans", os.path.abspath(args.path)), {})
+    signatures = index_sources(find_sources(args.path), args.jobs,
+                               args.index, open_parse_cache(args), scans)
+    if args.write_index:
+        signatures.save(args.write_index)
+    outputs = {}
+    if args.whole_program or args.asm:
+        errors = build_program(sources, args, stats, records, signatures,
+                               outputs)
+    else:
+        errors = build(sources, args, stats, records, signatures, caches)
+        if args.size_report is not None:
+            for source in find_sources(args.path):
+                if os.path.exists(output_path(source)):
+                    with open(output_path(source), "r") as file:
+                        outputs[source] = parse_commands(file.read())
+    if args.stats:
+        for name in sorted(stats):
+            print("%s: %d" % (name, stats[name]))
+    if args.profile is not None:
+        print(format_profile(records))
+        write_profile(records, args.profile)
+    if args.size_report is not None and not errors:
+        report_sizes(outputs, args)
+    for error in errors:
+        print(error, file=sys.stderr)
+    return 1 if errors else 0
+
+
+def watch(args, caches=None):
+    """
+    Builds the sources, then keeps polling them and rebuilding after each
+    change, until interrupted. A burst of saves is built once, after the
+    sources have stayed unchanged for DEBOUNCE_INTERVAL. Only the changed
+    classes are compiled again, along with the classes that call a class
+    whose signature changed; with -W every class is.
+    :param args: The parsed command line arguments
+    :param caches: A dictionary of the build caches to keep between
+    builds, or None
+    :return: The exit status of the last build
+    """
+    caches = {} if caches is None else caches
+    stamps = {}
+    interfaces = {}
+    status = 0
+    try:
+        while True:
+            current = source_stamps(args.path)
+            if current == stamps:
+                time.sleep(WATCH_INTERVAL)
+                continue
+            time.sleep(DEBOUNCE_INTERVAL)
+            if source_stamps(args.path) != current:
+                continue
+            changed = {source for source in current
+                       if current[source] != stamps.get(source)}
+            affected = set()
+            for source in changed | (set(stamps) - set(current)):
+                old = interfaces.pop(source, None)
+                if source in current:
+                    interfaces[source] = class_interface(source)
+                new = interfaces.get(source)
+                if old is not None and (new is None or old[:2] != new[:2]):
+                    affected.add(old[0])
+                if new is not None and (old is None or old[:2] != new[:2]):
+                    affected.add(new[0])
+            dependents = {source for source, interface in interfaces.items()
+                          if interface is not None and
+                          interface[2] & affected}
+            first = not stamps
+            stamps = current
+            if args.whole_program or args.asm or first:
+                sources = sorted(current)
+            else:
+                sources = sorted(changed | dependents)
+            if sources:
+                status = run(sources, args, caches)
+            print("Watching %s for changes..." % args.path)
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        return status
+
+
+def main(argv=None, caches=None):
+    """
+    Runs the compiler from the command line.
+    :param argv: The command line arguments, without the program name
+    :param caches: A dictionary of the build caches kept between builds
+    by a long running process (see CompileServer), or None
+    :return: The exit status
+    """
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.jobs is None:
+        # A server compiles in its own process, where its caches are
+        args.jobs = 1 if caches is not None else os.cpu_count() or 1
+    if args.bundle:
+        output = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            errors = run_bundle(args, output)
+        for error in errors:
+            print(error, file=sys.stderr)
+        return 1 if errors else 0
+    if args.watch:
+        return watch(args, caches)
+    return run(find_sources(args.path), args, caches)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
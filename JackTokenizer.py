@@ -1,3 +1,8 @@
+import re
+import struct
+from array import array
+from bisect import bisect_right
+
 TYPES_DIC = {"KEYWORD": 1, "SYMBOL": 2, "IDENTIFIER": 3,
              "INT_CONST": 4, "STRING_CONST": 5, "CLASS": "class",
              "METHOD": "method", "FUNCTION": "function",
@@ -8,6 +13,27 @@ TYPES_DIC = {"KEYWORD": 1, "SYMBOL": 2, "IDENTIFIER": 3,
              "WHILE": "while", "RETURN": "return", "TRUE": "true",
              "FALSE": "false", "NULL": "null", "THIS": "this"}
 
+# One alternative per token class, whitespace and comments first. The group
+# index of a match (lastindex) tells the class of the token.
+TOKEN_REGEX = re.compile(r"""
+    (\s+|//[^\n]*|/\*.*?\*/)          # 1: whitespace and comments
+  | (\d+)                             # 2: integer constant
+  | ("[^"\n]*")                       # 3: string constant
+  | ([A-Za-z_]\w*)                    # 4: keyword or identifier
+  | ([{}()\[\].,;+\-*&|<>=~]|/(?!\*))  # 5: symbol
+  | (.)                               # 6: anything else is an error
+""", re.S | re.X)
+SKIP_GROUP = 1
+WORD_GROUP = 4
+ERROR_GROUP = 6
+GROUP_TYPES = (None, None, TYPES_DIC["INT_CONST"], TYPES_DIC["STRING_CONST"],
+               TYPES_DIC["IDENTIFIER"], TYPES_DIC["SYMBOL"])
+# Serialized tokens: the header, the kinds, the offsets, the index of every
+# token's text in the string table, and the table. No token contains a
+# newline, so the table is stored as newline-separated text.
+CACHE_HEADER = struct.Struct("<4sII")
+CACHE_MAGIC = b"JTK1"
+
 
 class JackTokenizer:
     KEYWORDS = {"class", "constructor", "function", "method",
@@ -17,68 +43,128 @@ class JackTokenizer:
     SYMBOLS = {"{", "}", "(", ")", ".", ",", ";", "+", "-", "*", "/",
                "&", "|", "<", ">", "=", "~", "[", "]"}
 
-    def __init__(self, in_file):
-        self.__str_file = ""
+    def __init__(self, in_file, source=None, cache=None):
+        """
+        :param in_file: Path of the file to tokenize
+        :param source: The Jack source text to tokenize instead of reading
+        in_file, which is then only used to name the input in errors
+        :param cache: A ParseCache to load the tokens from, and to store
+        them in when they are not cached yet, or None
+        """
+        self.__in_file = in_file
         self.__token_counter = -1
         self.__current_token = None
-        with open(in_file, "r") as file:
-            for line in file:
-                self.__str_file += line
-        self.__tokens_list = self.__tokenize()
+        self.__current_type = None
+        self.__line_starts = None
+        if source is None:
+            with open(in_file, "r") as file:
+                source = file.read()
+        self.__str_file = source
+        self.__types = array("B")
+        self.__tokens_list = []
+        self.__positions = array("I")
+        data = None
+        if cache is not None:
+            data = cache.load_tokens(in_file, source)
+        if data is None or not self.__restore(data):
+            self.__tokenize()
+            if cache is not None:
+                cache.store_tokens(in_file, source, self.__dump())
 
     def __tokenize(self):
         """
-        Splits the file into tokens.
-        :return: a list of all the tokens in the input file.
-        """
-        token_list = []
-        buffer = ""
-        in_string = False
-        comment1 = False
-        comment2 = False
-        comment_flag = ""
-        for c in self.__str_file:
-            if not in_string:
-                if c == '/' or c == "*":
-                    comment_flag += c
-                else:
-                    comment_flag = ""
-            if comment_flag == "/*" and not comment1 and not comment2:
-                comment1 = True
-                comment_flag = ""
-                del(token_list[-1:])
-            if comment_flag[-2:] == "*/" and comment1:
-                comment1 = False
-                comment_flag = ""
-                continue
-            if comment_flag == "//" and not comment1 and not comment2:
-                if not comment2:
-                    del (token_list[-1:])
-                comment2 = True
-                comment_flag = ""
-            if c == "\n" and comment2:
-                comment2 = False
-                comment_flag = ""
+        Splits the file into tokens in a single regex scan, classifying
+        each token once. The token kinds, values and source offsets are
+        stored in parallel arrays.
+        """
+        types = self.__types
+        tokens = self.__tokens_list
+        positions = self.__positions
+        keywords = self.KEYWORDS
+        keyword_type = TYPES_DIC["KEYWORD"]
+        for match in TOKEN_REGEX.finditer(self.__str_file):
+            group = match.lastindex
+            if group == SKIP_GROUP:
                 continue
-            if not comment1 and not comment2:
-                if c == '"':
-                    if in_string:
-                        buffer += c
-                        in_string = False
-                    else:
-                        in_string = True
-                        buffer += c
-                elif in_string:
-                    buffer += c
-                elif c == " " or c == "\t" or c == "\r" or c == "\n" or c in self.SYMBOLS:
-                    if buffer != "":
-                        token_list.append(buffer)
-                    if c in self.SYMBOLS:
-                        token_list.append(c)
-                    buffer = ""
-                else:
-                    buffer += c
-        return token_list
+            if group == ERROR_GROUP:
+                self.__raise_error(match.start())
+            value = match.group(group)
+            if group == WORD_GROUP and value in keywords:
+                types.append(keyword_type)
+            else:
+                types.append(GROUP_TYPES[group])
+            tokens.append(value)
+            positions.append(match.start())
+
+    def __dump(self):
+        """
+        :return: The tokens as bytes, with every distinct token text
+        stored once
+        """
+        table = {}
+        indexes = array("I", [table.setdefault(token, len(table))
+                              for token in self.__tokens_list])
+        return b"".join((CACHE_HEADER.pack(CACHE_MAGIC, len(indexes),
+                                           len(table)),
+                         self.__types.tobytes(), self.__positions.tobytes(),
+                         indexes.tobytes(), "\n".join(table).encode()))
+
+    def __restore(self, data):
+        """
+        Loads tokens serialized by __dump.
+        :param data: The serialized tokens
+        :return: Whether the data was valid
+        """
+        try:
+            magic, count, n_strings = CACHE_HEADER.unpack_from(data)
+            if magic != CACHE_MAGIC:
+                return False
+            start = CACHE_HEADER.size
+            types = array("B", data[start:start + count])
+            start += count
+            positions = array("I")
+            end = start + count * positions.itemsize
+            positions.frombytes(data[start:end])
+            indexes = array("I")
+            start, end = end, end + count * indexes.itemsize
+            indexes.frombytes(data[start:end])
+            table = data[end:].decode().split("\n") if n_strings else []
+            if len(types) != count or len(positions) != count or \
+                    len(indexes) != count or len(table) != n_strings:
+                return False
+            tokens = [table[index] for index in indexes]
+        except (struct.error, ValueError, UnicodeDecodeError, IndexError):
+            return False
+        self.__types = types
+        self.__positions = positions
+        self.__tokens_list = tokens
+        return True
+
+    def __line_of(self, offset):
+        """
+        :param offset: A character offset in the input file
+        :return: The 1-based line number of the given offset
+        """
+        if self.__line_starts is None:
+            self.__line_starts = [0] + [match.end() for match in
+                                        re.finditer("\n", self.__str_file)]
+        return bisect_right(self.__line_starts, offset)
+
+    def __raise_error(self, offset):
+        """
+        Raises a SyntaxError for an unexpected character in the input.
+        :param offset: The character offset of the unexpected character
+        """
+        line = self.__line_of(offset)
+        text = self.__str_file.splitlines()[line - 1]
+        column = offset - self.__line_starts[line - 1] + 1
+        if self.__str_file.startswith("/*", offset):
+            message = "unterminated comment"
+        elif self.__str_file[offset] == '"':
+            message = "unterminated string constant"
+        else:
+            message = "unexpected character " + repr(self.__str_file[offset])
+        raise SyntaxError(message, (self.__in_file, line, column, text))
 
     def has_more_tokens(self):
         """
@@ -88,6 +174,18 @@ class JackTokenizer:
         """
         return self.__token_counter < len(self.__tokens_list)-1
 
+    def get_source(self):
+        """
+        :return: The source text being tokenized
+        """
+        return self.__str_file
+
+    def count_tokens(self):
+        """
+        :return: The number of tokens in the input.
+        """
+        return len(self.__tokens_list)
+
     def peek(self):
         """
         :return: the next token after the current token (without
@@ -102,69 +200,22 @@ class JackTokenizer:
         """
         self.__token_counter += 1
         self.__current_token = self.__tokens_list[self.__token_counter]
+        self.__current_type = self.__types[self.__token_counter]
 
     def token_type(self):
         """
         :return: the type of the current token
         """
-        if self.__current_token in self.KEYWORDS:
-            return TYPES_DIC["KEYWORD"]
-        elif self.__current_token in self.SYMBOLS:
-            return TYPES_DIC["SYMBOL"]
-        elif self.__current_token.isdigit():
-            return TYPES_DIC["INT_CONST"]
-        elif self.__current_token[0] == '"':
-            return TYPES_DIC["STRING_CONST"]
-        else:
-            return TYPES_DIC["IDENTIFIER"]
+        return self.__current_type
 
     def keyword(self):
         """
         should be called only if token_type() is KEYWORD
         :return: the keyword which is the current token.
         """
-        if self.__current_token == "class":
-            return TYPES_DIC["CLASS"]
-        elif self.__current_token == "method":
-            return TYPES_DIC["METHOD"]
-        elif self.__current_token == "function":
-            return TYPES_DIC["FUNCTION"]
-        elif self.__current_token == "constructor":
-            return TYPES_DIC["CONSTRUCTOR"]
-        elif self.__current_token == "int":
-            return TYPES_DIC["INT"]
-        elif self.__current_token == "boolean":
-            return TYPES_DIC["BOOLEAN"]
-        elif self.__current_token == "char":
-            return TYPES_DIC["CHAR"]
-        elif self.__current_token == "void":
-            return TYPES_DIC["VOID"]
-        elif self.__current_token == "var":
-            return TYPES_DIC["VAR"]
-        elif self.__current_token == "static":
-            return TYPES_DIC["STATIC"]
-        elif self.__current_token == "field":
-            return TYPES_DIC["FIELD"]
-        elif self.__current_token == "let":
-            return TYPES_DIC["LET"]
-        elif self.__current_token == "do":
-            return TYPES_DIC["DO"]
-        elif self.__current_token == "if":
-            return TYPES_DIC["IF"]
-        elif self.__current_token == "else":
-            return TYPES_DIC["ELSE"]
-        elif self.__current_token == "while":
-            return TYPES_DIC["WHILE"]
-        elif self.__current_token == "return":
-            return TYPES_DIC["RETURN"]
-        elif self.__current_token == "true":
-            return TYPES_DIC["TRUE"]
-        elif self.__current_token == "false":
-            return TYPES_DIC["FALSE"]
-        elif self.__current_token == "null":
-            return TYPES_DIC["NULL"]
-        elif self.__current_token == "this":
-            return TYPES_DIC["THIS"]
+        if self.__current_type == TYPES_DIC["KEYWORD"]:
+            return self.__current_token
+        return None
 
     def symbol(self):
         """
@@ -208,3 +259,10 @@ class JackTokenizer:
         """
         self.__token_counter = n
         self.__current_token = self.__tokens_list[n]
+        self.__current_type = self.__types[n]
+
+    def line_number(self):
+        """
+        :return: The line in the input file where the current token starts
+        """
+        return self.__line_of(self.__positions[self.__token_counter])
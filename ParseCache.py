@@ -0,0 +1,160 @@
+import os
+import pickle
+import hashlib
+CACHE_SUBDIR = "parse"
+TOKENS_SUFFIX = ".tokens"
+TREE_SUFFIX = ".tree"
+SCAN_SUFFIX = ".scan"
+KEY_SIZE = hashlib.sha256().digest_size
+
+
+class ParseCache:
+    """
+    Keeps the tokens and the syntax tree of every source on disk, so that
+    a build whose options changed, but whose sources did not, neither
+    tokenizes nor parses them again. The declarations scanned for the
+    SignatureIndex are kept too. Each source has one file of each kind,
+    named after its path and overwritten when it changes.
+    A file starts with its key, a hash of the source's content and the
+    compiler version; the key of a tree also covers the signatures the
+    calls were checked against.
+    """
+
+    def __init__(self, directory, version):
+        """
+        :param directory: The build cache directory, which holds the parse
+        cache in its CACHE_SUBDIR subdirectory
+        :param version: A string identifying the compiler version
+        """
+        self.__directory = os.path.join(directory, CACHE_SUBDIR)
+        self.__version = version.encode()
+
+    def __path(self, source, suffix):
+        """
+        :param source: Path of a source file
+        :param suffix: TOKENS_SUFFIX, TREE_SUFFIX or SCAN_SUFFIX
+        :return: The path of the source's cache file
+        """
+        name = hashlib.sha256(os.path.abspath(source).encode()).hexdigest()
+        return os.path.join(self.__directory, name[:32] + suffix)
+
+    def __key(self, text, *salts):
+        """
+        :param text: The source text
+        :param salts: Other byte strings the key depends on
+        :return: The key of the text
+        """
+        digest = hashlib.sha256(self.__version)
+        for salt in salts:
+            digest.update(salt)
+        digest.update(text.encode())
+        return digest.digest()
+
+    def __read(self, path, key):
+        """
+        :param path: A cache file
+        :param key: The key the file must have
+        :return: The data stored in the file, or None if it is missing or
+        has another key
+        """
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        if data[:KEY_SIZE] != key:
+            return None
+        return data[KEY_SIZE:]
+
+    def __write(self, path, key, data):
+        """
+        Replaces a cache file atomically, so that parallel builds never
+        read a partial file. Failures are ignored, since the cache is only
+        an optimization.
+        :param path: A cache file
+        :param key: The key of the data
+        :param data: The bytes to store
+        """
+        temporary = "%s.%d" % (path, os.getpid())
+        try:
+            os.makedirs(self.__directory, exist_ok=True)
+            with open(temporary, "wb") as file:
+                file.write(key + data)
+            os.replace(temporary, path)
+        except OSError:
+            pass
+
+    def load_tokens(self, source, text):
+        """
+        :param source: Path of a source file
+        :param text: Its current content
+        :return: The tokens stored for the content by store_tokens, or None
+        """
+        return self.__read(self.__path(source, TOKENS_SUFFIX),
+                           self.__key(text))
+
+    def store_tokens(self, source, text, data):
+        """
+        :param source: Path of a source file
+        :param text: Its content
+        :param data: The serialized tokens of the content
+        """
+        self.__write(self.__path(source, TOKENS_SUFFIX), self.__key(text),
+                     data)
+
+    def load_scan(self, source, text):
+        """
+        :param source: Path of a source file
+        :param text: Its current content
+        :return: The declarations stored for the content by store_scan, or
+        None
+        """
+        data = self.__read(self.__path(source, SCAN_SUFFIX),
+                           self.__key(text))
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            return None
+
+    def store_scan(self, source, text, declarations):
+        """
+        :param source: Path of a source file
+        :param text: Its content
+        :param declarations: The declarations scanned from the content (see
+        SignatureIndex.scan_class)
+        """
+        self.__write(self.__path(source, SCAN_SUFFIX), self.__key(text),
+                     pickle.dumps(declarations, pickle.HIGHEST_PROTOCOL))
+
+    def load_tree(self, source, text, context=""):
+        """
+        :param source: Path of a source file
+        :param text: Its current content
+        :param context: A string identifying everything else the syntax
+        tree depends on, e.g. SignatureIndex.context of the source
+        :return: A new copy of the ClassDec stored for the content and the
+        context by store_tree, or None
+        """
+        data = self.__read(self.__path(source, TREE_SUFFIX),
+                           self.__key(text, context.encode()))
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            return None
+
+    def store_tree(self, source, text, class_dec, context=""):
+        """
+        :param source: Path of a source file
+        :param text: Its content
+        :param class_dec: The ClassDec parsed from the content, before any
+        optimization pass changed it
+        :param context: The context it was parsed in, as given to
+        load_tree
+        """
+        self.__write(self.__path(source, TREE_SUFFIX),
+                     self.__key(text, context.encode()),
+                     pickle.dumps(class_dec, pickle.HIGHEST_PROTOCOL))
@@ -0,0 +1,37 @@
+class PassManager:
+    """
+    Runs a sequence of passes over the syntax tree of a class (see
+    SyntaxTree) between parsing and code generation. A pass is an object
+    with a run(class_dec) method, which may rewrite the tree in place, and
+    a get_stats() method returning a dictionary of counters.
+    """
+
+    def __init__(self):
+        self.__passes = []
+
+    def register(self, name, tree_pass):
+        """
+        Adds a pass to run after the ones already registered.
+        :param name: The pass's name, prefixed to its statistics
+        :param tree_pass: The pass object
+        """
+        self.__passes.append((name, tree_pass))
+
+    def run(self, class_dec):
+        """
+        Runs all the registered passes, in order, over a class.
+        :param class_dec: The ClassDec node of the class
+        """
+        for name, tree_pass in self.__passes:
+            tree_pass.run(class_dec)
+
+    def get_stats(self):
+        """
+        :return: A dictionary of the counters of all the passes, named
+        pass.counter
+        """
+        stats = {}
+        for name, tree_pass in self.__passes:
+            for counter, count in tree_pass.get_stats().items():
+                stats[name + "." + counter] = count
+        return stats
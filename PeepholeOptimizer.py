@@ -0,0 +1,269 @@
+JUMPS = {"goto", "if-goto"}
+TERMINATORS = {"goto", "return"}
+SIMPLE_SEGMENTS = {"constant", "argument", "local", "static", "this"}
+TRUE_COMMANDS = [("push", "constant", 1), ("neg",)]
+COMPARISONS = {("lt",), ("gt",), ("eq",)}  # Always push true or false
+
+
+class PeepholeOptimizer:
+    """
+    Rewrites windows of VM command records (see VMWriter) into cheaper
+    equivalent sequences. Every rule of RULES is tried at every position of
+    a function's body; passes are repeated until no rule applies. The code
+    is assumed to come from CompilationEngine, which never reads a temp
+    variable before writing it in the same basic block.
+    """
+    RULES = ("push-pop-same", "store-array-directly", "drop-dead-temp",
+             "reload-dead-temp", "double-negation", "constant-branch",
+             "invert-branch", "jump-to-next", "thread-jump",
+             "unreachable-code", "unused-label")
+
+    def __init__(self):
+        self.__hits = dict.fromkeys(self.RULES, 0)
+        self.__references = {}
+        self.__targets = {}
+
+    def get_hits(self):
+        """
+        :return: A dictionary of how many times each rule was applied
+        """
+        return self.__hits
+
+    def optimize(self, commands):
+        """
+        :param commands: A list of VM command records
+        :return: An optimized list of VM command records
+        """
+        optimized = []
+        body = []
+        for command in commands:
+            if command[0] == "function":
+                optimized.extend(self.__optimize_body(body))
+                optimized.append(command)
+                body = []
+            else:
+                body.append(command)
+        optimized.extend(self.__optimize_body(body))
+        return optimized
+
+    def __optimize_body(self, body):
+        """
+        Applies the rules to the body of a single function until none of
+        them matches.
+        :param body: The commands of the function, without its declaration
+        :return: The optimized commands
+        """
+        rules = [getattr(self, "_PeepholeOptimizer__" +
+                         name.replace("-", "_")) for name in self.RULES]
+        changed = True
+        while changed:
+            changed = False
+            self.__scan_labels(body)
+            result = []
+            i = 0
+            while i < len(body):
+                for name, rule in zip(self.RULES, rules):
+                    match = rule(body, i)
+                    if match is not None:
+                        length, replacement = match
+                        result.extend(replacement)
+                        i += length
+                        self.__hits[name] += 1
+                        changed = True
+                        break
+                else:
+                    result.append(body[i])
+                    i += 1
+            body = result
+        return body
+
+    def __scan_labels(self, body):
+        """
+        Counts the references to each label and finds the first command
+        after each label that is not a label itself.
+        :param body: The commands of a function
+        """
+        self.__references = {}
+        self.__targets = {}
+        pending = []
+        for command in body:
+            if command[0] == "label":
+                pending.append(command[1])
+                continue
+            if command[0] in JUMPS:
+                self.__references[command[1]] = \
+                    self.__references.get(command[1], 0) + 1
+            for label in pending:
+                self.__targets[label] = command
+            pending = []
+
+    def __push_pop_same(self, body, i):
+        """
+        push X / pop X -> nothing
+        """
+        if body[i][0] == "push" and body[i][1] != "constant" and \
+                body[i + 1:i + 2] == [("pop",) + body[i][1:]]:
+            return 2, []
+        return None
+
+    def __store_array_directly(self, body, i):
+        """
+        push V / pop temp 0 / pop pointer 1 / push temp 0 / pop that 0 ->
+        pop pointer 1 / push V / pop that 0, when pushing V does not depend
+        on pointer 1
+        """
+        window = body[i:i + 5]
+        if len(window) == 5 and window[0][0] == "push" and \
+                window[0][1] in SIMPLE_SEGMENTS and \
+                window[1:] == [("pop", "temp", 0), ("pop", "pointer", 1),
+                               ("push", "temp", 0), ("pop", "that", 0)]:
+            return 5, [window[2], window[0], window[4]]
+        return None
+
+    @staticmethod
+    def __temp_is_dead(body, start, index):
+        """
+        :param body: The commands of a function
+        :param start: A position in the body
+        :param index: The index of a temp variable
+        :return: True if the temp variable is not read from the position on
+        before it is written again
+        """
+        for command in body[start:]:
+            if command == ("push", "temp", index):
+                return False
+            if command == ("pop", "temp", index) or command[0] in \
+                    ("label", "goto", "if-goto", "call", "return"):
+                return True
+        return True
+
+    def __drop_dead_temp(self, body, i):
+        """
+        push X / pop temp k -> nothing, when temp k is not read before it
+        is written again
+        """
+        if body[i][0] != "push" or i + 1 >= len(body) or \
+                body[i + 1][:2] != ("pop", "temp") or \
+                not self.__temp_is_dead(body, i + 2, body[i + 1][2]):
+            return None
+        return 2, []
+
+    def __reload_dead_temp(self, body, i):
+        """
+        pop temp k / push temp k -> nothing, when temp k is not read
+        afterwards before it is written again
+        """
+        if body[i][:2] != ("pop", "temp") or \
+                body[i + 1:i + 2] != [("push",) + body[i][1:]] or \
+                not self.__temp_is_dead(body, i + 2, body[i][2]):
+            return None
+        return 2, []
+
+    def __double_negation(self, body, i):
+        """
+        not / not -> nothing, neg / neg -> nothing
+        """
+        if body[i] in (("not",), ("neg",)) and body[i + 1:i + 2] == [body[i]]:
+            return 2, []
+        return None
+
+    def __constant_branch(self, body, i):
+        """
+        Branches on a constant condition become unconditional jumps or
+        disappear: push constant 0 / if-goto L -> nothing, true / if-goto L
+        -> goto L, and likewise with a not before the if-goto.
+        """
+        false = [("push", "constant", 0)]
+        for condition, taken in ((false, False), (TRUE_COMMANDS, True),
+                                 (false + [("not",)], True),
+                                 (TRUE_COMMANDS + [("not",)], False)):
+            end = i + len(condition)
+            if body[i:end] == condition and end < len(body) and \
+                    body[end][0] == "if-goto":
+                return len(condition) + 1, \
+                    [("goto", body[end][1])] if taken else []
+        return None
+
+    @staticmethod
+    def __pushes_boolean(body, end):
+        """
+        :param body: The commands of a function
+        :param end: A position in the body
+        :return: True if the commands just before the position push true
+        (-1) or false (0): a comparison, negated any number of times
+        """
+        start = end - 1
+        while start >= 0 and body[start] == ("not",):
+            start -= 1
+        return start >= 0 and body[start] in COMPARISONS
+
+    def __invert_branch(self, body, i):
+        """
+        if-goto A / goto B / label A -> not / if-goto B / label A, and
+        not / if-goto A / goto B / label A -> if-goto B / label A, when
+        the condition is pushed by a comparison: if-goto jumps on any value
+        but 0, so negating the condition only inverts the jump for true
+        and false
+        """
+        if not self.__pushes_boolean(body, i):
+            return None
+        negated = body[i] == ("not",)
+        start = i + 1 if negated else i
+        window = body[start:start + 3]
+        if len(window) == 3 and window[0][0] == "if-goto" and \
+                window[1][0] == "goto" and window[2] == ("label",
+                                                         window[0][1]):
+            jump = [("if-goto", window[1][1]), window[2]]
+            return start - i + 3, jump if negated else [("not",)] + jump
+        return None
+
+    def __jump_to_next(self, body, i):
+        """
+        goto L / label ... / label L -> label ... / label L
+        """
+        if body[i][0] != "goto":
+            return None
+        for command in body[i + 1:]:
+            if command[0] != "label":
+                return None
+            if command[1] == body[i][1]:
+                return 1, []
+        return None
+
+    def __thread_jump(self, body, i):
+        """
+        A jump to a label followed by goto M jumps to M directly.
+        """
+        if body[i][0] not in JUMPS:
+            return None
+        label = body[i][1]
+        seen = {label}
+        target = self.__targets.get(label)
+        while target is not None and target[0] == "goto" and \
+                target[1] not in seen:
+            label = target[1]
+            seen.add(label)
+            target = self.__targets.get(label)
+        if label != body[i][1]:
+            return 1, [(body[i][0], label)]
+        return None
+
+    def __unreachable_code(self, body, i):
+        """
+        Commands between a goto or return and the next label never run.
+        """
+        if body[i][0] in TERMINATORS and i + 1 < len(body) and \
+                body[i + 1][0] != "label":
+            end = i + 1
+            while end < len(body) and body[end][0] != "label":
+                end += 1
+            return end - i, [body[i]]
+        return None
+
+    def __unused_label(self, body, i):
+        """
+        label L -> nothing, when no jump refers to L
+        """
+        if body[i][0] == "label" and body[i][1] not in self.__references:
+            return 1, []
+        return None
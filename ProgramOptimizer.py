@@ -0,0 +1,226 @@
+ENTRY_POINTS = ("Sys.init", "Main.main")
+TEMP_SIZE = 8  # The number of variables of the temp segment
+DEFAULT_INLINE_BUDGET = 8  # The longest function body that is inlined
+METHOD_PROLOGUE = [("push", "argument", 0), ("pop", "pointer", 0)]
+STRAIGHT_LINE_BREAKERS = {"label", "goto", "if-goto", "call", "function",
+                          "return"}
+
+
+def command_size(command):
+    """
+    :param command: A VM command record
+    :return: The number of bytes the command takes in a .vm file
+    """
+    return len(" ".join(map(str, command))) + 1
+
+
+class ProgramOptimizer:
+    """
+    Optimizations over the VM code of all the classes of a program at once.
+    The program is given as a dictionary from a key identifying each
+    compiled file to the list of its VM command records (see VMWriter).
+    """
+
+    def __init__(self, program):
+        """
+        :param program: A dictionary from file keys to command records
+        """
+        self.__program = program
+        self.__functions = {}
+        self.__split_functions()
+
+    def __split_functions(self):
+        """
+        Finds the file key and the commands of every function of the
+        program.
+        """
+        self.__functions = {}
+        for key, commands in self.__program.items():
+            name = None
+            for command in commands:
+                if command[0] == "function":
+                    name = command[1]
+                    self.__functions[name] = (key, [command])
+                elif name is not None:
+                    self.__functions[name][1].append(command)
+
+    def get_commands(self, key):
+        """
+        :param key: A file key
+        :return: The, possibly optimized, command records of the file
+        """
+        return self.__program[key]
+
+    def get_functions(self):
+        """
+        :return: A dictionary from each function's name to the list of its
+        commands, starting with its function command
+        """
+        return {name: commands for name, (key, commands) in
+                self.__functions.items()}
+
+    @staticmethod
+    def __inline_plan(commands, budget):
+        """
+        Checks whether a function can be inlined: its body must be a single
+        basic block of at most budget commands ending with its only
+        return, and, for a method, access its object only through the
+        this segment, which is then rewritten to use the that segment so
+        the caller's this pointer is kept.
+        :param commands: The function's commands, starting with its
+        function command
+        :param budget: The longest body that may be inlined
+        :return: A tuple (number of locals, whether it is a method, body
+        without the prologue and return, whether it uses static variables),
+        or None if the function cannot be inlined
+        """
+        body = commands[1:]
+        if not body or body[-1] != ("return",):
+            return None
+        body = body[:-1]
+        is_method = body[:2] == METHOD_PROLOGUE
+        if is_method:
+            body = body[2:]
+        if len(body) > budget:
+            return None
+        uses_static = False
+        for command in body:
+            if command[0] in STRAIGHT_LINE_BREAKERS:
+                return None
+            if len(command) < 3:
+                continue
+            if command[1] == "pointer" and command[0] == "pop" and \
+                    command[2] == 0:
+                return None
+            if is_method and (command[1] == "that" or
+                              command[1:] == ("pointer", 1)):
+                return None
+            uses_static = uses_static or command[1] == "static"
+        return commands[0][2], is_method, body, uses_static
+
+    @staticmethod
+    def __expand_call(plan, n_args):
+        """
+        Builds the commands that replace a call to an inlinable function.
+        The arguments on the stack, the locals and the temp variables of
+        the function are kept in the caller's temp segment, which is never
+        live across a call in code built by CompilationEngine.
+        :param plan: The function's inline plan (see __inline_plan)
+        :param n_args: The number of arguments of the call
+        :return: The list of commands, or None if the temp segment is too
+        small for the function's variables
+        """
+        n_locals, is_method, body, uses_static = plan
+        temps = [command[2] for command in body if command[1:2] == ("temp",)]
+        temp_base = n_args + n_locals
+        if temp_base + (max(temps) + 1 if temps else 0) > TEMP_SIZE:
+            return None
+        expansion = [("pop", "temp", i) for i in reversed(range(n_args))]
+        for i in range(n_locals):
+            expansion.extend((("push", "constant", 0),
+                              ("pop", "temp", n_args + i)))
+        if is_method:
+            expansion.extend((("push", "temp", 0), ("pop", "pointer", 1)))
+        for command in body:
+            if len(command) == 3:
+                segment, index = command[1], command[2]
+                if segment == "argument":
+                    segment = "temp"
+                elif segment == "local":
+                    segment, index = "temp", n_args + index
+                elif segment == "temp":
+                    index += temp_base
+                elif is_method and segment == "this":
+                    segment = "that"
+                elif is_method and segment == "pointer":
+                    index = 1
+                command = (command[0], segment, index)
+            expansion.append(command)
+        return expansion
+
+    def inline_functions(self, budget=DEFAULT_INLINE_BUDGET, optimizer=None):
+        """
+        Replaces calls to small straight-line functions, such as field
+        accessors and tiny helpers, with the functions' bodies. Such
+        functions make no calls, so they are never recursive.
+        :param budget: The longest function body that may be inlined
+        :param optimizer: An optional PeepholeOptimizer to run again over
+        the functions that calls were inlined into
+        :return: A dictionary from the inlined functions' names to the
+        number of calls to them that were replaced
+        """
+        plans = {}
+        for name, (key, commands) in self.__functions.items():
+            plan = self.__inline_plan(commands, budget)
+            if plan is not None:
+                plans[name] = plan
+        inlined = {}
+        for key, commands in self.__program.items():
+            result = []
+            changed = False
+            caller_class = None
+            for command in commands:
+                if command[0] == "function":
+                    caller_class = command[1].split(".")[0]
+                expansion = None
+                if command[0] == "call" and command[1] in plans:
+                    plan = plans[command[1]]
+                    if not plan[3] or \
+                            command[1].split(".")[0] == caller_class:
+                        expansion = self.__expand_call(plan, command[2])
+                if expansion is None:
+                    result.append(command)
+                    continue
+                result.extend(expansion)
+                inlined[command[1]] = inlined.get(command[1], 0) + 1
+                changed = True
+            if changed:
+                if optimizer is not None:
+                    result = optimizer.optimize(result)
+                self.__program[key] = result
+        if inlined:
+            self.__split_functions()
+        return inlined
+
+    def reachable_functions(self, roots=ENTRY_POINTS):
+        """
+        :param roots: Names of the functions the program starts from
+        :return: The set of functions that may be called, directly or
+        indirectly, from the roots
+        """
+        reachable = set()
+        pending = [root for root in roots if root in self.__functions]
+        while pending:
+            name = pending.pop()
+            if name in reachable:
+                continue
+            reachable.add(name)
+            for command in self.__functions[name][1]:
+                if command[0] == "call" and command[1] in self.__functions:
+                    pending.append(command[1])
+        return reachable
+
+    def eliminate_dead_functions(self, roots=ENTRY_POINTS):
+        """
+        Removes the functions that can never be called from the roots.
+        Nothing is removed if the program has none of the roots.
+        :param roots: Names of the functions the program starts from
+        :return: A list of the removed functions' names and sizes in bytes
+        """
+        if not any(root in self.__functions for root in roots):
+            return []
+        reachable = self.reachable_functions(roots)
+        removed = []
+        for name in sorted(self.__functions):
+            if name not in reachable:
+                removed.append((name, sum(map(command_size,
+                                              self.__functions[name][1]))))
+        if removed:
+            for key in self.__program:
+                self.__program[key] = [
+                    command for name, (function_key, commands) in
+                    self.__functions.items()
+                    if function_key == key and name in reachable
+                    for command in commands]
+            self.__split_functions()
+        return removed
@@ -0,0 +1,220 @@
+import json
+import hashlib
+from JackTokenizer import JackTokenizer, TYPES_DIC
+SUBROUTINE_KINDS = ("constructor", "function", "method")
+
+
+def scan_class(tokenizer):
+    """
+    Reads the declarations of a class without parsing the subroutines'
+    bodies: only the class name and the subroutine headers at the class's
+    top level are looked at.
+    The identifiers of the class, and those that are called, are collected
+    too: every class whose subroutines the class may call is named by one
+    of its identifiers, as a class or as the type of a variable.
+    :param tokenizer: A JackTokenizer of the class's source
+    :return: A triplet of the class's name, a dictionary from its
+    subroutines' names to their signatures, and the class's references, a
+    pair of the sorted lists of its identifiers and of the names it calls;
+    or None for empty input
+    """
+    class_name = None
+    subroutines = {}
+    names = set()
+    calls = set()
+    depth = 0
+    while tokenizer.has_more_tokens():
+        tokenizer.advance()
+        if tokenizer.token_type() == TYPES_DIC["IDENTIFIER"]:
+            names.add(tokenizer.identifier())
+            if tokenizer.has_more_tokens() and tokenizer.peek() == "(":
+                calls.add(tokenizer.identifier())
+            continue
+        if tokenizer.token_type() == TYPES_DIC["SYMBOL"]:
+            if tokenizer.symbol() == "{":
+                depth += 1
+            elif tokenizer.symbol() == "}":
+                depth -= 1
+            continue
+        keyword = tokenizer.keyword()
+        if depth == 0 and keyword == TYPES_DIC["CLASS"]:
+            tokenizer.advance()
+            class_name = tokenizer.identifier()
+            names.add(class_name)
+        elif depth == 1 and keyword in SUBROUTINE_KINDS:
+            tokenizer.advance()
+            return_type = tokenizer.identifier()
+            tokenizer.advance()
+            name = tokenizer.identifier()
+            tokenizer.advance()  # The '(' token
+            tokenizer.advance()
+            n_args = 0 if tokenizer.symbol() == ")" else 1
+            while tokenizer.symbol() != ")":
+                if tokenizer.symbol() == ",":
+                    n_args += 1
+                elif tokenizer.token_type() == TYPES_DIC["IDENTIFIER"]:
+                    names.add(tokenizer.identifier())
+                tokenizer.advance()
+            subroutines[name] = (keyword, n_args, return_type)
+    if class_name is None:
+        return None
+    return class_name, subroutines, (sorted(names), sorted(calls))
+
+
+class SignatureIndex:
+    """
+    The signatures of the subroutines of a set of classes: for every class
+    and subroutine name, the subroutine's kind (constructor, function or
+    method), its number of arguments, not counting the object of a
+    method, and its return type. An index is built once per build from
+    the declarations of all the classes (see scan_class), and consulted by
+    CompilationEngine to resolve and check calls to other classes. The
+    index also keeps the references of the scanned source files, so that
+    each file's caches depend only on the signatures it may use.
+    """
+
+    def __init__(self, classes=None):
+        """
+        :param classes: A dictionary from class names to dictionaries from
+        subroutine names to signatures, (kind, number of arguments, return
+        type)
+        """
+        self.__classes = {} if classes is None else classes
+        self.__references = {}
+
+    def add_class(self, class_name, subroutines):
+        """
+        Adds or replaces the signatures of a class.
+        :param class_name: The class's name
+        :param subroutines: A dictionary from the names of its subroutines
+        to their signatures
+        """
+        self.__classes[class_name] = subroutines
+
+    def add_references(self, source, references):
+        """
+        Records what a source file refers to.
+        :param source: Path of a source file
+        :param references: The file's references, as given by scan_class
+        """
+        self.__references[source] = references
+
+    def update(self, other):
+        """
+        Adds the classes of another index, replacing classes of the same
+        name.
+        :param other: A SignatureIndex
+        """
+        self.__classes.update(other.get_classes())
+
+    def has_class(self, class_name):
+        """
+        :param class_name: A class name
+        :return: Whether the index knows the class
+        """
+        return class_name in self.__classes
+
+    def lookup(self, class_name, name):
+        """
+        :param class_name: A class name
+        :param name: A subroutine name
+        :return: The subroutine's signature, (kind, number of arguments,
+        return type), or None if it is not known
+        """
+        subroutines = self.__classes.get(class_name)
+        return None if subroutines is None else subroutines.get(name)
+
+    def get_classes(self):
+        """
+        :return: A dictionary from class names to dictionaries from
+        subroutine names to signatures
+        """
+        return self.__classes
+
+    def to_json(self):
+        """
+        :return: The index as JSON text, the same for equal indices
+        """
+        return json.dumps(self.__classes, indent=1, sort_keys=True)
+
+    @staticmethod
+    def from_json(text):
+        """
+        :param text: JSON text written by to_json
+        :return: The SignatureIndex it describes
+        """
+        return SignatureIndex({class_name: {name: tuple(signature)
+                                            for name, signature in
+                                            subroutines.items()}
+                               for class_name, subroutines in
+                               json.loads(text).items()})
+
+    def digest(self):
+        """
+        :return: A hash of the index's content
+        """
+        return hashlib.sha256(self.to_json().encode()).hexdigest()
+
+    def context(self, source):
+        """
+        :param source: Path of a source file
+        :return: A hash of the signatures compiling the file depends on:
+        those of the subroutines it calls, in every class it names, and
+        the existence of those classes; of the whole index if the file's
+        references are not known
+        """
+        references = self.__references.get(source)
+        if references is None:
+            return self.digest()
+        names, calls = references
+        used = {}
+        for name in names:
+            subroutines = self.__classes.get(name)
+            if subroutines is not None:
+                used[name] = {call: subroutines[call] for call in calls
+                              if call in subroutines}
+        return hashlib.sha256(json.dumps(used, sort_keys=True).encode()
+                              ).hexdigest()
+
+    def save(self, path):
+        """
+        Writes the index to a JSON file.
+        :param path: The file to write
+        """
+        with open(path, "w") as file:
+            file.write(self.to_json())
+
+    @staticmethod
+    def load(path):
+        """
+        :param path: A JSON file written by save
+        :return: The SignatureIndex stored in the file
+        """
+        with open(path, "r") as file:
+            return SignatureIndex.from_json(file.read())
+
+
+def scan_file(source, text=None, cache=None):
+    """
+    Reads the declarations of a .jack file.
+    :param source: Path of the .jack file
+    :param text: The source text to read instead of the file
+    :param cache: A ParseCache to load the declarations from, and to store
+    them and the file's tokens in when they are not cached yet, or None
+    :return: The result of scan_class, or None if the file is empty or
+    cannot be tokenized; its errors are reported when it is compiled
+    """
+    try:
+        if text is None:
+            with open(source, "r") as file:
+                text = file.read()
+        if cache is not None:
+            declarations = cache.load_scan(source, text)
+            if declarations is not None:
+                return declarations
+        declarations = scan_class(JackTokenizer(source, text, cache))
+    except (OSError, SyntaxError, IndexError):
+        return None
+    if cache is not None and declarations is not None:
+        cache.store_scan(source, text, declarations)
+    return declarations
@@ -0,0 +1,159 @@
+import json
+from VMEmulator import HACK_COSTS, command_cost
+ROM_SIZE = 32768  # Words of the Hack instruction memory
+CLASS_DELIMITER = "."
+
+
+class SizeReport:
+    """
+    The code size of a program: for every function, the number of VM
+    commands it was compiled to and an estimate of the Hack instructions
+    they translate to, by a table of the cost of every VM command (see
+    VMEmulator.HACK_COSTS). The straight-line translation of a command
+    executes each of its instructions once, so the same table estimates
+    both run time and ROM size.
+    """
+
+    def __init__(self, costs=None, functions=None):
+        """
+        :param costs: A table of the costs of the VM commands, by default
+        HACK_COSTS
+        :param functions: A dictionary from function names to pairs of
+        their numbers of commands and instructions
+        """
+        self.__costs = HACK_COSTS if costs is None else costs
+        self.__functions = {} if functions is None else functions
+
+    def add_commands(self, commands):
+        """
+        Counts the functions of a compiled file.
+        :param commands: The VM command records of the file
+        """
+        name = None
+        for command in commands:
+            if command[0] == "function":
+                name = command[1]
+                self.__functions[name] = (0, 0)
+            if name is not None:
+                count, instructions = self.__functions[name]
+                self.__functions[name] = (
+                    count + 1, instructions +
+                    command_cost(command, self.__costs))
+
+    def get_functions(self):
+        """
+        :return: A dictionary from function names to pairs of their
+        numbers of commands and estimated instructions
+        """
+        return self.__functions
+
+    def get_totals(self):
+        """
+        :return: The numbers of commands and estimated instructions of the
+        whole program
+        """
+        return (sum(count for count, instructions in
+                    self.__functions.values()),
+                sum(instructions for count, instructions in
+                    self.__functions.values()))
+
+    def get_classes(self):
+        """
+        :return: A dictionary from class names to the numbers of commands
+        and estimated instructions of their functions
+        """
+        classes = {}
+        for name, (count, instructions) in self.__functions.items():
+            class_name = name.split(CLASS_DELIMITER, 1)[0]
+            total = classes.get(class_name, (0, 0))
+            classes[class_name] = (total[0] + count,
+                                   total[1] + instructions)
+        return classes
+
+    @staticmethod
+    def __row(name, sizes, old_sizes, previous):
+        """
+        :param name: The name of the row
+        :param sizes: The numbers of commands and instructions
+        :param old_sizes: The numbers in the previous report, or None if
+        it has no such row
+        :param previous: The previous report, or None
+        :return: A row of the table
+        """
+        line = "%-36s %9d %12d" % ((name,) + tuple(sizes))
+        if previous is not None:
+            old_sizes = old_sizes or (0, 0)
+            line += " %+9d %+9d" % (sizes[0] - old_sizes[0],
+                                    sizes[1] - old_sizes[1])
+        return line
+
+    def format(self, previous=None):
+        """
+        :param previous: An earlier SizeReport of the program to show the
+        differences from, or None
+        :return: A table of the classes and their functions, the largest
+        first, with the program's totals
+        """
+        old_functions = {} if previous is None else \
+            previous.get_functions()
+        old_classes = {} if previous is None else previous.get_classes()
+        classes = self.get_classes()
+        rows = ["%-36s %9s %12s" % ("function", "commands", "instructions") +
+                ("" if previous is None else " %9s %9s" % ("+commands",
+                                                           "+instr"))]
+        names = set(self.__functions) | set(old_functions)
+        for class_name in sorted(set(classes) | set(old_classes),
+                                 key=lambda name: (-classes.get(name,
+                                                                (0, 0))[1],
+                                                   name)):
+            rows.append(self.__row(class_name, classes.get(class_name,
+                                                           (0, 0)),
+                                   old_classes.get(class_name), previous))
+            members = [name for name in names if
+                       name.split(CLASS_DELIMITER, 1)[0] == class_name]
+            for name in sorted(members, key=lambda name: (
+                    -self.__functions.get(name, (0, 0))[1], name)):
+                rows.append(self.__row("  " + name,
+                                       self.__functions.get(name, (0, 0)),
+                                       old_functions.get(name), previous))
+        totals = self.get_totals()
+        rows.append(self.__row("total", totals, None if previous is None
+                               else previous.get_totals(), previous))
+        rows.append("%d of the %d words of ROM (%.1f%%), not counting the "
+                    "bootstrap code" % (totals[1], ROM_SIZE,
+                                        100.0 * totals[1] / ROM_SIZE))
+        return "\n".join(rows)
+
+    def to_json(self):
+        """
+        :return: The report as JSON text
+        """
+        commands, instructions = self.get_totals()
+        return json.dumps({"functions": {name: {"commands": count,
+                                                "instructions": size}
+                                         for name, (count, size) in
+                                         self.__functions.items()},
+                           "total": {"commands": commands,
+                                     "instructions": instructions},
+                           "costs": self.__costs},
+                          indent=2, sort_keys=True)
+
+    def save(self, path):
+        """
+        Writes the report as JSON.
+        :param path: The file to write
+        """
+        with open(path, "w") as file:
+            file.write(self.to_json())
+
+    @staticmethod
+    def load(path):
+        """
+        :param path: A JSON file written by save
+        :return: The SizeReport stored in the file
+        """
+        with open(path, "r") as file:
+            data = json.load(file)
+        return SizeReport(data.get("costs"), {
+            name: (sizes["commands"], sizes["instructions"])
+            for name, sizes in data["functions"].items()})
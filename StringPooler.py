@@ -0,0 +1,38 @@
+from SyntaxTree import *
+
+
+class StringPooler:
+    """
+    Gives each distinct string literal of a class a static variable,
+    following the class's own static variables, in which the string is
+    kept once it has been built (see CodeGenerator). Pooled literals are
+    shared between all their uses, so programs must not modify them.
+    """
+
+    def __init__(self):
+        self.__literals = 0
+        self.__uses = 0
+
+    def run(self, class_dec):
+        """
+        Assigns the pool variables of a class's string literals.
+        :param class_dec: The ClassDec node of the class
+        """
+        pool = {}
+        pending = [class_dec]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, StringConstant):
+                if node.literal not in pool:
+                    pool[node.literal] = class_dec.static_count + len(pool)
+                node.pool_index = pool[node.literal]
+                self.__uses += 1
+            pending.extend(reversed(node.children()))
+        class_dec.static_count += len(pool)
+        self.__literals += len(pool)
+
+    def get_stats(self):
+        """
+        :return: The numbers of pooled literals and of their uses
+        """
+        return {"literals": self.__literals, "uses": self.__uses}
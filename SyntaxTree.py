@@ -0,0 +1,221 @@
+class Node:
+    """
+    A node of the syntax tree CompilationEngine builds for a class. Names
+    are resolved while parsing: variables carry their VM segment and
+    index, and calls carry the full VM name of the called function. Every
+    node class lists the slots holding its child nodes (or lists of child
+    nodes) in CHILDREN, so passes can walk and rewrite the tree generically.
+    """
+    __slots__ = ()
+    CHILDREN = ()
+
+    def children(self):
+        """
+        :return: A list of the node's child nodes, in evaluation order
+        """
+        result = []
+        for slot in self.CHILDREN:
+            child = getattr(self, slot)
+            if isinstance(child, list):
+                result.extend(child)
+            elif child is not None:
+                result.append(child)
+        return result
+
+    def replace_children(self, function):
+        """
+        Replaces every child node by the result of calling a function on it.
+        :param function: A function from a node to a node
+        """
+        for slot in self.CHILDREN:
+            child = getattr(self, slot)
+            if isinstance(child, list):
+                setattr(self, slot, [function(node) for node in child])
+            elif child is not None:
+                setattr(self, slot, function(child))
+
+
+class ClassDec(Node):
+    __slots__ = ("name", "subroutines", "static_count", "field_count")
+    CHILDREN = ("subroutines",)
+
+    def __init__(self, name, subroutines, static_count, field_count):
+        self.name = name
+        self.subroutines = subroutines
+        self.static_count = static_count
+        self.field_count = field_count
+
+
+class SubroutineDec(Node):
+    __slots__ = ("kind", "name", "return_type", "arguments", "locals",
+                 "body")
+    CHILDREN = ("body",)
+
+    def __init__(self, kind, name, return_type, arguments, locals, body):
+        """
+        :param kind: "constructor", "function" or "method"
+        :param name: The full VM name of the subroutine, Class.name
+        :param return_type: The declared return type
+        :param arguments: A list of (name, type) of the arguments, starting
+        with "this" for a method
+        :param locals: A list of (name, type) of the local variables
+        :param body: A list of statement nodes
+        """
+        self.kind = kind
+        self.name = name
+        self.return_type = return_type
+        self.arguments = arguments
+        self.locals = locals
+        self.body = body
+
+
+class LetStatement(Node):
+    __slots__ = ("target", "value")
+    CHILDREN = ("target", "value")
+
+    def __init__(self, target, value):
+        """
+        :param target: A Variable or ArrayElement node
+        :param value: The assigned expression
+        """
+        self.target = target
+        self.value = value
+
+
+class IfStatement(Node):
+    __slots__ = ("condition", "then_body", "else_body")
+    CHILDREN = ("condition", "then_body", "else_body")
+
+    def __init__(self, condition, then_body, else_body):
+        """
+        :param condition: The condition expression
+        :param then_body: A list of statement nodes
+        :param else_body: A list of statement nodes, or None if the
+        statement has no else clause
+        """
+        self.condition = condition
+        self.then_body = then_body
+        self.else_body = else_body
+
+
+class WhileStatement(Node):
+    __slots__ = ("condition", "body")
+    CHILDREN = ("condition", "body")
+
+    def __init__(self, condition, body):
+        self.condition = condition
+        self.body = body
+
+
+class DoStatement(Node):
+    __slots__ = ("call",)
+    CHILDREN = ("call",)
+
+    def __init__(self, call):
+        self.call = call
+
+
+class ReturnStatement(Node):
+    __slots__ = ("value",)
+    CHILDREN = ("value",)
+
+    def __init__(self, value):
+        """
+        :param value: The returned expression, or None for a void return
+        """
+        self.value = value
+
+
+class IntConstant(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        """
+        :param value: A 16-bit value; folded constants may be negative
+        """
+        self.value = value
+
+
+class StringConstant(Node):
+    __slots__ = ("literal", "pool_index")
+
+    def __init__(self, literal):
+        """
+        :param literal: The string constant token, with its double quotes
+        """
+        self.literal = literal
+        self.pool_index = None  # The static variable of a pooled string
+
+
+class KeywordConstant(Node):
+    __slots__ = ("keyword",)
+
+    def __init__(self, keyword):
+        """
+        :param keyword: "true", "false", "null" or "this"
+        """
+        self.keyword = keyword
+
+
+class Variable(Node):
+    __slots__ = ("name", "type", "segment", "index")
+
+    def __init__(self, name, type, segment, index):
+        """
+        :param name: The variable's name
+        :param type: The variable's declared type
+        :param segment: The VM segment holding the variable
+        :param index: The variable's index in the segment
+        """
+        self.name = name
+        self.type = type
+        self.segment = segment
+        self.index = index
+
+
+class ArrayElement(Node):
+    __slots__ = ("array", "index")
+    CHILDREN = ("array", "index")
+
+    def __init__(self, array, index):
+        """
+        :param array: The Variable holding the array's base address
+        :param index: The index expression
+        """
+        self.array = array
+        self.index = index
+
+
+class UnaryOp(Node):
+    __slots__ = ("op", "operand")
+    CHILDREN = ("operand",)
+
+    def __init__(self, op, operand):
+        self.op = op
+        self.operand = operand
+
+
+class BinaryOp(Node):
+    __slots__ = ("op", "left", "right")
+    CHILDREN = ("left", "right")
+
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+class Call(Node):
+    __slots__ = ("function", "receiver", "arguments")
+    CHILDREN = ("receiver", "arguments")
+
+    def __init__(self, function, receiver, arguments):
+        """
+        :param function: The full VM name of the called subroutine
+        :param receiver: The expression of the object a method is called
+        on, or None for functions and constructors
+        :param arguments: A list of argument expressions
+        """
+        self.function = function
+        self.receiver = receiver
+        self.arguments = arguments
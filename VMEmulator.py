@@ -0,0 +1,666 @@
+import os
+import sys
+import argparse
+from CompilationEngine import CompilationEngine, STANDARD_OPTIMIZATIONS
+from ProgramOptimizer import ENTRY_POINTS
+VM_SUFFIX = ".vm"
+JACK_SUFFIX = ".jack"
+COMMENT = "//"
+INTEGER_ARGUMENTS = {"push", "pop", "call", "function"}
+# The Hack RAM layout of the standard VM implementation
+RAM_SIZE = 32768
+SP, LCL, ARG, THIS, THAT = 0, 1, 2, 3, 4
+TEMP_BASE = 5
+STATIC_BASE, STATIC_END = 16, 256
+STACK_BASE = 256
+HEAP_BASE, HEAP_END = 2048, 16384
+SEGMENT_REGISTERS = {"local": LCL, "argument": ARG, "this": THIS,
+                     "that": THAT}
+FRAME_SIZE = 5  # Return address, LCL, ARG, THIS and THAT
+DEFAULT_MAX_STEPS = 100000000
+DEFAULT_TOP = 10
+# Hack instructions executed by each VM command in a straightforward
+# VM translator. A function command costs "function" plus "function local"
+# for each of its local variables.
+HACK_COSTS = {"push constant": 7, "push static": 6, "push temp": 6,
+              "push pointer": 6, "push local": 10, "push argument": 10,
+              "push this": 10, "push that": 10,
+              "pop static": 5, "pop temp": 5, "pop pointer": 5,
+              "pop local": 12, "pop argument": 12, "pop this": 12,
+              "pop that": 12,
+              "add": 5, "sub": 5, "and": 5, "or": 5, "neg": 3, "not": 3,
+              "eq": 14, "gt": 14, "lt": 14,
+              "label": 0, "goto": 2, "if-goto": 5,
+              "call": 48, "function": 1, "function local": 7, "return": 44}
+# Rough estimates of the Hack instructions executed by the subroutines of
+# the standard Jack OS, which the emulator implements natively. They are
+# only meant to weigh OS calls against the compiled code.
+OS_COSTS = {"Math.multiply": 400, "Math.divide": 700, "Math.sqrt": 1500,
+            "Math.abs": 60, "Math.min": 60, "Math.max": 60,
+            "Memory.alloc": 250, "Memory.deAlloc": 120,
+            "String.new": 350, "String.appendChar": 90,
+            "Output.printChar": 600, "Output.printString": 600,
+            "Output.printInt": 2500}
+DEFAULT_OS_COST = 80
+
+
+def parse_commands(text):
+    """
+    :param text: The text of a .vm file
+    :return: The list of its command records (see VMWriter)
+    """
+    commands = []
+    for line in text.splitlines():
+        words = line.split(COMMENT, 1)[0].split()
+        if not words:
+            continue
+        if words[0] in INTEGER_ARGUMENTS:
+            words[2] = int(words[2])
+        commands.append(tuple(words))
+    return commands
+
+
+def load_program(path):
+    """
+    :param path: A .vm file or a directory of .vm files
+    :return: A dictionary from the paths of the files to their command
+    records
+    """
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(path, file_name) for file_name in
+                       os.listdir(path) if file_name.endswith(VM_SUFFIX))
+    else:
+        paths = [path]
+    program = {}
+    for vm_path in paths:
+        with open(vm_path, "r") as file:
+            program[vm_path] = parse_commands(file.read())
+    return program
+
+
+def compile_program(path, optimizations=()):
+    """
+    Compiles Jack sources in memory, without writing any file.
+    :param path: A .jack file or a directory of .jack files
+    :param optimizations: Names of the optimizations to compile with
+    :return: A dictionary from the paths of the sources to their command
+    records
+    """
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(path, file_name) for file_name in
+                       os.listdir(path) if file_name.endswith(JACK_SUFFIX))
+    else:
+        paths = [path]
+    program = {}
+    for source in paths:
+        engine = CompilationEngine(source, None, optimizations=optimizations)
+        engine.compile_class()
+        program[source] = engine.get_commands()
+    return program
+
+
+def command_cost(command, costs=HACK_COSTS):
+    """
+    :param command: A VM command record
+    :param costs: A table of the costs of the VM commands (see HACK_COSTS)
+    :return: The number of Hack instructions the command executes
+    """
+    if command[0] in ("push", "pop"):
+        return costs[command[0] + " " + command[1]]
+    if command[0] == "function":
+        return costs["function"] + costs["function local"] * command[2]
+    return costs[command[0]]
+
+
+def wrap(value):
+    """
+    :param value: An integer
+    :return: The value as a signed 16-bit word
+    """
+    return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+
+class VMEmulator:
+    """
+    Executes the VM code of a program on an emulated Hack RAM, laid out as
+    by the standard VM implementation, and counts the VM commands and the
+    estimated Hack instructions executed by every function. The OS is
+    implemented natively, unless the program defines the OS subroutine
+    itself; native subroutines are counted with their OS_COSTS. There is
+    no screen: the Screen subroutines do nothing.
+    """
+
+    def __init__(self, program, costs=None, max_steps=DEFAULT_MAX_STEPS):
+        """
+        :param program: A dictionary from file keys to command records, as
+        given to ProgramOptimizer
+        :param costs: A table of the costs of the VM commands, HACK_COSTS
+        by default
+        :param max_steps: The most VM commands to execute before giving up
+        """
+        self.__costs = costs or HACK_COSTS
+        self.__max_steps = max_steps
+        self.__ram = [0] * RAM_SIZE
+        self.__heap = HEAP_BASE
+        self.__output = []
+        self.__profile = {}
+        self.__statics = {}
+        self.__functions = {}
+        self.__natives = {"Math.multiply": self.__multiply,
+                          "Math.divide": self.__divide,
+                          "Math.abs": lambda x: abs(x),
+                          "Math.min": lambda x, y: min(x, y),
+                          "Math.max": lambda x, y: max(x, y),
+                          "Math.sqrt": self.__sqrt,
+                          "Memory.alloc": self.__alloc,
+                          "Memory.deAlloc": lambda address: 0,
+                          "Memory.peek": lambda address: self.__ram[address],
+                          "Memory.poke": self.__poke,
+                          "Array.new": self.__alloc,
+                          "Array.dispose": lambda array: 0,
+                          "String.new": self.__string_new,
+                          "String.dispose": lambda string: 0,
+                          "String.length": lambda string:
+                          self.__ram[string + 1],
+                          "String.charAt": lambda string, i:
+                          self.__ram[string + 2 + i],
+                          "String.setCharAt": self.__set_char_at,
+                          "String.appendChar": self.__append_char,
+                          "String.eraseLastChar": self.__erase_last_char,
+                          "String.intValue": self.__int_value,
+                          "String.setInt": self.__set_int,
+                          "String.newLine": lambda: 128,
+                          "String.backSpace": lambda: 129,
+                          "String.doubleQuote": lambda: 34,
+                          "Output.printChar": self.__print_char,
+                          "Output.printString": self.__print_string,
+                          "Output.printInt": self.__print_int,
+                          "Output.println": lambda: self.__print("\n"),
+                          "Output.backSpace": self.__back_space,
+                          "Output.moveCursor": lambda i, j: 0,
+                          "Screen.clearScreen": lambda: 0,
+                          "Screen.setColor": lambda color: 0,
+                          "Screen.drawPixel": lambda x, y: 0,
+                          "Screen.drawLine": lambda x1, y1, x2, y2: 0,
+                          "Screen.drawRectangle": lambda x1, y1, x2, y2: 0,
+                          "Screen.drawCircle": lambda x, y, r: 0,
+                          "Keyboard.keyPressed": lambda: 0,
+                          "Sys.wait": lambda duration: 0,
+                          "Sys.error": self.__error}
+        for commands in program.values():
+            self.__load(commands)
+
+    def __load(self, commands):
+        """
+        Translates the commands of a file to the form executed by run: the
+        segments are resolved to RAM addresses or to the registers that
+        point to them, and the labels to command indices.
+        :param commands: The command records of the file
+        """
+        name, code, labels = None, None, None
+        for command in commands:
+            if command[0] == "function":
+                if name is not None:
+                    self.__resolve(code, labels)
+                name, code, labels = command[1], [], {}
+                self.__functions[name] = (command[2], code,
+                                          command_cost(command, self.__costs))
+                continue
+            cost = command_cost(command, self.__costs)
+            if command[0] == "label":
+                labels[command[1]] = len(code)
+            elif command[0] in ("push", "pop"):
+                segment, index = command[1], command[2]
+                if segment == "constant":
+                    code.append(("push-constant", index, cost))
+                elif segment in SEGMENT_REGISTERS:
+                    code.append((command[0] + "-indirect",
+                                 SEGMENT_REGISTERS[segment], index, cost))
+                else:
+                    code.append((command[0],
+                                 self.__address(name, segment, index), cost))
+            elif command[0] == "call":
+                code.append(("call", command[1], command[2], cost))
+            else:
+                code.append(command + (cost,))
+        if name is not None:
+            self.__resolve(code, labels)
+
+    def __address(self, function, segment, index):
+        """
+        :param function: The name of the function accessing the segment
+        :param segment: static, temp or pointer
+        :param index: The index in the segment
+        :return: The RAM address of the variable
+        """
+        if segment == "temp":
+            return TEMP_BASE + index
+        if segment == "pointer":
+            return THIS + index
+        class_name = function.split(".")[0]
+        if class_name not in self.__statics:
+            self.__statics[class_name] = {}
+        statics = self.__statics[class_name]
+        if index not in statics:
+            address = STATIC_BASE + sum(len(variables) for variables in
+                                        self.__statics.values())
+            if address >= STATIC_END:
+                raise RuntimeError("too many static variables")
+            statics[index] = address
+        return statics[index]
+
+    @staticmethod
+    def __resolve(code, labels):
+        """
+        Replaces the labels of a function's jumps with command indices.
+        :param code: The translated commands of the function
+        :param labels: A dictionary from its labels to command indices
+        """
+        for i, command in enumerate(code):
+            if command[0] in ("goto", "if-goto"):
+                if command[1] not in labels:
+                    raise RuntimeError("unknown label " + command[1])
+                code[i] = (command[0], labels[command[1]], command[2])
+
+    def run(self, entry=None):
+        """
+        Executes the program until its entry function returns or Sys.halt
+        is called. The stack must stay below the heap: reaching HEAP_BASE
+        is an error, as deep recursion would otherwise overwrite objects.
+        :param entry: The function to start from, by default Sys.init if
+        the program has it and otherwise Main.main
+        :return: The value returned by the entry function
+        """
+        if entry is None:
+            entry = next((name for name in ENTRY_POINTS
+                          if name in self.__functions), None)
+        if entry not in self.__functions:
+            raise RuntimeError("no entry function")
+        ram = self.__ram
+        costs = self.__costs
+        call_cost = costs["call"]
+        profile = self.__profile
+        sp = STACK_BASE
+        ram[LCL] = ram[ARG] = sp
+        frames = []
+        name = entry
+        n_locals, code, entry_cost = self.__functions[name]
+        for i in range(n_locals):
+            ram[sp + i] = 0
+        sp += n_locals
+        ram[LCL] = STACK_BASE
+        counters = profile.setdefault(name, [0, 0, 0])
+        counters[0] += 1
+        pc, steps, cycles = 0, 1, entry_cost
+        max_steps = self.__max_steps
+        while True:
+            command = code[pc]
+            pc += 1
+            steps += 1
+            cycles += command[-1]
+            op = command[0]
+            if op == "push-constant":
+                ram[sp] = command[1]
+                sp += 1
+            elif op == "push-indirect":
+                ram[sp] = ram[ram[command[1]] + command[2]]
+                sp += 1
+            elif op == "push":
+                ram[sp] = ram[command[1]]
+                sp += 1
+            elif op == "pop-indirect":
+                sp -= 1
+                ram[ram[command[1]] + command[2]] = ram[sp]
+            elif op == "pop":
+                sp -= 1
+                ram[command[1]] = ram[sp]
+            elif op == "add":
+                sp -= 1
+                ram[sp - 1] = wrap(ram[sp - 1] + ram[sp])
+            elif op == "sub":
+                sp -= 1
+                ram[sp - 1] = wrap(ram[sp - 1] - ram[sp])
+            elif op == "and":
+                sp -= 1
+                ram[sp - 1] &= ram[sp]
+            elif op == "or":
+                sp -= 1
+                ram[sp - 1] |= ram[sp]
+            elif op == "neg":
+                ram[sp - 1] = wrap(-ram[sp - 1])
+            elif op == "not":
+                ram[sp - 1] = ~ram[sp - 1]
+            elif op == "eq":
+                sp -= 1
+                ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+            elif op == "gt":
+                sp -= 1
+                ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+            elif op == "lt":
+                sp -= 1
+                ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+            elif op == "goto":
+                pc = command[1]
+            elif op == "if-goto":
+                sp -= 1
+                if ram[sp]:
+                    pc = command[1]
+            elif op == "call":
+                callee, n_args = command[1], command[2]
+                if callee not in self.__functions:
+                    if callee == "Sys.halt":
+                        break
+                    if callee not in self.__natives:
+                        raise RuntimeError("unknown function " + callee)
+                    ram[SP] = sp
+                    sp -= n_args
+                    value = self.__natives[callee](*ram[sp:sp + n_args])
+                    ram[sp] = wrap(value)
+                    sp += 1
+                    native = profile.setdefault(callee, [0, 0, 0])
+                    native[0] += 1
+                    native[2] += OS_COSTS.get(callee, DEFAULT_OS_COST)
+                    continue
+                counters[1] += steps
+                counters[2] += cycles
+                frames.append((name, code, pc, counters))
+                ram[sp] = len(frames)
+                ram[sp + 1:sp + FRAME_SIZE] = ram[LCL:THAT + 1]
+                ram[ARG] = sp - n_args
+                sp += FRAME_SIZE
+                ram[LCL] = sp
+                name = callee
+                n_locals, code, entry_cost = self.__functions[name]
+                ram[sp:sp + n_locals] = [0] * n_locals
+                sp += n_locals
+                counters = profile.setdefault(name, [0, 0, 0])
+                counters[0] += 1
+                pc, cycles = 0, entry_cost
+                max_steps -= steps
+                steps = 1
+                if max_steps <= 0:
+                    raise RuntimeError("step limit exceeded")
+            elif op == "return":
+                counters[1] += steps
+                counters[2] += cycles
+                value = ram[sp - 1]
+                frame = ram[LCL]
+                sp = ram[ARG]
+                ram[sp] = value
+                sp += 1
+                ram[LCL:THAT + 1] = ram[frame - 4:frame]
+                if not frames:
+                    ram[SP] = sp
+                    return value
+                max_steps -= steps
+                if max_steps <= 0:
+                    raise RuntimeError("step limit exceeded")
+                name, code, pc, counters = frames.pop()
+                steps, cycles = 0, 0
+            elif op != "label":
+                raise RuntimeError("unknown command " + op)
+            if sp >= HEAP_BASE:
+                raise RuntimeError("stack overflow in " + name)
+            if steps > max_steps:
+                raise RuntimeError("step limit exceeded")
+        counters[1] += steps
+        counters[2] += cycles
+        ram[SP] = sp
+        return 0
+
+    def get_output(self):
+        """
+        :return: The text printed by the program through Output
+        """
+        return "".join(self.__output)
+
+    def get_profile(self):
+        """
+        :return: A dictionary from the name of every function called to a
+        triplet of its number of calls, the VM commands it executed and the
+        estimated Hack instructions it executed, both not counting its
+        callees
+        """
+        return {name: tuple(counters)
+                for name, counters in self.__profile.items()}
+
+    def is_native(self, name):
+        """
+        :param name: A function name
+        :return: Whether the function is implemented by the emulator
+        """
+        return name not in self.__functions
+
+    def __alloc(self, size):
+        """
+        Allocates a block of RAM. Blocks are never reused.
+        """
+        address = self.__heap
+        self.__heap += max(size, 1)
+        if self.__heap > HEAP_END:
+            raise RuntimeError("heap overflow")
+        return address
+
+    def __poke(self, address, value):
+        """
+        Memory.poke: sets a RAM word.
+        """
+        self.__ram[address] = value
+        return 0
+
+    def __multiply(self, x, y):
+        """
+        Math.multiply, with 16-bit overflow.
+        """
+        return wrap(x * y)
+
+    def __divide(self, x, y):
+        """
+        Math.divide, rounding towards zero.
+        """
+        if y == 0:
+            raise RuntimeError("division by zero")
+        quotient = abs(x) // abs(y)
+        return quotient if (x < 0) == (y < 0) else -quotient
+
+    def __sqrt(self, x):
+        """
+        Math.sqrt, rounding down.
+        """
+        if x < 0:
+            raise RuntimeError("square root of a negative number")
+        root = int(x ** 0.5)
+        while root * root > x:
+            root -= 1
+        return root
+
+    def __error(self, code):
+        """
+        Sys.error: stops the program.
+        """
+        raise RuntimeError("Sys.error(%d)" % code)
+
+    def __string_new(self, max_length):
+        """
+        String.new: a String is a block of its maximal length, its length
+        and its characters.
+        """
+        string = self.__alloc(max_length + 2)
+        self.__ram[string] = max_length
+        self.__ram[string + 1] = 0
+        return string
+
+    def __append_char(self, string, c):
+        """
+        String.appendChar
+        """
+        length = self.__ram[string + 1]
+        if length >= self.__ram[string]:
+            raise RuntimeError("string is full")
+        self.__ram[string + 2 + length] = c
+        self.__ram[string + 1] = length + 1
+        return string
+
+    def __set_char_at(self, string, i, c):
+        """
+        String.setCharAt
+        """
+        self.__ram[string + 2 + i] = c
+        return 0
+
+    def __erase_last_char(self, string):
+        """
+        String.eraseLastChar
+        """
+        if self.__ram[string + 1] > 0:
+            self.__ram[string + 1] -= 1
+        return 0
+
+    def __text(self, string):
+        """
+        :param string: The address of a String
+        :return: The String's characters as a Python string
+        """
+        length = self.__ram[string + 1]
+        return "".join(map(chr, self.__ram[string + 2:string + 2 + length]))
+
+    def __int_value(self, string):
+        """
+        String.intValue: the value of the String's leading digits.
+        """
+        text = self.__text(string)
+        digits = text[1:] if text.startswith("-") else text
+        value = 0
+        for c in digits:
+            if not c.isdigit():
+                break
+            value = value * 10 + int(c)
+        return -value if text.startswith("-") else value
+
+    def __set_int(self, string, value):
+        """
+        String.setInt
+        """
+        self.__ram[string + 1] = 0
+        for c in str(value):
+            self.__append_char(string, ord(c))
+        return 0
+
+    def __print(self, text):
+        """
+        Adds text to the output.
+        """
+        self.__output.append(text)
+        return 0
+
+    def __print_char(self, c):
+        """
+        Output.printChar
+        """
+        return self.__print("\n" if c == 128 else chr(c))
+
+    def __print_string(self, string):
+        """
+        Output.printString
+        """
+        return self.__print(self.__text(string))
+
+    def __print_int(self, value):
+        """
+        Output.printInt
+        """
+        return self.__print(str(value))
+
+    def __back_space(self):
+        """
+        Output.backSpace: erases the last character printed.
+        """
+        if self.__output:
+            self.__output[-1] = self.__output[-1][:-1]
+        return 0
+
+
+def format_report(profile, top=DEFAULT_TOP, natives=()):
+    """
+    :param profile: A profile of VMEmulator.get_profile
+    :param top: The number of functions to list
+    :param natives: The names of the functions implemented natively
+    :return: The totals of the profile and its hottest functions by
+    estimated Hack instructions, as a table
+    """
+    total_steps = sum(steps for calls, steps, cycles in profile.values())
+    total_cycles = sum(cycles for calls, steps, cycles in profile.values())
+    rows = ["Executed %d VM commands, about %d Hack instructions" %
+            (total_steps, total_cycles),
+            "%-32s %9s %12s %14s %7s" % ("function", "calls", "commands",
+                                        "instructions", "share")]
+    hottest = sorted(profile.items(), key=lambda item: (-item[1][2],
+                                                        item[0]))
+    for name, (calls, steps, cycles) in hottest[:top]:
+        label = name + (" (OS)" if name in natives else "")
+        rows.append("%-32s %9d %12d %14d %6.1f%%" %
+                    (label, calls, steps, cycles,
+                     100.0 * cycles / (total_cycles or 1)))
+    return "\n".join(rows)
+
+
+def parse_args(argv):
+    """
+    :param argv: The command line arguments, without the program name
+    :return: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog="VMEmulator",
+                                     description="Runs a compiled Jack "
+                                                 "program and reports its "
+                                                 "hottest functions.")
+    parser.add_argument("path", help="a .vm file or a directory of .vm "
+                                     "files (or of .jack files, with "
+                                     "--compile)")
+    parser.add_argument("--compile", action="store_true",
+                        help="compile the .jack files in memory and run "
+                             "them")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="with --compile, apply the standard "
+                             "optimizations")
+    parser.add_argument("--entry", help="function to start from (default: "
+                                        "Sys.init, or else Main.main)")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, metavar="N",
+                        help="number of functions to report (default: %d)"
+                             % DEFAULT_TOP)
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS,
+                        metavar="N",
+                        help="stop after N VM commands (default: %d)"
+                             % DEFAULT_MAX_STEPS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Runs the emulator from the command line.
+    :param argv: The command line arguments, without the program name
+    :return: The exit status, 1 if the program failed
+    """
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.compile:
+        program = compile_program(args.path, STANDARD_OPTIMIZATIONS
+                                  if args.optimize else ())
+    else:
+        program = load_program(args.path)
+    emulator = VMEmulator(program, max_steps=args.max_steps)
+    status = 0
+    try:
+        emulator.run(args.entry)
+    except RuntimeError as error:
+        print("Error: %s" % error, file=sys.stderr)
+        status = 1
+    output = emulator.get_output()
+    if output:
+        print(output)
+    profile = emulator.get_profile()
+    print(format_report(profile, args.top, [name for name in profile
+                                            if emulator.is_native(name)]))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
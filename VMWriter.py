@@ -1,7 +1,20 @@
 class VMWriter:
+    """
+    Collects VM commands as records, tuples of the command word followed by
+    its arguments (e.g. ("push", "constant", 7) or ("add",)), and writes
+    them out in one bulk operation when closed.
+    """
 
-    def __init__(self, output):
-        self.__out = open(output, "w+")
+    def __init__(self, output=None, optimizer=None):
+        """
+        :param output: A path to write the output file to, a stream to
+        write the output to, or None to only keep the output in memory
+        :param optimizer: An optional object whose optimize() method
+        rewrites the list of commands before they are written
+        """
+        self.__output = output
+        self.__optimizer = optimizer
+        self.__commands = []
 
     def write_push(self, segment, index):
         """
@@ -9,7 +22,7 @@ class VMWriter:
         :param segment: The segment to write to
         :param index: The index to write to
         """
-        self.__out.write("push " + segment + " " + str(index) + "\n")
+        self.__commands.append(("push", segment, int(index)))
 
     def write_pop(self, segment, index):
         """
@@ -17,35 +30,35 @@ class VMWriter:
         :param segment: The segment to write to
         :param index: The index to write to
         """
-        self.__out.write("pop " + segment + " " + str(index) + "\n")
+        self.__commands.append(("pop", segment, int(index)))
 
     def write_arithmetic(self, command):
         """
         Writes an arithmetic command
         :param command: The command to write
         """
-        self.__out.write(command + "\n")
+        self.__commands.append((command,))
 
     def write_label(self, string):
         """
         Writes a label command
         :param string: The label's name
         """
-        self.__out.write("label " + string + "\n")
+        self.__commands.append(("label", string))
 
     def write_goto(self, string):
         """
         Writes a goto statement
         :param string: The label to go to
         """
-        self.__out.write("goto " + string + "\n")
+        self.__commands.append(("goto", string))
 
     def write_if(self, string):
         """
         Writes an if-goto statement
         :param string: The label to go to
         """
-        self.__out.write("if-goto " + string + "\n")
+        self.__commands.append(("if-goto", string))
 
     def write_call(self, name, n_args):
         """
@@ -53,7 +66,7 @@ class VMWriter:
         :param name: Function's name
         :param n_args: Number of arguments to call with
         """
-        self.__out.write("call " + name + " " + str(n_args) + "\n")
+        self.__commands.append(("call", name, n_args))
 
     def write_function(self, name, n_locals):
         """
@@ -61,16 +74,46 @@ class VMWriter:
         :param name: The function's name
         :param n_locals: The number of parameters
         """
-        self.__out.write("function " + name + " " + str(n_locals) + "\n")
+        self.__commands.append(("function", name, n_locals))
 
     def write_return(self):
         """
         Writes a return statement
         """
-        self.__out.write("return\n")
+        self.__commands.append(("return",))
 
-    def close(self):
+    def write_commands(self, commands):
+        """
+        Writes already built command records
+        :param commands: An iterable of command records
+        """
+        self.__commands.extend(commands)
+
+    def get_commands(self):
         """
-        Close the output file
+        :return: The list of command records written so far
+        """
+        return self.__commands
+
+    def get_text(self):
+        """
+        :return: The VM code of the commands written so far
+        """
+        return "".join(" ".join(map(str, command)) + "\n"
+                       for command in self.__commands)
+
+    def close(self):
         """
-        self.__out.close()
+        Optimize the commands, if an optimizer was given, and write all of
+        them to the output in a single write
+        """
+        if self.__optimizer is not None:
+            self.__commands = self.__optimizer.optimize(self.__commands)
+            self.__optimizer = None
+        if self.__output is None:
+            return
+        if isinstance(self.__output, str):
+            with open(self.__output, "w") as out:
+                out.write(self.get_text())
+        else:
+            self.__output.write(self.get_text())
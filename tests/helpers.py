@@ -0,0 +1,37 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from JackCompiler import compile_source_commands
+from VMEmulator import VMEmulator
+
+
+def compile_classes(classes, optimizations=()):
+    """
+    :param classes: A dictionary from class names to their Jack sources
+    :param optimizations: Names of the optimizations to compile with
+    :return: A dictionary from file names to the VM command records of the
+    classes, as given to ProgramOptimizer and VMEmulator
+    """
+    return {name + ".jack": compile_source_commands(
+        source, name + ".jack", optimizations=optimizations)
+        for name, source in classes.items()}
+
+
+def run_commands(program):
+    """
+    :param program: A dictionary from file names to VM command records
+    :return: The text the program prints
+    """
+    emulator = VMEmulator(program)
+    emulator.run()
+    return emulator.get_output()
+
+
+def run_program(classes, optimizations=()):
+    """
+    :param classes: A dictionary from class names to their Jack sources
+    :param optimizations: Names of the optimizations to compile with
+    :return: The text the program prints
+    """
+    return run_commands(compile_classes(classes, optimizations))
@@ -0,0 +1,101 @@
+import io
+import os
+import zipfile
+import tempfile
+import unittest
+import contextlib
+from helpers import run_commands, run_program
+from JackCompiler import main
+from Bundle import split_classes, read_bundle, BundleWriter
+from VMEmulator import parse_commands
+
+# Braces in strings and comments do not end a class, and the comment
+# before a class belongs to it
+BUNDLE = """// The entry point
+class Main {
+    function void main() {
+        do Output.printString("}{");
+        do Output.printInt(Helper.sum(40));
+        return;
+    }
+}
+/* } */
+class Helper {
+    function int sum(int n) {
+        var int s;
+        let s = 0;
+        while (n > 0) { let s = s + n; let n = n - 1; }
+        return s;
+    }
+}
+"""
+OUTPUT = "}{820"
+
+
+class TestSplitClasses(unittest.TestCase):
+
+    def test_splits_at_closing_braces(self):
+        classes = split_classes(BUNDLE)
+        self.assertEqual([line for line, text in classes], [1, 8])
+        self.assertEqual("".join(text for line, text in classes),
+                         BUNDLE.rstrip())
+        self.assertTrue(classes[0][1].startswith("// The entry point"))
+        self.assertTrue(classes[1][1].lstrip().startswith("/* } */"))
+
+
+class TestBundleWriter(unittest.TestCase):
+
+    def test_frames_round_trip(self):
+        outputs = [("Main.vm", "//@ Fake.vm 3\nabc\n"), ("Empty.vm", ""),
+                   ("Helper.vm", "push constant 1\n")]
+        stream = io.StringIO()
+        writer = BundleWriter(stream)
+        for name, text in outputs:
+            writer.write(name, text)
+        writer.close()
+        stream.seek(0)
+        self.assertEqual(list(read_bundle(stream)), outputs)
+
+    def test_archive(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "out.zip")
+            writer = BundleWriter(path)
+            writer.write("Main.vm", "return\n")
+            writer.close()
+            with zipfile.ZipFile(path) as archive:
+                self.assertEqual(archive.read("Main.vm"), b"return\n")
+
+
+class TestBundleBuilds(unittest.TestCase):
+
+    def build(self, *options):
+        """
+        Compiles BUNDLE with main, as from the command line.
+        :return: The exit status and the program read from the output
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "all.jack")
+            with open(path, "w") as file:
+                file.write(BUNDLE)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output), \
+                    contextlib.redirect_stderr(io.StringIO()):
+                status = main([path, "--bundle", "-j", "1"] + list(options))
+        output.seek(0)
+        return status, {name: parse_commands(text)
+                        for name, text in read_bundle(output)}
+
+    def test_matches_separate_classes(self):
+        classes = [text for line, text in split_classes(BUNDLE)]
+        self.assertEqual(run_program({"Main": classes[0],
+                                      "Helper": classes[1]}), OUTPUT)
+        for options in ((), ("-O",), ("-O", "-W")):
+            with self.subTest(options=options):
+                status, program = self.build(*options)
+                self.assertEqual(status, 0)
+                self.assertEqual(sorted(program), ["Helper.vm", "Main.vm"])
+                self.assertEqual(run_commands(program), OUTPUT)
+
+
+if __name__ == "__main__":
+    unittest.main()
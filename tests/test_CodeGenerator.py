@@ -0,0 +1,270 @@
+import unittest
+from helpers import run_program, compile_classes
+from VMEmulator import VMEmulator
+from CompilationEngine import CompilationEngine, STANDARD_OPTIMIZATIONS, \
+    OPT_ARRAYS, OPT_LAYOUT, OPT_STRENGTH_REDUCTION, OPT_TAIL_CALLS
+
+# The value read after the store is b[j]: the call in the stored value
+# must not leave pointer 1 tracked as b[j] while it points at a[i]
+CALL_THEN_ARRAY_READ = """
+class Main {
+    function int f() { return 100; }
+    function void main() {
+        var Array a, b;
+        var int i, j, x;
+        let a = Array.new(2);
+        let b = Array.new(2);
+        let i = 0;
+        let j = 1;
+        let b[j] = 5;
+        let a[i] = Main.f() + b[j];
+        let x = b[j];
+        do Output.printInt(x);
+        return;
+    }
+}
+"""
+# Stores and reads through the same and other arrays, nested indexes and
+# swaps
+ARRAY_SHUFFLES = """
+class Main {
+    function void main() {
+        var Array a, b, c;
+        var int i, j, t, n;
+        let n = 6;
+        let a = Array.new(n);
+        let b = Array.new(n);
+        let c = Array.new(n);
+        let i = 0;
+        while (i < n) {
+            let a[i] = i * i;
+            let b[i] = n - 1 - i;
+            let i = i + 1;
+        }
+        let i = 0;
+        while (i < n) {
+            let c[i] = a[b[i]];
+            let a[i] = a[i] + 1;
+            let i = i + 1;
+        }
+        let i = 0;
+        let j = n - 1;
+        while (i < j) {
+            let t = a[i];
+            let a[i] = a[j];
+            let a[j] = t;
+            let i = i + 1;
+            let j = j - 1;
+        }
+        let a[0] = a[0] + a[0];
+        let i = 0;
+        while (i < n) {
+            do Output.printInt(a[i] + c[i]);
+            do Output.printChar(32);
+            let i = i + 1;
+        }
+        return;
+    }
+}
+"""
+# Tail calls with swapped and unchanged arguments, from a function with a
+# local that must be 0 again on every call and from a method; depth is
+# not a tail call
+SELF_RECURSION = """
+class Main {
+    field int base;
+    constructor Main new(int b) { let base = b; return this; }
+    method int count(int n, int acc) {
+        if (n = 0) { return acc + base; }
+        return count(n - 1, acc + 1);
+    }
+    function int gcd(int a, int b) {
+        if (b = 0) { return a; }
+        return Main.gcd(b, a - (a / b * b));
+    }
+    function int sum(int n, int acc) {
+        var int seen;
+        if (seen) { return -1; }
+        let seen = true;
+        if (n = 0) { return acc; }
+        return Main.sum(n - 1, acc + n);
+    }
+    function int depth(int n) {
+        if (n = 0) { return 0; }
+        return 1 + Main.depth(n - 1);
+    }
+    function void main() {
+        var Main m;
+        let m = Main.new(7);
+        do Output.printInt(Main.gcd(1071, 462));
+        do Output.printChar(32);
+        do Output.printInt(Main.sum(%d, 0));
+        do Output.printChar(32);
+        do Output.printInt(m.count(%d, 0));
+        do Output.printChar(32);
+        do Output.printInt(Main.depth(50));
+        return;
+    }
+}
+"""
+# A condition holds only when it is -1, so none of these branches is taken
+NON_BOOLEAN_CONDITIONS = """
+class Main {
+    function void main() {
+        var int x, n, c;
+        let x = 4;
+        if (x & 4) { do Output.printInt(1); } else { do Output.printInt(2); }
+        if (x & 4) { do Output.printInt(3); }
+        let n = 3;
+        let c = 0;
+        while (n) { let n = n - 1; let c = c + 1; }
+        do Output.printInt(c);
+        if (x) { } else { do Output.printInt(7); }
+        return;
+    }
+}
+"""
+BOOLEAN_CONDITIONS = """
+class Main {
+    function void main() {
+        var int i, s;
+        let i = 0;
+        let s = 0;
+        while (~(i > 9) & (s < 100)) { let s = s + i; let i = i + 1; }
+        if ((i = 10) | false) { do Output.printInt(s); }
+        else { do Output.printInt(0); }
+        if (~(s = 0)) { do Output.printInt(1); }
+        return;
+    }
+}
+"""
+# Every operand multiplied and divided by constants, some of which are too
+# costly to reduce, with products that overflow
+CONSTANT_OPERANDS = """
+class Main {
+    function void show(int x) {
+        do Output.printInt(x);
+        do Output.printChar(32);
+        return;
+    }
+    function void main() {
+        var Array values;
+        var int i, x;
+        let values = Array.new(5);
+        let values[0] = 7;
+        let values[1] = -13;
+        let values[2] = 0;
+        let values[3] = 300;
+        let values[4] = -32767;
+        let i = 0;
+        while (i < 5) {
+            let x = values[i];
+            do Main.show(x * 0);
+            do Main.show(x * 3);
+            do Main.show(-5 * x);
+            do Main.show(x * 10);
+            do Main.show(x * 255);
+            do Main.show(x * -1);
+            do Main.show(x / 1);
+            do Main.show(x / -1);
+            do Main.show(x / 4);
+            let i = i + 1;
+        }
+        return;
+    }
+}
+"""
+CONSTANT_RESULTS = "0 21 -35 70 1785 -7 7 -7 1 " \
+                   "0 -39 65 -130 -3315 13 -13 13 -3 " \
+                   "0 0 0 0 0 0 0 0 0 " \
+                   "0 900 -1500 3000 10964 -300 300 -300 75 " \
+                   "0 -32765 32763 10 -32513 32767 -32767 32767 -8191 "
+
+
+class TestStrengthReduction(unittest.TestCase):
+
+    def run_profiled(self, optimizations):
+        emulator = VMEmulator(compile_classes({"Main": CONSTANT_OPERANDS},
+                                              optimizations))
+        emulator.run()
+        profile = emulator.get_profile()
+        return emulator.get_output(), profile["Math.multiply"][0], \
+            profile["Math.divide"][0]
+
+    def test_same_results_with_fewer_calls(self):
+        output, multiplies, divides = self.run_profiled(())
+        self.assertEqual(output, CONSTANT_RESULTS)
+        self.assertEqual((multiplies, divides), (30, 15))
+        output, multiplies, divides = self.run_profiled(
+            (OPT_STRENGTH_REDUCTION,))
+        self.assertEqual(output, CONSTANT_RESULTS)
+        self.assertLess(multiplies, 30)
+        self.assertEqual(divides, 10)
+        # Folded, -1 is a constant too
+        output, multiplies, divides = self.run_profiled(
+            STANDARD_OPTIMIZATIONS)
+        self.assertEqual(output, CONSTANT_RESULTS)
+        self.assertEqual(divides, 5)
+
+
+class TestArrayTracking(unittest.TestCase):
+
+    def test_call_then_array_read(self):
+        for optimizations in ((), (OPT_ARRAYS,), STANDARD_OPTIMIZATIONS):
+            self.assertEqual(run_program({"Main": CALL_THEN_ARRAY_READ},
+                                         optimizations), "5")
+
+    def test_array_shuffles(self):
+        program = {"Main": ARRAY_SHUFFLES}
+        self.assertEqual(run_program(program), "77 33 19 10 4 2 ")
+        self.assertEqual(run_program(program, (OPT_ARRAYS,)),
+                         "77 33 19 10 4 2 ")
+        plain = CompilationEngine("Main.jack", None, ARRAY_SHUFFLES)
+        plain.compile_class()
+        tracked = CompilationEngine("Main.jack", None, ARRAY_SHUFFLES,
+                                    (OPT_ARRAYS,))
+        tracked.compile_class()
+        self.assertLess(len(tracked.get_commands()),
+                        len(plain.get_commands()))
+        self.assertEqual(tracked.get_stats(),
+                         {OPT_ARRAYS + ".reused": 3,
+                          OPT_ARRAYS + ".direct-stores": 4})
+
+
+class TestTailCalls(unittest.TestCase):
+
+    def test_same_results(self):
+        program = {"Main": SELF_RECURSION % (100, 100)}
+        self.assertEqual(run_program(program), "21 5050 107 50")
+        self.assertEqual(run_program(program, (OPT_TAIL_CALLS,)),
+                         "21 5050 107 50")
+        engine = CompilationEngine("Main.jack", None,
+                                   SELF_RECURSION % (100, 100),
+                                   (OPT_TAIL_CALLS,))
+        engine.compile_class()
+        self.assertEqual(engine.get_stats(),
+                         {OPT_TAIL_CALLS + ".eliminated": 3})
+
+    def test_deep_recursion(self):
+        program = {"Main": SELF_RECURSION % (3000, 3000)}
+        with self.assertRaisesRegex(RuntimeError, "stack overflow"):
+            run_program(program)
+        self.assertEqual(run_program(program, (OPT_TAIL_CALLS,)),
+                         "21 -20484 3007 50")
+
+
+class TestBranchLayout(unittest.TestCase):
+
+    def test_non_boolean_conditions(self):
+        program = {"Main": NON_BOOLEAN_CONDITIONS}
+        self.assertEqual(run_program(program), "207")
+        self.assertEqual(run_program(program, (OPT_LAYOUT,)), "207")
+
+    def test_boolean_conditions(self):
+        program = {"Main": BOOLEAN_CONDITIONS}
+        self.assertEqual(run_program(program), "451")
+        self.assertEqual(run_program(program, (OPT_LAYOUT,)), "451")
+
+
+if __name__ == "__main__":
+    unittest.main()
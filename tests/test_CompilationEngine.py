@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+import helpers
+from CompilationEngine import CompilationEngine
+from ParseCache import ParseCache, CACHE_SUBDIR, TOKENS_SUFFIX
+
+SOURCE = """
+class Main {
+    function void main() {
+        do Output.printInt(6 * 7);
+        return;
+    }
+}
+"""
+
+
+class TestParseCache(unittest.TestCase):
+
+    def compile(self, cache):
+        engine = CompilationEngine("Main.jack", None, SOURCE,
+                                   parse_cache=cache)
+        engine.compile_class()
+        return engine
+
+    def test_cached_tree_needs_no_tokens(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ParseCache(directory, "test")
+            commands = self.compile(cache).get_commands()
+            parse_directory = os.path.join(directory, CACHE_SUBDIR)
+            for file_name in os.listdir(parse_directory):
+                if file_name.endswith(TOKENS_SUFFIX):
+                    os.remove(os.path.join(parse_directory, file_name))
+            engine = self.compile(cache)
+            self.assertEqual(engine.get_commands(), commands)
+            self.assertEqual(engine.get_timings()["tokenize"], 0.0)
+            self.assertFalse(any(file_name.endswith(TOKENS_SUFFIX)
+                                 for file_name in
+                                 os.listdir(parse_directory)))
+
+
+if __name__ == "__main__":
+    unittest.main()
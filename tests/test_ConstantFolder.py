@@ -0,0 +1,90 @@
+import unittest
+from helpers import run_program
+from CompilationEngine import CompilationEngine, OPT_CONSTANT_FOLDING
+from PassManager import PassManager
+
+# Jack evaluates operators left to right, without precedence, in 16 bits
+CONSTANT_EXPRESSIONS = """
+class Main {
+    function void show(int x) {
+        do Output.printInt(x);
+        do Output.printChar(32);
+        return;
+    }
+    function void main() {
+        var int x;
+        let x = 10;
+        do Main.show(1 + 2 * 3);
+        do Main.show(32767 + 1);
+        do Main.show(-7 / 2);
+        do Main.show(7 / -2);
+        do Main.show(~0);
+        do Main.show(-(-32767 - 1));
+        do Main.show((3 < 5) & (5 = 5));
+        do Main.show(x + 2 * 3);
+        do Main.show(2 * 3 + x);
+        do Main.show(-(x) + (4 | 1));
+        return;
+    }
+}
+"""
+CONSTANT_RESULTS = "9 -32768 -3 -3 -1 -32768 -1 36 16 -5 "
+
+
+class RecordingPass:
+    """
+    A pass that records the order passes run in.
+    """
+
+    def __init__(self, name, log):
+        self.name = name
+        self.log = log
+
+    def run(self, class_dec):
+        self.log.append((self.name, class_dec.name))
+
+    def get_stats(self):
+        return {"runs": len(self.log)}
+
+
+class TestConstantFolder(unittest.TestCase):
+
+    def compile(self, optimizations):
+        engine = CompilationEngine("Main.jack", None, CONSTANT_EXPRESSIONS,
+                                   optimizations)
+        engine.compile_class()
+        return engine
+
+    def test_same_results(self):
+        program = {"Main": CONSTANT_EXPRESSIONS}
+        self.assertEqual(run_program(program), CONSTANT_RESULTS)
+        self.assertEqual(run_program(program, (OPT_CONSTANT_FOLDING,)),
+                         CONSTANT_RESULTS)
+
+    def test_folds_constant_operators(self):
+        plain = self.compile(())
+        folded = self.compile((OPT_CONSTANT_FOLDING,))
+        self.assertLess(len(folded.get_commands()),
+                        len(plain.get_commands()))
+        self.assertEqual(plain.get_stats(), {})
+        self.assertEqual(folded.get_stats(),
+                         {OPT_CONSTANT_FOLDING + ".folded": 16})
+
+
+class TestPassManager(unittest.TestCase):
+
+    def test_runs_passes_in_order(self):
+        log = []
+        passes = PassManager()
+        passes.register("first", RecordingPass("first", log))
+        passes.register("second", RecordingPass("second", log))
+        class_dec = CompilationEngine("Main.jack", None,
+                                      CONSTANT_EXPRESSIONS).parse_class()
+        passes.run(class_dec)
+        self.assertEqual(log, [("first", "Main"), ("second", "Main")])
+        self.assertEqual(passes.get_stats(), {"first.runs": 2,
+                                              "second.runs": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
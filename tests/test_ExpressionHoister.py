@@ -0,0 +1,73 @@
+import unittest
+from helpers import compile_classes
+from VMEmulator import VMEmulator
+from CompilationEngine import CompilationEngine, OPT_HOISTING
+
+# An invariant product, a product whose variable the loop assigns, a
+# division by 0 in a loop that never runs, a product repeated in one
+# statement, and a product of a field that a call in the loop changes
+LOOPS = """
+class Main {
+    field int f;
+    constructor Main new() { let f = 1; return this; }
+    method void bump() { let f = f + 1; return; }
+    method int fields(int k) {
+        var int i, s;
+        let i = 0;
+        let s = 0;
+        while (i < 3) { let s = s + (k * f); do bump(); let i = i + 1; }
+        return s;
+    }
+    function void main() {
+        var Main m;
+        var int i, s, w, h, d, n;
+        let w = 7;
+        let h = 9;
+        let i = 0;
+        let s = 0;
+        while (i < 10) { let s = s + (w * h) + (i * 2); let i = i + 1; }
+        do Output.printInt(s);
+        do Output.printChar(32);
+        let i = 0;
+        while (i < 4) { let s = w * h; let w = w + 1; let i = i + 1; }
+        do Output.printInt(s);
+        do Output.printChar(32);
+        let d = 0;
+        let n = 0;
+        let i = 0;
+        while (i < n) { let s = s + (w / d); let i = i + 1; }
+        let s = (w * h) - (h * w) + (w * h);
+        do Output.printInt(s);
+        do Output.printChar(32);
+        let m = Main.new();
+        do Output.printInt(m.fields(5));
+        return;
+    }
+}
+"""
+OUTPUT = "720 90 99 30"
+
+
+class TestExpressionHoister(unittest.TestCase):
+
+    def run_counted(self, optimizations):
+        emulator = VMEmulator(compile_classes({"Main": LOOPS},
+                                              optimizations))
+        emulator.run()
+        return emulator.get_output(), \
+            emulator.get_profile()["Math.multiply"][0]
+
+    def test_same_results_with_fewer_multiplications(self):
+        self.assertEqual(self.run_counted(()), (OUTPUT, 30))
+        output, multiplications = self.run_counted((OPT_HOISTING,))
+        self.assertEqual(output, OUTPUT)
+        self.assertLess(multiplications, 30)
+        engine = CompilationEngine("Main.jack", None, LOOPS, (OPT_HOISTING,))
+        engine.compile_class()
+        self.assertEqual(engine.get_stats(),
+                         {OPT_HOISTING + ".hoisted": 1,
+                          OPT_HOISTING + ".reused": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,222 @@
+import io
+import os
+import tempfile
+import unittest
+import contextlib
+from helpers import run_program
+from JackCompiler import main
+
+OUTPUT_ADDRESS = 24000  # Where the library's Output.printChar writes
+MAX_STEPS = 10 ** 6
+CLASSES = {"Main": """
+class Main {
+    function void printNumber(int n) {
+        var int tens;
+        let tens = 0;
+        while (n > 9) { let n = n - 10; let tens = tens + 1; }
+        if (tens > 0) { do Main.printNumber(tens); }
+        do Output.printChar(48 + n);
+        return;
+    }
+    function int fib(int n) {
+        if (n < 2) { return n; }
+        return Main.fib(n - 1) + Main.fib(n - 2);
+    }
+    function void main() {
+        var Counter c;
+        var int i;
+        let c = Counter.new(3);
+        let i = 0;
+        while (i < 10) { do c.add(i); let i = i + 1; }
+        do Main.printNumber(c.get());
+        do Output.printChar(32);
+        do Main.printNumber(Main.fib(12));
+        do Output.printChar(32);
+        if (~(i = 10) | (c.get() < 0)) { do Output.printChar(78); }
+        else { do Output.printChar(89); }
+        do Main.printNumber(-5 & 7);
+        return;
+    }
+}
+""", "Counter": """
+class Counter {
+    field int count;
+    constructor Counter new(int start) { let count = start; return this; }
+    method void add(int n) { let count = count + n; return; }
+    method int get() { return count; }
+}
+"""}
+# The VM code of the OS subroutines the program calls
+LIBRARY = {"Output": """
+function Output.printChar 0
+push constant %d
+pop pointer 1
+push argument 0
+pop that 0
+push constant 0
+return
+""" % OUTPUT_ADDRESS, "Memory": """
+function Memory.alloc 1
+push static 0
+push constant 2048
+add
+pop local 0
+push static 0
+push argument 0
+add
+pop static 0
+push local 0
+return
+"""}
+PREDEFINED = dict([("SP", 0), ("LCL", 1), ("ARG", 2), ("THIS", 3),
+                   ("THAT", 4), ("SCREEN", 16384), ("KBD", 24576)] +
+                  [("R%d" % i, i) for i in range(16)])
+
+
+def assemble(lines):
+    """
+    :param lines: Hack assembly lines
+    :return: A list of the instructions, ("A", value) or ("C", dest, comp,
+    jump)
+    """
+    symbols = dict(PREDEFINED)
+    statements = []
+    for line in lines:
+        line = line.split("//", 1)[0].strip()
+        if line.startswith("("):
+            symbols[line[1:-1]] = len(statements)
+        elif line:
+            statements.append(line)
+    variable = 16
+    instructions = []
+    for statement in statements:
+        if not statement.startswith("@"):
+            dest, _, rest = statement.rpartition("=")
+            comp, _, jump = rest.partition(";")
+            instructions.append(("C", dest, comp, jump))
+        elif statement[1:].isdigit():
+            instructions.append(("A", int(statement[1:])))
+        else:
+            if statement[1:] not in symbols:
+                symbols[statement[1:]] = variable
+                variable += 1
+            instructions.append(("A", symbols[statement[1:]]))
+    return instructions
+
+
+def compute(comp, a, d, m):
+    """
+    :param comp: The comp part of a C-instruction
+    :return: Its value for the given registers
+    """
+    values = {"A": a, "D": d, "M": m, "0": 0, "1": 1}
+    if comp in values:
+        return values[comp]
+    if comp == "-1":
+        return -1
+    if comp[0] == "-":
+        return -values[comp[1:]]
+    if comp[0] == "!":
+        return ~values[comp[1:]]
+    for op in "+-&|":
+        if op in comp:
+            x, y = (values[operand] for operand in comp.split(op))
+            return {"+": x + y, "-": x - y, "&": x & y, "|": x | y}[op]
+    raise ValueError(comp)
+
+
+def run_hack(instructions):
+    """
+    Runs a Hack program until it loops on a single jump.
+    :param instructions: The program, as given by assemble
+    :return: The characters written to OUTPUT_ADDRESS
+    """
+    ram = [0] * 32768
+    a = d = pc = 0
+    output = []
+    for _ in range(MAX_STEPS):
+        instruction = instructions[pc]
+        if instruction[0] == "A":
+            a = instruction[1]
+            pc += 1
+            continue
+        _, dest, comp, jump = instruction
+        value = compute(comp, a, d, ram[a & 0x7FFF]) & 0xFFFF
+        signed = value - 0x10000 if value & 0x8000 else value
+        if "M" in dest:
+            ram[a] = value
+            if a == OUTPUT_ADDRESS:
+                output.append(chr(value))
+        if "D" in dest:
+            d = value
+        if "A" in dest:
+            a = value
+        if jump and {"JMP": True, "JEQ": signed == 0, "JNE": signed != 0,
+                     "JGT": signed > 0, "JGE": signed >= 0,
+                     "JLT": signed < 0, "JLE": signed <= 0}[jump]:
+            if a == pc - 1:
+                return "".join(output)
+            pc = a
+        else:
+            pc += 1
+    raise RuntimeError("the program did not halt")
+
+
+class TestHackTranslator(unittest.TestCase):
+
+    def build(self, directory, *options):
+        """
+        Translates the program in a directory to Hack assembly.
+        :param directory: A directory of .jack and .vm files
+        :param options: More command line options
+        :return: The exit status, the assembly lines, and the errors
+        """
+        path = os.path.join(directory, "out.asm")
+        errors = io.StringIO()
+        with contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(errors):
+            status = main([directory, "--asm", path, "--no-cache"] +
+                          list(options))
+        lines = []
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                lines = file.read().splitlines()
+        return status, lines, errors.getvalue()
+
+    def write_program(self, directory, library):
+        """
+        Writes the classes, and the library's VM code when asked to.
+        """
+        for name, source in CLASSES.items():
+            with open(os.path.join(directory, name + ".jack"), "w") as file:
+                file.write(source)
+        if library:
+            for name, code in LIBRARY.items():
+                with open(os.path.join(directory, name + ".vm"),
+                          "w") as file:
+                    file.write(code)
+
+    def test_matches_emulator(self):
+        expected = run_program(CLASSES)
+        self.assertEqual(expected, "48 144 Y3")
+        for options in ((), ("-O",), ("-O", "-W")):
+            with tempfile.TemporaryDirectory() as directory:
+                self.write_program(directory, True)
+                status, lines, errors = self.build(directory, *options)
+                self.assertEqual((status, errors), (0, ""))
+                self.assertEqual(run_hack(assemble(lines)), expected)
+
+    def test_unresolved_calls(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write_program(directory, False)
+            status, lines, errors = self.build(directory)
+        self.assertEqual(status, 1)
+        self.assertEqual(lines, [])
+        self.assertIn("Memory.alloc is not defined, called by Counter.new",
+                      errors)
+        self.assertIn("Output.printChar is not defined, called by "
+                      "Main.main, Main.printNumber", errors)
+
+
+if __name__ == "__main__":
+    unittest.main()
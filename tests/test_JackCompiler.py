@@ -0,0 +1,71 @@
+import io
+import os
+import tempfile
+import unittest
+import contextlib
+from helpers import run_program
+from JackCompiler import main
+
+MAIN = """
+class Main {
+    function void main() {
+        do Output.printInt(Helper.twice(21));
+        return;
+    }
+}
+"""
+HELPER = """
+class Helper {
+    function int twice(int n) { return n + n; }
+}
+"""
+# Helper.twice with another number of arguments than Main calls it with
+CHANGED_HELPER = """
+class Helper {
+    function int twice(int n, int m) { return n + m; }
+}
+"""
+
+
+class TestServedBuilds(unittest.TestCase):
+    """
+    Builds run through main with caches, as CompileServer runs them.
+    """
+
+    def write(self, directory, name, source):
+        with open(os.path.join(directory, name + ".jack"), "w") as file:
+            file.write(source)
+
+    def build(self, directory, caches):
+        errors = io.StringIO()
+        with contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(errors):
+            status = main([directory, "--no-cache"], caches)
+        return status, errors.getvalue()
+
+    def test_rescans_changed_sources_only(self):
+        self.assertEqual(run_program({"Main": MAIN, "Helper": HELPER}), "42")
+        caches = {}
+        with tempfile.TemporaryDirectory() as directory:
+            self.write(directory, "Main", MAIN)
+            self.write(directory, "Helper", HELPER)
+            self.assertEqual(self.build(directory, caches), (0, ""))
+            scans = caches[("scans", os.path.abspath(directory))]
+            main_path = os.path.join(directory, "Main.jack")
+            helper_path = os.path.join(directory, "Helper.jack")
+            self.assertEqual(sorted(scans), sorted([main_path, helper_path]))
+            main_scan = scans[main_path]
+            helper_scan = scans[helper_path]
+            self.write(directory, "Helper", CHANGED_HELPER)
+            status, errors = self.build(directory, caches)
+            self.assertEqual(status, 1)
+            self.assertIn("Helper.twice expects 2 arguments, got 1", errors)
+            self.assertIs(scans[main_path], main_scan)
+            self.assertIsNot(scans[helper_path], helper_scan)
+            os.remove(helper_path)
+            self.assertEqual(self.build(directory, caches)[0], 0)
+            self.assertEqual(list(scans), [main_path])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from array import array
+import helpers
+from JackTokenizer import JackTokenizer, CACHE_HEADER, CACHE_MAGIC
+
+SOURCE = "class Main { }"
+
+
+class TokenStore:
+    """
+    Stands in for a ParseCache, holding the serialized tokens of one file.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def load_tokens(self, source, text):
+        return self.data
+
+    def store_tokens(self, source, text, data):
+        self.data = data
+
+
+class TestTokenCache(unittest.TestCase):
+
+    def test_round_trip(self):
+        store = TokenStore(None)
+        JackTokenizer("Main.jack", SOURCE, store)
+        tokenizer = JackTokenizer("Main.jack", "", store)
+        self.assertEqual(tokenizer.count_tokens(), 4)
+        tokenizer.advance()
+        self.assertEqual(tokenizer.keyword(), "class")
+
+    def test_short_arrays_are_a_miss(self):
+        # Three types and positions, but only two indexes into the table
+        data = b"".join((CACHE_HEADER.pack(CACHE_MAGIC, 3, 1),
+                         array("B", [1, 1, 1]).tobytes(),
+                         array("I", [0, 1, 2]).tobytes(),
+                         array("I", [0, 0]).tobytes()))
+        store = TokenStore(data)
+        tokenizer = JackTokenizer("Main.jack", SOURCE, store)
+        self.assertEqual(tokenizer.count_tokens(), 4)
+        self.assertNotEqual(store.data, data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+from helpers import run_program
+from PeepholeOptimizer import PeepholeOptimizer
+from CompilationEngine import STANDARD_OPTIMIZATIONS, OPT_PEEPHOLE
+
+FUNCTION = ("function", "Main.f", 0)
+# Each rule's case: the body of a function, its optimized body, and the
+# hits of every rule that applied
+RULE_CASES = {
+    "push-pop-same": (
+        [("push", "local", 0), ("pop", "local", 0),
+         ("push", "constant", 0), ("return",)],
+        [("push", "constant", 0), ("return",)],
+        {"push-pop-same": 1}),
+    "store-array-directly": (
+        [("push", "local", 0), ("push", "local", 1), ("add",),
+         ("push", "argument", 0), ("pop", "temp", 0), ("pop", "pointer", 1),
+         ("push", "temp", 0), ("pop", "that", 0), ("push", "constant", 0),
+         ("return",)],
+        [("push", "local", 0), ("push", "local", 1), ("add",),
+         ("pop", "pointer", 1), ("push", "argument", 0), ("pop", "that", 0),
+         ("push", "constant", 0), ("return",)],
+        {"store-array-directly": 1}),
+    "drop-dead-temp": (
+        [("push", "local", 0), ("pop", "temp", 1), ("push", "constant", 0),
+         ("return",)],
+        [("push", "constant", 0), ("return",)],
+        {"drop-dead-temp": 1}),
+    "reload-dead-temp": (
+        [("push", "local", 0), ("push", "local", 1), ("add",),
+         ("pop", "temp", 0), ("push", "temp", 0), ("return",)],
+        [("push", "local", 0), ("push", "local", 1), ("add",), ("return",)],
+        {"reload-dead-temp": 1}),
+    "double-negation": (
+        [("push", "local", 0), ("not",), ("not",), ("return",)],
+        [("push", "local", 0), ("return",)],
+        {"double-negation": 1}),
+    "constant-branch": (
+        [("push", "constant", 0), ("if-goto", "L"), ("push", "constant", 1),
+         ("return",), ("label", "L"), ("push", "constant", 2), ("return",)],
+        [("push", "constant", 1), ("return",)],
+        {"constant-branch": 1, "unreachable-code": 1, "unused-label": 1}),
+    "invert-branch": (
+        [("push", "local", 0), ("push", "local", 1), ("lt",),
+         ("if-goto", "A"), ("goto", "B"), ("label", "A"),
+         ("push", "constant", 1), ("return",), ("label", "B"),
+         ("push", "constant", 2), ("return",)],
+        [("push", "local", 0), ("push", "local", 1), ("lt",), ("not",),
+         ("if-goto", "B"), ("push", "constant", 1), ("return",),
+         ("label", "B"), ("push", "constant", 2), ("return",)],
+        {"invert-branch": 1, "unused-label": 1}),
+    "jump-to-next": (
+        [("goto", "L"), ("label", "L"), ("push", "constant", 0),
+         ("return",)],
+        [("push", "constant", 0), ("return",)],
+        {"jump-to-next": 1, "unused-label": 1}),
+    "thread-jump": (
+        [("push", "local", 0), ("if-goto", "L"), ("push", "constant", 1),
+         ("return",), ("label", "L"), ("goto", "M"), ("label", "M"),
+         ("push", "constant", 2), ("return",)],
+        [("push", "local", 0), ("if-goto", "M"), ("push", "constant", 1),
+         ("return",), ("label", "M"), ("push", "constant", 2), ("return",)],
+        {"thread-jump": 1, "jump-to-next": 1, "unused-label": 1}),
+    "unreachable-code": (
+        [("push", "constant", 0), ("return",), ("push", "constant", 1),
+         ("return",)],
+        [("push", "constant", 0), ("return",)],
+        {"unreachable-code": 1}),
+    "unused-label": (
+        [("label", "X"), ("push", "constant", 0), ("return",)],
+        [("push", "constant", 0), ("return",)],
+        {"unused-label": 1}),
+}
+# The value of x is neither true nor false, so negating it does not invert
+# the if-goto
+NON_BOOLEAN_BRANCH = """
+class Main {
+    function void main() {
+        var int x;
+        let x = 4;
+        if (x) { do Output.printInt(2); } else { do Output.printInt(7); }
+        if (x) { } else { do Output.printInt(0); }
+        return;
+    }
+}
+"""
+
+
+class TestPeepholeRules(unittest.TestCase):
+
+    def optimize(self, body):
+        """
+        :param body: The commands of a function's body
+        :return: The optimized body and the hits of the rules that applied
+        """
+        optimizer = PeepholeOptimizer()
+        optimized = optimizer.optimize([FUNCTION] + body)
+        self.assertEqual(optimized[0], FUNCTION)
+        return optimized[1:], {rule: hits for rule, hits in
+                               optimizer.get_hits().items() if hits}
+
+    def test_rules(self):
+        self.assertEqual(set(RULE_CASES), set(PeepholeOptimizer.RULES))
+        for rule, (body, expected, hits) in RULE_CASES.items():
+            with self.subTest(rule=rule):
+                self.assertEqual(self.optimize(body), (expected, hits))
+
+    def test_invert_negated_branch(self):
+        body = [("push", "local", 0), ("push", "local", 1), ("gt",),
+                ("not",), ("if-goto", "A"), ("goto", "B"), ("label", "A"),
+                ("return",), ("label", "B"), ("return",)]
+        self.assertEqual(self.optimize(body), (
+            [("push", "local", 0), ("push", "local", 1), ("gt",),
+             ("if-goto", "B"), ("return",), ("label", "B"), ("return",)],
+            {"invert-branch": 1, "unused-label": 1}))
+
+    def test_keep_non_boolean_branch(self):
+        body = [("push", "local", 0), ("if-goto", "A"), ("goto", "B"),
+                ("label", "A"), ("return",), ("label", "B"), ("return",)]
+        self.assertEqual(self.optimize(body), (body, {}))
+        negated = [("push", "local", 0), ("not",)] + body[1:]
+        self.assertEqual(self.optimize(negated), (negated, {}))
+
+    def test_hits_accumulate(self):
+        optimizer = PeepholeOptimizer()
+        body = RULE_CASES["double-negation"][0]
+        optimizer.optimize([FUNCTION] + body)
+        optimizer.optimize([FUNCTION] + body)
+        self.assertEqual(optimizer.get_hits()["double-negation"], 2)
+
+    def test_non_boolean_branch_program(self):
+        program = {"Main": NON_BOOLEAN_BRANCH}
+        self.assertEqual(run_program(program), "70")
+        for optimizations in ((OPT_PEEPHOLE,), STANDARD_OPTIMIZATIONS):
+            self.assertEqual(run_program(program, optimizations), "70")
+
+
+if __name__ == "__main__":
+    unittest.main()
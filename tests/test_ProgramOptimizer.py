@@ -0,0 +1,118 @@
+import unittest
+from helpers import compile_classes, run_commands
+from ProgramOptimizer import ProgramOptimizer
+from PeepholeOptimizer import PeepholeOptimizer
+from VMEmulator import VMEmulator
+from CompilationEngine import STANDARD_OPTIMIZATIONS
+
+CLASSES = {"Main": """
+class Main {
+    function void main() {
+        var Point p, q;
+        var int i, s;
+        let p = Point.new(3, 4);
+        let q = Point.new(-1, 2);
+        let i = 0;
+        let s = 0;
+        while (i < 10) {
+            let s = s + p.getX() + Point.twice(q.getY());
+            do Counter.tick();
+            let i = i + 1;
+        }
+        do Output.printInt(s);
+        do Output.printChar(32);
+        do Output.printInt(Counter.count());
+        return;
+    }
+    function void unused() { do Main.alsoUnused(); return; }
+    function void alsoUnused() { do Main.unused(); return; }
+}
+""", "Point": """
+class Point {
+    field int x, y;
+    constructor Point new(int ax, int ay) {
+        let x = ax;
+        let y = ay;
+        return this;
+    }
+    method int getX() { return x; }
+    method int getY() { return y; }
+    method int distance(Point other) {
+        return Math.abs(x - other.getX()) + Math.abs(y - other.getY());
+    }
+    function int twice(int n) { return n + n; }
+}
+""", "Counter": """
+class Counter {
+    static int ticks;
+    function void tick() { let ticks = ticks + 1; return; }
+    function int count() { return ticks; }
+}
+"""}
+OUTPUT = "70 10"
+
+
+def run_profiled(program):
+    """
+    :param program: A dictionary from file names to VM command records
+    :return: The text the program prints, and the number of calls to
+    every function
+    """
+    emulator = VMEmulator(program)
+    emulator.run()
+    return emulator.get_output(), {name: counters[0] for name, counters
+                                   in emulator.get_profile().items()}
+
+
+class TestDeadFunctions(unittest.TestCase):
+
+    def test_removes_unreachable_functions(self):
+        for optimizations in ((), STANDARD_OPTIMIZATIONS):
+            program = compile_classes(CLASSES, optimizations)
+            self.assertEqual(run_commands(program), OUTPUT)
+            optimizer = ProgramOptimizer(program)
+            removed = optimizer.eliminate_dead_functions()
+            self.assertEqual([name for name, size in removed],
+                             ["Main.alsoUnused", "Main.unused",
+                              "Point.distance"])
+            self.assertTrue(all(size > 0 for name, size in removed))
+            self.assertNotIn("Point.distance", optimizer.get_functions())
+            self.assertEqual(run_commands(program), OUTPUT)
+
+    def test_keeps_programs_without_entry(self):
+        program = compile_classes({"Point": CLASSES["Point"]})
+        optimizer = ProgramOptimizer(program)
+        self.assertEqual(optimizer.eliminate_dead_functions(), [])
+        self.assertIn("Point.distance", optimizer.get_functions())
+
+
+class TestInlining(unittest.TestCase):
+
+    def test_inlines_small_functions(self):
+        for optimizations in ((), STANDARD_OPTIMIZATIONS):
+            program = compile_classes(CLASSES, optimizations)
+            output, calls = run_profiled(program)
+            self.assertEqual(output, OUTPUT)
+            self.assertEqual(calls["Point.getX"], 10)
+            peephole = PeepholeOptimizer() if optimizations else None
+            inlined = ProgramOptimizer(program).inline_functions(
+                optimizer=peephole)
+            self.assertEqual(inlined["Point.getX"], 2)
+            self.assertEqual(inlined["Point.twice"], 1)
+            output, calls = run_profiled(program)
+            self.assertEqual(output, OUTPUT)
+            self.assertNotIn("Point.getX", calls)
+            self.assertNotIn("Point.twice", calls)
+
+    def test_keeps_static_accesses_in_their_class(self):
+        program = compile_classes(CLASSES)
+        inlined = ProgramOptimizer(program).inline_functions()
+        self.assertNotIn("Counter.tick", inlined)
+        self.assertNotIn("Counter.count", inlined)
+        output, calls = run_profiled(program)
+        self.assertEqual(output, OUTPUT)
+        self.assertEqual(calls["Counter.tick"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
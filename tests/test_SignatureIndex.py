@@ -0,0 +1,76 @@
+import unittest
+from helpers import run_commands
+from JackCompiler import compile_source_commands
+from JackTokenizer import JackTokenizer
+from SignatureIndex import SignatureIndex, scan_class
+
+POINT = """
+class Point {
+    field int x;
+    constructor Point new(int ax) { let x = ax; return this; }
+    method int getX() { return x; }
+    method int plus(int n) { return getX() + n; }
+    function int twice(int n) { return n + n; }
+}
+"""
+MAIN = """
+class Main {
+    function void main() {
+        var Point p;
+        let p = Point.new(5);
+        do Output.printInt(p.plus(Point.twice(%s)));
+        return;
+    }
+}
+"""
+# Calls that do not match Point's declarations, and the errors they give
+BAD_CALLS = [("p.getX(1)", "Point.getX expects 0 arguments, got 1"),
+             ("Point.twice(1, 2)", "Point.twice expects 1 argument, got 2"),
+             ("Point.getX()", "method Point.getX is called without an "
+                              "object"),
+             ("p.twice(1)", "Point.twice is a function, not a method"),
+             ("Point.half(1)", "Point has no subroutine half")]
+
+
+def index_classes(classes):
+    """
+    :param classes: A dictionary from class names to their Jack sources
+    :return: A SignatureIndex of the classes
+    """
+    index = SignatureIndex()
+    for name, source in classes.items():
+        class_name, subroutines, references = scan_class(
+            JackTokenizer(name + ".jack", source))
+        index.add_class(class_name, subroutines)
+    return index
+
+
+class TestSignatureChecks(unittest.TestCase):
+
+    def compile(self, classes, signatures):
+        return {name + ".jack": compile_source_commands(
+            source, name + ".jack", signatures=signatures)
+            for name, source in classes.items()}
+
+    def test_valid_calls_compile_alike(self):
+        classes = {"Main": MAIN % "1", "Point": POINT}
+        plain = self.compile(classes, None)
+        checked = self.compile(classes, index_classes(classes))
+        self.assertEqual(checked, plain)
+        self.assertEqual(run_commands(checked), "7")
+
+    def test_mismatched_calls(self):
+        for argument, message in BAD_CALLS:
+            with self.subTest(argument=argument):
+                classes = {"Main": MAIN % argument, "Point": POINT}
+                self.compile(classes, None)
+                with self.assertRaisesRegex(SyntaxError, message):
+                    self.compile(classes, index_classes(classes))
+
+    def test_unknown_classes_are_not_checked(self):
+        classes = {"Main": MAIN % "Other.f(1, 2)", "Point": POINT}
+        self.compile(classes, index_classes(classes))
+
+
+if __name__ == "__main__":
+    unittest.main()
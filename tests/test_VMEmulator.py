@@ -0,0 +1,47 @@
+import unittest
+from helpers import compile_classes, run_program
+from VMEmulator import VMEmulator
+
+# Recursion without a base case grows the stack until it meets the heap
+UNBOUNDED_RECURSION = """
+class Main {
+    function int down(int n) { return Main.down(n + 1) + 1; }
+    function void main() {
+        var Array a;
+        let a = Array.new(1);
+        let a[0] = 7;
+        do Output.printInt(Main.down(0));
+        return;
+    }
+}
+"""
+SCREEN_CALLS = """
+class Main {
+    function void main() {
+        do Screen.clearScreen();
+        do Screen.setColor(true);
+        do Screen.drawPixel(1, 2);
+        do Screen.drawLine(0, 0, 10, 10);
+        do Screen.drawRectangle(0, 0, 10, 10);
+        do Screen.drawCircle(20, 20, 5);
+        do Output.printInt(1);
+        return;
+    }
+}
+"""
+
+
+class TestVMEmulator(unittest.TestCase):
+
+    def test_stack_overflow(self):
+        emulator = VMEmulator(compile_classes({"Main": UNBOUNDED_RECURSION}))
+        with self.assertRaisesRegex(RuntimeError,
+                                    "stack overflow in Main.down"):
+            emulator.run()
+
+    def test_screen_calls_do_nothing(self):
+        self.assertEqual(run_program({"Main": SCREEN_CALLS}), "1")
+
+
+if __name__ == "__main__":
+    unittest.main()